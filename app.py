@@ -1,12 +1,27 @@
-from flask import Flask
+from flask import Flask, Response, jsonify
+import multiprocessing
 from threading import Thread
 
 from mongodb_generic_mirroring import mirror
+from conversion_log import get_conversion_log_stats
+from file_utils import get_state_cache_stats
+from flush_policy import get_flush_policy_stats
+from listening import get_change_coalescing_stats
+from metrics import register_stats, render_metrics
+from push_file_to_lz import get_access_token_cache_stats
+from sync_status import get_sync_status
 
 
 def create_app():
     app = Flask(__name__)
-    thread_name=Thread(target=mirror).start()
+    # transform worker processes (INIT_SYNC_TRANSFORM_PROCESSES) import this module too
+    if multiprocessing.parent_process() is None:
+        thread_name=Thread(target=mirror).start()
+    register_stats("lz_token_cache", "AAD access token cache", get_access_token_cache_stats)
+    register_stats("state_cache", "State file cache", get_state_cache_stats)
+    register_stats("change_coalescing", "Change events coalesced per _id", get_change_coalescing_stats)
+    register_stats("flush_policy", "Adaptive flush policy", get_flush_policy_stats, "collection")
+    register_stats("conversion_log", "Value conversion failures", get_conversion_log_stats, "collection")
     
     @app.route("/")
     def home_page():
@@ -14,6 +29,14 @@ def create_app():
         for thread in threading.enumerate(): 
             print(thread.name)
         return "The MongoDB Fabric Mirroring Service is running..."
+
+    @app.route("/metrics")
+    def metrics_page():
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+    @app.route("/status")
+    def status_page():
+        return jsonify(get_sync_status())
         
     return app
 
@@ -0,0 +1,138 @@
+"""Decode MongoDB batches into pyarrow-backed DataFrames using the internal schema."""
+
+from datetime import datetime
+import itertools
+import logging
+import struct
+
+import bson
+import pandas as pd
+import pyarrow as pa
+
+import schemas
+from constants import TYPE_KEY
+
+logger = logging.getLogger(__name__)
+
+# internal schema TYPE_KEY -> Arrow type; only values that process_dataframe would keep
+# as-is are decoded by Arrow, anything else (ObjectId, dict, list, Decimal128, mixed
+# types) stays an object column for the converters
+SCHEMA_TYPE_TO_ARROW = {
+    int: pa.int64(),
+    float: pa.float64(),
+    bool: pa.bool_(),
+    str: pa.string(),
+    datetime: pa.timestamp("ms"),
+}
+# Arrow type -> pandas infer_dtype() of the values it holds without loss
+ARROW_TYPE_TO_INFERRED_DTYPE = {
+    pa.int64(): "integer",
+    pa.float64(): "floating",
+    pa.bool_(): "boolean",
+    pa.string(): "string",
+    pa.timestamp("ms"): "datetime",
+}
+
+
+def decode_raw_batches(raw_batches) -> tuple[list[dict], int]:
+    """
+    Decode the raw BSON batches of a find_raw_batches() cursor with the C decoder.
+
+    Returns the documents and the number of BSON bytes read.
+    """
+    documents = []
+    bson_bytes = 0
+    for raw_batch in raw_batches:
+        bson_bytes += len(raw_batch)
+        documents.extend(bson.decode_all(raw_batch))
+    return documents, bson_bytes
+
+
+def read_raw_batches(raw_batches) -> tuple[bytes, int, dict | None, dict | None]:
+    """
+    Concatenate the raw BSON batches of a find_raw_batches() cursor without decoding
+    them, for a transform worker process.
+
+    Returns the BSON bytes, the number of documents and the first and last document.
+    """
+    raw_bson = b"".join(raw_batches)
+    count = 0
+    offset = 0
+    last_offset = 0
+    # every BSON document starts with its int32 little-endian length
+    while offset < len(raw_bson):
+        last_offset = offset
+        offset += struct.unpack_from("<i", raw_bson, offset)[0]
+        count += 1
+    if not count:
+        return raw_bson, 0, None, None
+    first_document = bson.decode(raw_bson[:struct.unpack_from("<i", raw_bson, 0)[0]])
+    last_document = bson.decode(raw_bson[last_offset:])
+    return raw_bson, count, first_document, last_document
+
+
+def documents_to_dataframe(table_name: str, documents: list[dict]) -> pd.DataFrame:
+    """
+    Build a DataFrame column by column from decoded documents.
+
+    Columns of the Arrow schema of the table (schema type int/float/bool/str/datetime)
+    whose values Arrow decodes as exactly that type are pyarrow-backed Series; every
+    other column, including _id, is an object column, the same as
+    pd.DataFrame(documents) would produce.
+    """
+    # same column order as pd.DataFrame(documents): first appearance across documents,
+    # which is the order of the first document when it has every column
+    all_column_names = set().union(*documents)
+    if documents and len(documents[0]) == len(all_column_names):
+        column_names = list(documents[0])
+    else:
+        column_names = list(dict.fromkeys(itertools.chain.from_iterable(documents)))
+    arrow_schema = _get_arrow_schema(table_name, column_names)
+    columns = {}
+    for col_name in column_names:
+        values = [document.get(col_name) for document in documents]
+        series = None
+        field_index = arrow_schema.get_field_index(col_name)
+        if field_index != -1:
+            series = _to_arrow_series(col_name, values, arrow_schema.field(field_index).type)
+        if series is None:
+            series = pd.Series(values, dtype=object)
+        columns[col_name] = series
+    # the Series are new, no need to copy them into the frame
+    return pd.DataFrame(columns, copy=False)
+
+
+def _get_arrow_schema(table_name: str, column_names: list) -> pa.Schema:
+    """Arrow schema of the columns whose internal schema type Arrow can decode, _id excluded."""
+    fields = []
+    for col_name in column_names:
+        if col_name == "_id":
+            continue
+        arrow_type = SCHEMA_TYPE_TO_ARROW.get(_get_schema_type(table_name, col_name))
+        if arrow_type is not None:
+            fields.append(pa.field(col_name, arrow_type))
+    return pa.schema(fields)
+
+
+def _get_schema_type(table_name: str, col_name: str):
+    processed_col_name = schemas.find_column_renaming(table_name, col_name) or col_name
+    schema_of_this_column = schemas.get_table_column_schema(table_name, processed_col_name)
+    if not schema_of_this_column:
+        return None
+    return schema_of_this_column.get(TYPE_KEY)
+
+
+def _to_arrow_series(col_name: str, values: list, arrow_type: pa.DataType) -> pd.Series | None:
+    # one pass in C over the values; Arrow alone would coerce values the converters treat
+    # differently, e.g. 1.5 to an int64 or True to a double
+    if pd.api.types.infer_dtype(values, skipna=True) not in (
+        ARROW_TYPE_TO_INFERRED_DTYPE[arrow_type],
+        "empty",
+    ):
+        return None
+    try:
+        array = pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError) as e:
+        logger.debug(f"Arrow decoding of column {col_name} failed, using objects: {e}")
+        return None
+    return pd.Series(array, dtype=pd.ArrowDtype(arrow_type))
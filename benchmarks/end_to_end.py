@@ -0,0 +1,251 @@
+"""
+End-to-end throughput of init sync and the change stream listener, without Atlas or Fabric.
+
+Runs init_sync and listening in-process against a local mongod replica set (change
+streams need one) and benchmarks/local_onelake.py standing in for OneLake and AAD, on
+synthetic collections (benchmarks/synthetic.py). Every profile runs in its own process,
+so peak RSS and the module level caches are per profile. Reports docs/s, MB/s, peak RSS
+and per-stage timings, e.g.:
+
+    mongod --replSet rs0 --dbpath /tmp/rs0 &
+    mongosh --eval "rs.initiate()"
+    python benchmarks/end_to_end.py --docs 200000 --changes 20000 --json results.json
+    python benchmarks/end_to_end.py --baseline results.json   # exit code 1 on a regression
+
+--record / --fixture save and replay the generated documents as BSON files, so runs
+compare on identical data.
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic  # noqa: E402
+from local_onelake import LocalOneLake  # noqa: E402
+
+RESULT_PREFIX = "RESULT "
+STAGES = ("read", "transform", "write", "push")
+# results compared against --baseline, higher is better
+BASELINE_KEYS = ("init_docs_per_sec", "delta_changes_per_sec")
+
+
+def run_profile(args) -> dict:
+    """Load, init sync and stream one profile; runs in the child process."""
+    lake_root = tempfile.mkdtemp(prefix="local_onelake_")
+    lake = LocalOneLake(lake_root, drain_delay_sec=args.drain_delay_sec).start()
+    collection_name = f"bench_{args.profile}"
+    os.environ.update(
+        MONGO_CONN_STR=args.mongo_uri,
+        MONGO_DB_NAME=args.db,
+        LZ_URL=lake.lz_url,
+        AAD_AUTHORITY_HOST=lake.url,
+        APP_ID="bench",
+        SECRET="bench",
+        TENANT_ID="bench",
+        INIT_LOAD_BATCH_SIZE=str(args.init_batch_size),
+        DELTA_SYNC_BATCH_SIZE=str(args.delta_batch_size),
+        TIME_THRESHOLD_IN_SEC="1",
+    )
+    if args.target_latency_sec:
+        # also polls the change stream often enough to notice the end of the workload
+        os.environ["DELTA_SYNC_TARGET_LATENCY_SEC"] = str(args.target_latency_sec)
+
+    # imported once the environment points at the stand-ins
+    import pymongo
+    from init_sync import init_sync
+    from listening import listening
+    from metrics import STAGE_DURATION
+    from schema_utils import init_table_schema
+    import sync_status
+    from utils import get_table_dir
+
+    client = pymongo.MongoClient(args.mongo_uri)
+    collection = client[args.db][collection_name]
+    collection.drop()
+    shutil.rmtree(get_table_dir(collection_name), ignore_errors=True)
+    if args.fixture:
+        documents = synthetic.read_fixture(args.fixture)
+    else:
+        documents = synthetic.generate_documents(args.profile, args.docs, args.seed)
+    if args.record:
+        synthetic.write_fixture(args.record, documents)
+        documents = synthetic.read_fixture(args.record)
+    doc_count = synthetic.load_collection(collection, documents)
+    source_bytes = next(
+        collection.aggregate([{"$collStats": {"storageStats": {}}}])
+    )["storageStats"]["size"]
+
+    result = {"profile": args.profile, "docs": doc_count, "source_mb": source_bytes / 2**20}
+    try:
+        init_table_schema(collection_name)
+        uploaded_before = lake.get_stats()["bytes_received"]
+        start_time = time.perf_counter()
+        init_sync(collection_name)
+        init_sec = time.perf_counter() - start_time
+        result.update(
+            init_sec=init_sec,
+            init_docs_per_sec=doc_count / init_sec,
+            init_source_mb_per_sec=source_bytes / 2**20 / init_sec,
+            init_uploaded_mb=(lake.get_stats()["bytes_received"] - uploaded_before) / 2**20,
+            init_files=lake.get_stats()["files_published"],
+            init_stage_sec=__stage_seconds(STAGE_DURATION, collection_name, "init"),
+            init_peak_rss_mb=__peak_rss_mb(),
+        )
+
+        if args.changes:
+            threading.Thread(
+                target=listening, args=(collection_name,), name="bench_listening", daemon=True
+            ).start()
+            files_before = lake.get_stats()["files_published"]
+            uploaded_before = lake.get_stats()["bytes_received"]
+            start_time = time.perf_counter()
+            last_operation_time = synthetic.apply_changes(
+                collection, args.profile, args.changes, args.seed
+            )
+            write_sec = time.perf_counter() - start_time
+            deadline = time.time() + args.timeout_sec
+            while True:
+                published = sync_status.get_last_published_cluster_time(collection_name)
+                if published is not None and published >= last_operation_time:
+                    break
+                if time.time() >= deadline:
+                    raise TimeoutError(
+                        f"changes of {collection_name} not in the landing zone after {args.timeout_sec}s"
+                    )
+                time.sleep(0.05)
+            delta_sec = time.perf_counter() - start_time
+            result.update(
+                delta_changes=args.changes,
+                delta_sec=delta_sec,
+                delta_changes_per_sec=args.changes / delta_sec,
+                delta_catch_up_sec=delta_sec - write_sec,
+                delta_uploaded_mb=(lake.get_stats()["bytes_received"] - uploaded_before) / 2**20,
+                delta_files=lake.get_stats()["files_published"] - files_before,
+                delta_stage_sec=__stage_seconds(STAGE_DURATION, collection_name, "delta"),
+            )
+        result.update(peak_rss_mb=__peak_rss_mb(), lz_requests=lake.get_stats()["requests"])
+    finally:
+        lake.stop()
+        shutil.rmtree(lake_root, ignore_errors=True)
+        shutil.rmtree(get_table_dir(collection_name), ignore_errors=True)
+        if not args.keep:
+            collection.drop()
+    return result
+
+
+def __stage_seconds(stage_duration, collection_name: str, sync: str) -> dict:
+    """Total seconds per stage, from the stage_duration_seconds histogram sums."""
+    with stage_duration.lock:
+        values = {key: counts[-1] for key, counts in stage_duration.values.items()}
+    return {
+        stage: values.get((collection_name, sync, stage), 0.0)
+        for stage in STAGES
+    }
+
+
+def __peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def __print_report(results: list[dict]):
+    print(
+        f"{'profile':<10} {'docs':>9} {'init s':>8} {'docs/s':>9} {'MB/s':>7} {'up MB':>8} "
+        f"{'changes':>8} {'chg/s':>8} {'lag s':>6} {'RSS MB':>7}"
+    )
+    for result in results:
+        print(
+            f"{result['profile']:<10} {result['docs']:>9} {result['init_sec']:>8.1f} "
+            f"{result['init_docs_per_sec']:>9.0f} {result['init_source_mb_per_sec']:>7.1f} "
+            f"{result['init_uploaded_mb']:>8.1f} {result.get('delta_changes', 0):>8} "
+            f"{result.get('delta_changes_per_sec', 0):>8.0f} {result.get('delta_catch_up_sec', 0):>6.1f} "
+            f"{result['peak_rss_mb']:>7.0f}"
+        )
+    print("\nseconds per stage (init sync | change stream)")
+    for result in results:
+        init_stages = " ".join(f"{stage}={seconds:.1f}" for stage, seconds in result["init_stage_sec"].items())
+        delta_stages = " ".join(
+            f"{stage}={seconds:.1f}" for stage, seconds in result.get("delta_stage_sec", {}).items()
+        )
+        print(f"{result['profile']:<10} {init_stages} | {delta_stages}")
+
+
+def __find_regressions(results: list[dict], baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["profile"])
+        if not previous:
+            continue
+        for key in BASELINE_KEYS:
+            if key in result and key in previous and result[key] < previous[key] * (1 - tolerance):
+                regressions.append(
+                    f"{result['profile']}: {key} {result[key]:.0f} < baseline {previous[key]:.0f}"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/?directConnection=true")
+    parser.add_argument("--db", default="fabric_mirroring_bench")
+    parser.add_argument("--profiles", nargs="+", default=list(synthetic.PROFILES), choices=list(synthetic.PROFILES))
+    parser.add_argument("--docs", type=int, default=100_000)
+    parser.add_argument("--changes", type=int, default=10_000, help="writes after init sync, 0 skips the listener")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--init-batch-size", type=int, default=100_000)
+    parser.add_argument("--delta-batch-size", type=int, default=10_000)
+    parser.add_argument("--target-latency-sec", type=int, default=5, help="DELTA_SYNC_TARGET_LATENCY_SEC, 0 for the fixed policy")
+    parser.add_argument("--drain-delay-sec", type=float, default=0.0, help="seconds the simulated Fabric takes per file")
+    parser.add_argument("--timeout-sec", type=int, default=600)
+    parser.add_argument("--fixture", help="replay this BSON file instead of generating documents (one profile)")
+    parser.add_argument("--record", help="save the generated documents to this BSON file (one profile)")
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark collections")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline")
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--profile", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    if args.profile:
+        # child process: one profile, result as the last line
+        print(RESULT_PREFIX + json.dumps(run_profile(args)), flush=True)
+        return
+
+    results = []
+    for profile in args.profiles:
+        command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--profile", profile]
+        completed = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+        lines = [line for line in completed.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+        if completed.returncode or not lines:
+            sys.exit(f"benchmark of profile {profile} failed (exit code {completed.returncode})")
+        results.append(json.loads(lines[-1][len(RESULT_PREFIX):]))
+    __print_report(results)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({result["profile"]: result for result in results}, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = __find_regressions(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
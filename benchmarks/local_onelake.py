@@ -0,0 +1,260 @@
+"""
+Local stand-in for the OneLake landing zone (ADLS Gen2 DFS) and the AAD token endpoint.
+
+Serves the requests push_file_to_lz makes, backed by a local directory:
+
+    POST   /<tenant>/oauth2/v2.0/token                 client credentials token
+    PUT    <path>?resource=file                        create an empty file
+    PATCH  <path>?position=N&action=append[&flush=true] positional append
+    PATCH  <path>?position=N&action=flush              commit the file at length N
+    PUT    <path> + x-ms-rename-source                 rename (the _TEMP upload into place)
+    GET    <path>                                      read, honours If-None-Match
+    GET    /<filesystem>?resource=filesystem&directory= list a folder
+    DELETE <path>                                      delete
+
+Like Fabric, numbered parquet files are moved out of the table folder once published
+(after drain_delay_sec), into <table>/_ProcessedFiles/. Point the app at it with
+
+    LZ_URL=<server.lz_url>  AAD_AUTHORITY_HOST=<server.url>
+"""
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, unquote, urlsplit
+
+PROCESSED_FOLDER_NAME = "_ProcessedFiles"
+
+
+class LocalOneLake:
+    """Threaded HTTP server on 127.0.0.1, started with start() and stopped with stop()."""
+
+    def __init__(self, root_dir: str, port: int = 0, drain_delay_sec: float = 0.0, workspace: str = "bench"):
+        self.root_dir = root_dir
+        self.drain_delay_sec = drain_delay_sec
+        self.workspace = workspace
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.bytes_received = 0
+        self.files_published = 0
+        self.tokens_issued = 0
+        handler = type("Handler", (_Handler,), {"lake": self})
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @property
+    def lz_url(self) -> str:
+        return f"{self.url}/{self.workspace}/mirror.MountedRelationalDatabase/Files/LandingZone/"
+
+    def start(self) -> "LocalOneLake":
+        os.makedirs(self.root_dir, exist_ok=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, name="local_onelake", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "requests": dict(self.requests),
+                "bytes_received": self.bytes_received,
+                "files_published": self.files_published,
+                "tokens_issued": self.tokens_issued,
+            }
+
+    def local_path(self, url_path: str) -> str:
+        relative_path = unquote(url_path).lstrip("/")
+        local_path = os.path.normpath(os.path.join(self.root_dir, relative_path))
+        if not local_path.startswith(os.path.normpath(self.root_dir)):
+            raise ValueError(f"path outside of the landing zone: {url_path}")
+        return local_path
+
+    def published(self, local_path: str):
+        """Hand a renamed file to the simulated Fabric replicator."""
+        stem, extension = os.path.splitext(os.path.basename(local_path))
+        if extension != ".parquet" or not stem.isnumeric():
+            return
+        with self.lock:
+            self.files_published += 1
+        if self.drain_delay_sec:
+            threading.Timer(self.drain_delay_sec, self.__drain, (local_path,)).start()
+        else:
+            self.__drain(local_path)
+
+    def __drain(self, local_path: str):
+        processed_dir = os.path.join(os.path.dirname(local_path), PROCESSED_FOLDER_NAME)
+        os.makedirs(processed_dir, exist_ok=True)
+        try:
+            os.replace(local_path, os.path.join(processed_dir, os.path.basename(local_path)))
+        except FileNotFoundError:
+            pass
+
+
+class _Handler(BaseHTTPRequestHandler):
+    lake: LocalOneLake = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.__count("POST")
+        body = self.__read_body()
+        if not self.path.split("?")[0].endswith("/oauth2/v2.0/token"):
+            return self.__reply(404)
+        form = parse_qs(body.decode())
+        if form.get("grant_type") != ["client_credentials"]:
+            return self.__reply(400, {"error": "unsupported_grant_type"})
+        with self.lake.lock:
+            self.lake.tokens_issued += 1
+        self.__reply(200, {"token_type": "Bearer", "expires_in": 3599, "access_token": uuid.uuid4().hex})
+
+    def do_PUT(self):
+        self.__count("PUT")
+        self.__read_body()
+        url = urlsplit(self.path)
+        local_path = self.lake.local_path(url.path)
+        rename_source = self.headers.get("x-ms-rename-source")
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        if rename_source:
+            source_path = self.lake.local_path(urlsplit(rename_source).path)
+            if not os.path.exists(source_path):
+                return self.__reply(404)
+            os.replace(source_path, local_path)
+            self.__reply(201, headers={"ETag": self.__etag(local_path)})
+            self.lake.published(local_path)
+            return
+        if parse_qs(url.query).get("resource") != ["file"]:
+            return self.__reply(400)
+        open(local_path, "wb").close()
+        self.__reply(201, headers={"ETag": self.__etag(local_path)})
+
+    def do_PATCH(self):
+        self.__count("PATCH")
+        body = self.__read_body()
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        local_path = self.lake.local_path(url.path)
+        if not os.path.exists(local_path):
+            return self.__reply(404)
+        position = int(query.get("position", ["0"])[0])
+        action = query.get("action", [""])[0]
+        with open(local_path, "r+b") as file:
+            if action == "append":
+                file.seek(position)
+                file.write(body)
+                with self.lake.lock:
+                    self.lake.bytes_received += len(body)
+                if query.get("flush") == ["true"]:
+                    file.truncate(position + len(body))
+                    return self.__reply(200, headers={"ETag": self.__etag(local_path)})
+                return self.__reply(202)
+            if action == "flush":
+                file.truncate(position)
+                return self.__reply(200, headers={"ETag": self.__etag(local_path)})
+        self.__reply(400)
+
+    def do_GET(self):
+        self.__count("GET")
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if query.get("resource") == ["filesystem"]:
+            return self.__list(url.path, query.get("directory", [""])[0])
+        local_path = self.lake.local_path(url.path)
+        if not os.path.isfile(local_path):
+            return self.__reply(404)
+        etag = self.__etag(local_path)
+        if self.headers.get("If-None-Match") == etag:
+            return self.__reply(304, headers={"ETag": etag})
+        with open(local_path, "rb") as file:
+            content = file.read()
+        self.__reply(200, content, headers={"ETag": etag})
+
+    def do_HEAD(self):
+        self.__count("HEAD")
+        local_path = self.lake.local_path(urlsplit(self.path).path)
+        if not os.path.isfile(local_path):
+            return self.__reply(404)
+        self.send_response(200)
+        self.send_header("ETag", self.__etag(local_path))
+        self.send_header("Content-Length", str(os.path.getsize(local_path)))
+        self.end_headers()
+
+    def do_DELETE(self):
+        self.__count("DELETE")
+        local_path = self.lake.local_path(urlsplit(self.path).path)
+        if not os.path.exists(local_path):
+            return self.__reply(404)
+        if os.path.isdir(local_path):
+            shutil.rmtree(local_path)
+        else:
+            os.remove(local_path)
+        self.__reply(200)
+
+    def __list(self, filesystem_path: str, directory: str):
+        folder = self.lake.local_path(f"{filesystem_path.rstrip('/')}/{directory}")
+        if not os.path.isdir(folder):
+            return self.__reply(404)
+        paths = [
+            {
+                "name": f"{directory.rstrip('/')}/{entry.name}",
+                "isDirectory": str(entry.is_dir()).lower(),
+                "contentLength": entry.stat().st_size if entry.is_file() else 0,
+            }
+            for entry in os.scandir(folder)
+        ]
+        self.__reply(200, {"paths": paths})
+
+    def __count(self, method: str):
+        with self.lake.lock:
+            self.lake.requests[method] += 1
+
+    def __read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def __reply(self, status: int, body=b"", headers: dict = None):
+        if isinstance(body, dict):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    @staticmethod
+    def __etag(local_path: str) -> str:
+        stat = os.stat(local_path)
+        return f'"0x{stat.st_mtime_ns:x}{stat.st_size:x}"'
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--root", default="local_onelake")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--drain-delay-sec", type=float, default=0.0)
+    args = parser.parse_args()
+    lake = LocalOneLake(args.root, args.port, args.drain_delay_sec).start()
+    print(f"LZ_URL={lake.lz_url}\nAAD_AUTHORITY_HOST={lake.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        lake.stop()
@@ -0,0 +1,94 @@
+"""
+Compare parquet encoding profiles on synthetic, mirroring-shaped data.
+
+Writes the same DataFrame once per profile through parquet_writer.write_parquet and
+reports file size, bytes per row and write time, e.g.:
+
+    python benchmarks/parquet_profiles.py --rows 200000 --columns 40
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from constants import ROW_MARKER_COLUMN_NAME  # noqa: E402
+from parquet_writer import write_parquet  # noqa: E402
+
+# name -> PARQUET_* environment variables of the profile
+PROFILES = {
+    "default (snappy)": {},
+    "snappy, no dictionary": {"PARQUET_USE_DICTIONARY": "false"},
+    "zstd": {"PARQUET_COMPRESSION": "zstd"},
+    "zstd level 9": {"PARQUET_COMPRESSION": "zstd", "PARQUET_COMPRESSION_LEVEL": "9"},
+    "zstd, 64k row groups": {"PARQUET_COMPRESSION": "zstd", "PARQUET_ROW_GROUP_SIZE": "65536"},
+    "zstd, no statistics": {"PARQUET_COMPRESSION": "zstd", "PARQUET_WRITE_STATISTICS": "false"},
+    "gzip": {"PARQUET_COMPRESSION": "gzip"},
+    "uncompressed": {"PARQUET_COMPRESSION": "none"},
+}
+
+
+def make_dataframe(rows: int, columns: int, seed: int = 0) -> pd.DataFrame:
+    """ObjectId-like _id, row marker, then a mix of low-cardinality strings, free text, numbers and dates."""
+    rng = np.random.default_rng(seed)
+    data = {
+        "_id": [f"{i:024x}" for i in rng.integers(0, 2**62, rows)],
+        ROW_MARKER_COLUMN_NAME: rng.choice([0, 1, 2, 4], rows),
+    }
+    statuses = np.array(["active", "inactive", "pending", "archived", "deleted"])
+    for index in range(columns):
+        kind = index % 5
+        name = f"col_{index}"
+        if kind == 0:
+            data[name] = statuses[rng.integers(0, len(statuses), rows)]
+        elif kind == 1:
+            data[name] = [f"user {value} note" for value in rng.integers(0, 10**9, rows)]
+        elif kind == 2:
+            data[name] = rng.integers(0, 10**6, rows)
+        elif kind == 3:
+            data[name] = rng.normal(100, 15, rows)
+        else:
+            data[name] = pd.to_datetime(
+                rng.integers(1_600_000_000, 1_800_000_000, rows), unit="s"
+            )
+    return pd.DataFrame(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--columns", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3, help="writes per profile, best time is reported")
+    args = parser.parse_args()
+
+    df = make_dataframe(args.rows, args.columns)
+    print(f"{args.rows} rows x {len(df.columns)} columns, best of {args.repeat} writes")
+    print(f"{'profile':<26} {'bytes':>12} {'bytes/row':>10} {'write s':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "profile.parquet")
+        for name, env in PROFILES.items():
+            saved_env = {key: os.environ.pop(key, None) for key in os.environ.copy() if key.startswith("PARQUET_")}
+            os.environ.update(env)
+            try:
+                best = None
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    write_parquet(df, file_path)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                size = os.path.getsize(file_path)
+            finally:
+                for key in env:
+                    os.environ.pop(key, None)
+                os.environ.update({key: value for key, value in saved_env.items() if value is not None})
+            print(f"{name:<26} {size:>12} {size / args.rows:>10.1f} {best:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Synthetic collections for the benchmarks: document generators per shape, change workloads,
+and BSON fixtures to replay the same data across runs.
+
+Shapes (PROFILES): narrow, wide, nested (deeply nested documents and arrays),
+drifting (field types and new fields change along the collection) and hotkey (narrow
+documents, the change workload updates a handful of documents over and over).
+"""
+
+from datetime import datetime, timedelta, timezone
+import random
+
+import bson
+from bson import Decimal128, ObjectId
+from pymongo import DeleteOne, InsertOne, UpdateOne
+from pymongo.collection import Collection
+
+WIDE_FIELD_COUNT = 200
+NESTED_DEPTH = 4
+HOT_KEY_COUNT = 10
+
+STATUSES = ["active", "inactive", "pending", "archived"]
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def narrow_document(index: int, rng: random.Random) -> dict:
+    return {
+        "_id": ObjectId(),
+        "seq": index,
+        "status": rng.choice(STATUSES),
+        "amount": round(rng.uniform(0, 10_000), 2),
+        "active": rng.random() < 0.5,
+        "created_at": EPOCH + timedelta(seconds=index),
+    }
+
+
+def wide_document(index: int, rng: random.Random) -> dict:
+    document = {"_id": ObjectId(), "seq": index}
+    for field in range(WIDE_FIELD_COUNT):
+        kind = field % 4
+        if kind == 0:
+            document[f"f{field}"] = rng.randint(0, 10**6)
+        elif kind == 1:
+            document[f"f{field}"] = rng.random()
+        elif kind == 2:
+            document[f"f{field}"] = rng.choice(STATUSES)
+        else:
+            document[f"f{field}"] = f"text {rng.randint(0, 10**9)}"
+    return document
+
+
+def nested_document(index: int, rng: random.Random) -> dict:
+    def level(depth: int) -> dict:
+        node = {"name": f"n{depth}", "value": rng.randint(0, 1000)}
+        if depth < NESTED_DEPTH:
+            node["child"] = level(depth + 1)
+            node["items"] = [
+                {"sku": rng.randint(0, 10**6), "qty": rng.randint(1, 9)}
+                for _ in range(rng.randint(0, 5))
+            ]
+        return node
+
+    return {"_id": ObjectId(), "seq": index, "tree": level(1), "tags": rng.sample(STATUSES, 2)}
+
+
+def drifting_document(index: int, rng: random.Random) -> dict:
+    document = narrow_document(index, rng)
+    # the same field changes type along the collection, and new fields keep appearing
+    drift = (index // 1000) % 6
+    document["value"] = [
+        rng.randint(0, 1000),
+        str(rng.randint(0, 1000)),
+        rng.random(),
+        None,
+        {"nested": rng.randint(0, 1000)},
+        Decimal128(str(round(rng.uniform(0, 1000), 3))),
+    ][drift]
+    document[f"extra_{index // 5000}"] = rng.randint(0, 1000)
+    return document
+
+
+PROFILES = {
+    "narrow": narrow_document,
+    "wide": wide_document,
+    "nested": nested_document,
+    "drifting": drifting_document,
+    "hotkey": narrow_document,
+}
+
+
+def generate_documents(profile: str, count: int, seed: int = 0):
+    rng = random.Random(seed)
+    make_document = PROFILES[profile]
+    for index in range(count):
+        yield make_document(index, rng)
+
+
+def load_collection(collection: Collection, documents, batch_size: int = 5000) -> int:
+    """Insert the documents in unordered batches, returns the number inserted."""
+    inserted = 0
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            inserted += len(collection.insert_many(batch, ordered=False).inserted_ids)
+            batch = []
+    if batch:
+        inserted += len(collection.insert_many(batch, ordered=False).inserted_ids)
+    return inserted
+
+
+def apply_changes(collection: Collection, profile: str, count: int, seed: int = 0, batch_size: int = 500):
+    """
+    Run count writes against a loaded collection: updates of random documents with some
+    inserts and deletes, or for hotkey updates of HOT_KEY_COUNT documents only.
+    Returns the operation time of the last write, to wait for it in the landing zone.
+    """
+    rng = random.Random(seed)
+    make_document = PROFILES[profile]
+    ids = [document["_id"] for document in collection.find({}, {"_id": 1}).limit(100_000)]
+    if profile == "hotkey":
+        ids = ids[:HOT_KEY_COUNT]
+    with collection.database.client.start_session() as session:
+        operations = []
+        for index in range(count):
+            choice = rng.random()
+            if profile != "hotkey" and choice < 0.1:
+                operations.append(InsertOne(make_document(10**7 + index, rng)))
+            elif profile != "hotkey" and choice < 0.15 and len(ids) > 1:
+                operations.append(DeleteOne({"_id": ids.pop(rng.randrange(len(ids)))}))
+            else:
+                operations.append(
+                    UpdateOne(
+                        {"_id": rng.choice(ids)},
+                        {"$set": {"seq": index, "updated_at": datetime.now(timezone.utc)}},
+                    )
+                )
+            if len(operations) >= batch_size:
+                collection.bulk_write(operations, ordered=True, session=session)
+                operations = []
+        if operations:
+            collection.bulk_write(operations, ordered=True, session=session)
+        return session.operation_time
+
+
+def write_fixture(path: str, documents) -> int:
+    """Record documents to a BSON file (mongodump layout), returns the number written."""
+    written = 0
+    with open(path, "wb") as file:
+        for document in documents:
+            file.write(bson.encode(document))
+            written += 1
+    return written
+
+
+def read_fixture(path: str):
+    """Replay the documents of a BSON fixture."""
+    with open(path, "rb") as file:
+        yield from bson.decode_file_iter(file)
@@ -67,6 +67,69 @@ INIT_SYNC_LAST_ID_FILE_NAME = "_last_id.pkl"
 
 INIT_SYNC_MAX_ID_FILE_NAME = "_max_id.pkl"
 
+# INIT_SYNC_ORDER: initial sync of the biggest or the smallest collections first
+INIT_SYNC_ORDER_LARGEST_FIRST = "largest_first"
+INIT_SYNC_ORDER_SMALLEST_FIRST = "smallest_first"
+
+# Per-range checkpoints of a parallel init sync (replaces _last_id.pkl when INIT_SYNC_PARALLELISM > 1)
+INIT_SYNC_PARTITIONS_FILE_NAME = "_init_partitions.pkl"
+
+# Sampled _id values per requested range when computing parallel init sync boundaries
+INIT_SYNC_PARTITION_SAMPLES_PER_RANGE = 100
+
+# Local-only name of a batch parquet file before it gets its sequential number
+INIT_SYNC_STAGING_PREFIX = "Init_"
+
+# Parquet files are sized to this many MB (PARQUET_TARGET_FILE_SIZE_MB) from the bytes per row
+# of earlier files, weight of the latest file in that running estimate
+PARQUET_TARGET_FILE_SIZE_MB_DEFAULT = 128
+PARQUET_SIZE_ESTIMATE_WEIGHT = 0.5
+# Files are measured without their footer, and only with at least this many bytes of data:
+# the page headers of a smaller file are a large part of its size
+PARQUET_SIZE_ESTIMATE_MIN_BYTES = 64 * 1024
+
+# Parquet codec when PARQUET_COMPRESSION is not set (pandas / pyarrow default)
+PARQUET_COMPRESSION_DEFAULT = "snappy"
+
+# Max batches waiting between two init sync pipeline stages (bounds memory per stage)
+INIT_SYNC_PIPELINE_QUEUE_DEPTH_DEFAULT = 2
+
+# Landing zone flow control: max numbered parquet files waiting for Fabric in a table folder,
+# how long to wait for Fabric before publishing anyway, and the polling backoff bounds
+LZ_MAX_IN_FLIGHT_FILES_DEFAULT = 2
+LZ_FLOW_CONTROL_MAX_WAIT_SEC_DEFAULT = 600
+LZ_FLOW_CONTROL_MIN_POLL_SEC = 1
+LZ_FLOW_CONTROL_MAX_POLL_SEC = 30
+# Fixed delay used when the landing zone folder can not be listed
+LZ_FLOW_CONTROL_FALLBACK_DELAY_SEC = 30
+
+# AAD access token for the landing zone: scope, lifetime if AAD omits expires_in,
+# background refresh window before expiry, and margin after which a token is no longer served
+LZ_TOKEN_SCOPE = "https://storage.azure.com/.default"
+# AAD_AUTHORITY_HOST overrides it, e.g. for sovereign clouds or a local stand-in
+LZ_TOKEN_AUTHORITY_HOST_DEFAULT = "https://login.microsoftonline.com"
+LZ_TOKEN_DEFAULT_EXPIRES_IN_SEC = 3599
+LZ_TOKEN_REFRESH_AHEAD_SEC = 300
+LZ_TOKEN_EXPIRY_MARGIN_SEC = 60
+
+# Landing zone HTTP client: retries of throttled / failed requests; the connection pool per host
+# defaults to the init sync upload and transform workers (lz_client.py)
+LZ_HTTP_MAX_RETRIES_DEFAULT = 5
+LZ_HTTP_TIMEOUT_SEC = 300
+LZ_HTTP_BACKOFF_BASE_SEC = 1
+LZ_HTTP_BACKOFF_MAX_SEC = 60
+LZ_HTTP_RETRY_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+# the only ones where a non-idempotent request was rejected before taking effect
+LZ_HTTP_RETRY_STATUS_CODES_NOT_IDEMPOTENT = (429, 503)
+
+# Files larger than one chunk are uploaded as positional appends of this size (MB) and a
+# single flush; chunks sent concurrently per file
+LZ_UPLOAD_CHUNK_SIZE_MB_DEFAULT = 64
+LZ_UPLOAD_PARALLEL_CHUNKS_DEFAULT = 1
+
+# Sidecar next to a state file mirrored under data_files/<table>/ holding its LZ ETag
+STATE_CACHE_ETAG_SUFFIX = ".etag"
+
 # Cluster time N captured at init start; change stream resumes at N+1 when no resume token.
 INIT_SYNC_CLUSTER_TIME_FILE_NAME = "_init_cluster_time.pkl"
 
@@ -74,11 +137,46 @@ DELTA_SYNC_CACHE_PARQUET_FILE_NAME = "_incremental_change_cache.parquet"
 
 DELTA_SYNC_RESUME_TOKEN_FILE_NAME = "_resume_token.pkl"
 
+# Local spill log of the change events received during init sync, and the resume token of
+# the last event already in a local Temp_ parquet file
+DELTA_SYNC_SPILL_SEGMENT_FILE_NAME = "_spill_segment.bson"
+DELTA_SYNC_SPILL_RESUME_TOKEN_FILE_NAME = "_spill_resume_token.pkl"
+
+# Adaptive flush policy (DELTA_SYNC_TARGET_LATENCY_SEC): weight of the newest sample in the
+# event rate / flush duration averages, and the longest change stream await between checks
+DELTA_SYNC_FLUSH_ESTIMATE_WEIGHT = 0.3
+DELTA_SYNC_MAX_AWAIT_TIME_MS = 20000
+
+# /status: phase of a collection
+SYNC_PHASE_BOOTSTRAP = "bootstrap"
+SYNC_PHASE_INIT = "init"
+SYNC_PHASE_CATCH_UP = "catch-up"
+SYNC_PHASE_STREAMING = "streaming"
+
+# /metrics: name prefix and histogram buckets of the stage durations
+METRICS_PREFIX = "mongodb_mirroring_"
+METRICS_DURATION_BUCKETS_SEC = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# CHANGE_STREAM_MODE: one change stream per collection (default) or one per database
+CHANGE_STREAM_MODE_COLLECTION = "collection"
+CHANGE_STREAM_MODE_DATABASE = "database"
+
+# Resume token of the database change stream, kept at the landing zone root
+DATABASE_CHANGE_STREAM_RESUME_TOKEN_FILE_NAME = "_database_resume_token.pkl"
+# the database change stream checks the time threshold of every buffer at least this often
+DATABASE_CHANGE_STREAM_FLUSH_CHECK_INTERVAL_SEC = 1
+
 INTERNAL_SCHEMA_FILE_NAME = "_internal_schema.pkl"
 
 COLUMN_RENAMING_FILE_NAME = "_column_renaming.pkl"
 
-CONVERSION_LOG_FILE_NAME = "_conversion_log.txt"
+# Conversion failure log segments (conversion_log.py): _conversion_log_<UTC time>_<n>.txt
+CONVERSION_LOG_FILE_PREFIX = "_conversion_log_"
+CONVERSION_LOG_UPLOAD_INTERVAL_SEC_DEFAULT = 60
+CONVERSION_LOG_MAX_ENTRIES_DEFAULT = 10000
+CONVERSION_LOG_MAX_SEGMENTS_DEFAULT = 20
+CONVERSION_LOG_SAMPLES_PER_COLUMN = 5
+CONVERSION_LOG_MAX_VALUE_LENGTH = 200
 # dict keys for schema
 TYPE_KEY = "type"
 DTYPE_KEY = "dtype"
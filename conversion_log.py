@@ -0,0 +1,334 @@
+"""
+Conversion failures per table, aggregated in memory and uploaded as log segments.
+
+Every failure counts towards its column (failures, target types, a few sample values)
+and adds one row to the open segment, up to CONVERSION_LOG_MAX_ENTRIES rows; further
+rows are only counted. The open segment is written to the landing zone as a new file,
+_conversion_log_<UTC time>_<n>.txt, every CONVERSION_LOG_UPLOAD_INTERVAL_SEC or once it
+is full, so only new failures are uploaded. A segment that fails to upload stays in
+data_files/<table>/ and is uploaded again with the next one, also after a restart. The
+landing zone keeps the last CONVERSION_LOG_MAX_SEGMENTS segments of a table, including
+those of earlier runs, listed at the first upload.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+import logging
+import os
+import threading
+import time
+
+from constants import (
+    CONVERSION_LOG_FILE_PREFIX,
+    CONVERSION_LOG_MAX_ENTRIES_DEFAULT,
+    CONVERSION_LOG_MAX_SEGMENTS_DEFAULT,
+    CONVERSION_LOG_MAX_VALUE_LENGTH,
+    CONVERSION_LOG_SAMPLES_PER_COLUMN,
+    CONVERSION_LOG_UPLOAD_INTERVAL_SEC_DEFAULT,
+)
+from push_file_to_lz import push_file_to_lz, delete_file_from_lz, list_files_from_lz
+from utils import get_positive_int_env, get_table_dir
+
+logger = logging.getLogger(__name__)
+
+__logs = {}
+__logs_lock = threading.Lock()
+__uploader = None
+# set when a segment is full, wakes the uploader before the interval is over
+__segment_full = threading.Event()
+# in transform worker processes: failures handed back to the parent, see forward_failures()
+__forwarded_failures = None
+__forwarded_columns = set()
+
+
+@dataclass
+class _ColumnFailures:
+    failures: int = 0
+    target_types: set = field(default_factory=set)
+    # (document _id, original value, converted value)
+    samples: list = field(default_factory=list)
+
+
+@dataclass
+class _TableLog:
+    # column name -> _ColumnFailures of the open segment
+    columns: dict = field(default_factory=dict)
+    # (document _id, column name, original value, converted value) rows of the open segment
+    entries: list = field(default_factory=list)
+    dropped_entries: int = 0
+    opened_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    last_upload_time: float = field(default_factory=time.time)
+    # segment file names in the landing zone, oldest first
+    segments: list = field(default_factory=list)
+    # segment files written to the table directory but not uploaded yet, oldest first
+    pending_files: list = field(default_factory=list)
+    # segments of earlier runs in the landing zone were listed
+    earlier_segments_listed: bool = False
+    segment_count: int = 0
+    failures: int = 0
+
+
+def record_failure(
+    table_name: str, column_name: str, document_id, original_value, target_type: str, converted_value
+) -> bool:
+    """
+    Add a failed conversion to the open segment of the table. Returns True for the
+    first failure of the column in this segment, so callers can log it once.
+    """
+    doc_id = str(document_id) if document_id is not None else "unknown"
+    entry = (
+        doc_id,
+        str(column_name),
+        __truncate(str(original_value)),
+        __truncate(str(converted_value)),
+    )
+    if __forwarded_failures is not None:
+        __forwarded_failures.append((table_name, column_name, doc_id, entry[2], target_type, entry[3]))
+        is_first = (table_name, column_name) not in __forwarded_columns
+        __forwarded_columns.add((table_name, column_name))
+        return is_first
+    max_entries = get_positive_int_env("CONVERSION_LOG_MAX_ENTRIES", CONVERSION_LOG_MAX_ENTRIES_DEFAULT)
+    with __logs_lock:
+        log = __logs.get(table_name)
+        if log is None:
+            # segments a previous run could not upload go out with the first one of this run
+            log = __logs[table_name] = _TableLog(pending_files=__get_local_segment_files(table_name))
+        column = log.columns.get(column_name)
+        is_first = column is None
+        if is_first:
+            column = log.columns[column_name] = _ColumnFailures()
+        column.failures += 1
+        column.target_types.add(target_type)
+        if len(column.samples) < CONVERSION_LOG_SAMPLES_PER_COLUMN:
+            column.samples.append((entry[0], entry[2], entry[3]))
+        if len(log.entries) < max_entries:
+            log.entries.append(entry)
+            if len(log.entries) == max_entries:
+                __segment_full.set()
+        else:
+            log.dropped_entries += 1
+        log.failures += 1
+    __start_uploader()
+    return is_first
+
+
+def flush_conversion_log(table_name: str, force: bool = False) -> str | None:
+    """
+    Upload the open segment of the table if it has failures and is due (or force),
+    together with segments whose upload failed before; returns the file name of the
+    open segment if it was uploaded.
+    """
+    interval_sec = get_positive_int_env(
+        "CONVERSION_LOG_UPLOAD_INTERVAL_SEC", CONVERSION_LOG_UPLOAD_INTERVAL_SEC_DEFAULT
+    )
+    max_entries = get_positive_int_env("CONVERSION_LOG_MAX_ENTRIES", CONVERSION_LOG_MAX_ENTRIES_DEFAULT)
+    now = datetime.now(timezone.utc)
+    with __logs_lock:
+        log = __logs.get(table_name)
+        if not log or not (log.columns or log.pending_files):
+            return None
+        if (
+            not force
+            and time.time() - log.last_upload_time < interval_sec
+            and len(log.entries) < max_entries
+        ):
+            return None
+        log.last_upload_time = time.time()
+        file_name = None
+        if log.columns:
+            columns, entries, dropped_entries, opened_at = (
+                log.columns, log.entries, log.dropped_entries, log.opened_at
+            )
+            log.columns, log.entries, log.dropped_entries, log.opened_at = {}, [], 0, now
+            log.segment_count += 1
+            file_name = f"{CONVERSION_LOG_FILE_PREFIX}{now:%Y%m%dT%H%M%S}_{log.segment_count}.txt"
+        list_earlier_segments = not log.earlier_segments_listed
+        log.earlier_segments_listed = True
+
+    table_dir = get_table_dir(table_name)
+    if list_earlier_segments:
+        __list_earlier_segments(table_name, log)
+    if file_name:
+        with open(os.path.join(table_dir, file_name), "w") as file:
+            file.write(
+                __format_segment(table_name, columns, entries, dropped_entries, opened_at, now)
+            )
+    with __logs_lock:
+        # taken by this call, another flush of the table does not upload them as well
+        upload_files = log.pending_files + ([file_name] if file_name else [])
+        log.pending_files = []
+
+    uploaded_files = []
+    for index, upload_file in enumerate(upload_files):
+        file_path = os.path.join(table_dir, upload_file)
+        if not os.path.exists(file_path):
+            continue
+        try:
+            push_file_to_lz(file_path, table_name)
+        except Exception as e:
+            logger.warning(
+                f"conversion log {upload_file} of {table_name} not uploaded, kept at {file_path} "
+                f"and uploaded again later: {e}"
+            )
+            with __logs_lock:
+                log.pending_files[:0] = upload_files[index:]
+            break
+        os.remove(file_path)
+        uploaded_files.append(upload_file)
+    if file_name in uploaded_files:
+        logger.warning(
+            f"{sum(column.failures for column in columns.values())} conversion failures in "
+            f"{len(columns)} columns of {table_name}, see {file_name} in the landing zone"
+        )
+    if not uploaded_files:
+        return None
+
+    max_segments = get_positive_int_env("CONVERSION_LOG_MAX_SEGMENTS", CONVERSION_LOG_MAX_SEGMENTS_DEFAULT)
+    with __logs_lock:
+        log.segments = sorted(set(log.segments).union(uploaded_files), key=__segment_order)
+        expired_segments = log.segments[:-max_segments]
+        del log.segments[:-max_segments]
+    for expired_segment in expired_segments:
+        try:
+            delete_file_from_lz(table_name, expired_segment)
+        except Exception as e:
+            logger.warning(f"old conversion log {expired_segment} of {table_name} not deleted: {e}")
+    return file_name if file_name in uploaded_files else None
+
+
+def flush_all_conversion_logs(force: bool = False):
+    with __logs_lock:
+        table_names = list(__logs)
+    for table_name in table_names:
+        flush_conversion_log(table_name, force)
+
+
+def forward_failures():
+    """
+    Collect failures for take_forwarded_failures() instead of logging and uploading
+    them, in worker processes whose parent records them with record_failure().
+    """
+    global __forwarded_failures
+    __forwarded_failures = []
+
+
+def take_forwarded_failures() -> list:
+    """record_failure() arguments of the failures collected since the last call."""
+    failures = list(__forwarded_failures or [])
+    if __forwarded_failures is not None:
+        __forwarded_failures.clear()
+        __forwarded_columns.clear()
+    return failures
+
+
+def get_conversion_log_stats() -> dict:
+    """Per table: failures since start, failures in the open segment and segments uploaded."""
+    with __logs_lock:
+        return {
+            table_name: {
+                "failures": log.failures,
+                "pending_failures": sum(column.failures for column in log.columns.values()),
+                "segments_uploaded": log.segment_count,
+            }
+            for table_name, log in __logs.items()
+        }
+
+
+def __start_uploader():
+    global __uploader
+    if __uploader is not None:
+        return
+    with __logs_lock:
+        if __uploader is None:
+            __uploader = threading.Thread(
+                target=__upload_periodically, name="conversion_log_uploader", daemon=True
+            )
+            __uploader.start()
+
+
+def __upload_periodically():
+    while True:
+        interval_sec = get_positive_int_env(
+            "CONVERSION_LOG_UPLOAD_INTERVAL_SEC", CONVERSION_LOG_UPLOAD_INTERVAL_SEC_DEFAULT
+        )
+        __segment_full.wait(max(1, interval_sec / 4))
+        __segment_full.clear()
+        try:
+            flush_all_conversion_logs()
+        except Exception as e:
+            logger.warning(f"conversion log upload failed: {e}")
+
+
+def __get_local_segment_files(table_name: str) -> list:
+    """Segment files in the table directory, not uploaded by an earlier run."""
+    return sorted(
+        (
+            file_name
+            for file_name in os.listdir(get_table_dir(table_name))
+            if file_name.startswith(CONVERSION_LOG_FILE_PREFIX)
+        ),
+        key=__segment_order,
+    )
+
+
+def __list_earlier_segments(table_name: str, log: _TableLog):
+    """Add the segments of earlier runs in the landing zone, they count towards CONVERSION_LOG_MAX_SEGMENTS."""
+    if os.getenv("DEBUG__SKIP_PUSH_TO_LZ"):
+        return
+    try:
+        lz_files = list_files_from_lz(table_name)
+    except Exception as e:
+        logger.warning(f"conversion logs of {table_name} in the landing zone not listed: {e}")
+        lz_files = None
+    with __logs_lock:
+        if lz_files is None:
+            # listed again at the next upload
+            log.earlier_segments_listed = False
+            return
+        log.segments = sorted(
+            set(log.segments).union(
+                file_name for file_name in lz_files if file_name.startswith(CONVERSION_LOG_FILE_PREFIX)
+            ),
+            key=__segment_order,
+        )
+
+
+def __segment_order(file_name: str) -> tuple:
+    # _conversion_log_<UTC time>_<n>.txt, n restarts with the process
+    time_text, _, number = os.path.splitext(file_name)[0][len(CONVERSION_LOG_FILE_PREFIX) :].rpartition("_")
+    return (time_text, int(number) if number.isdigit() else 0, file_name)
+
+
+def __format_segment(
+    table_name: str, columns: dict, entries: list, dropped_entries: int, opened_at: datetime, closed_at: datetime
+) -> str:
+    lines = [
+        f"Conversion failures of {table_name} from {opened_at:%Y-%m-%d %H:%M:%S} "
+        f"to {closed_at:%Y-%m-%d %H:%M:%S} UTC",
+        "",
+        f"{'Column Name':<20} | {'Failures':>10} | {'Converted To':<20} | Sample Values",
+        "-" * 94,
+    ]
+    for column_name, column in sorted(columns.items(), key=lambda item: -item[1].failures):
+        samples = ", ".join(repr(original_value) for _, original_value, _ in column.samples)
+        lines.append(
+            f"{str(column_name):<20} | {column.failures:>10} | "
+            f"{', '.join(sorted(column.target_types)):<20} | {samples}"
+        )
+    lines += [
+        "",
+        f"{'Document _id':<24} | {'Column Name':<20} | "
+        f"{'Original Value':<24} | {'Converted Value':<20}",
+        "-" * 94,
+    ]
+    for doc_id, column_name, original_value, converted_value in entries:
+        lines.append(f"{doc_id:<24} | {column_name:<20} | {original_value:<24} | {converted_value:<20}")
+    if dropped_entries:
+        lines.append(f"... {dropped_entries} more failures, only counted above")
+    return "\n".join(lines) + "\n"
+
+
+def __truncate(value: str) -> str:
+    if len(value) <= CONVERSION_LOG_MAX_VALUE_LENGTH:
+        return value
+    return value[:CONVERSION_LOG_MAX_VALUE_LENGTH] + "..."
@@ -1,10 +1,22 @@
 import os
 import pickle
+import logging
+import threading
 from enum import Enum
 from typing import Any
 import utils
+from constants import STATE_CACHE_ETAG_SUFFIX
 from push_file_to_lz import push_file_to_lz, get_file_from_lz, delete_file_from_lz
 
+logger = logging.getLogger(__name__)
+
+# state files read / written through this module: (table_name, file_name) -> raw content,
+# None when the file does not exist in the LZ
+__state_cache = {}
+__state_cache_lock = threading.Lock()
+__state_cache_stats = {"hits": 0, "misses": 0, "lz_reads": 0, "not_modified": 0}
+__NOT_CACHED = object()
+
 
 class FileType(Enum):
     PICKLE = "pickle"
@@ -43,64 +55,131 @@ FILETYPE_TO_WRITE_MODE_MAP = {
 
 
 def read_from_file(table_name: str, file_name: str, file_type: FileType):
-    table_path = utils.get_table_dir(table_name)
-    file_full_path = os.path.join(table_path, file_name)
-    # always read from LZ first
-    response_status_code, file_content = get_file_from_lz(table_name, file_name)
-    if response_status_code == 200: 
-        if file_type == FileType.PICKLE:
-            obj = pickle.loads(file_content.content)
-            print("Type of object: ", isinstance(obj, bytes))
-            # Check if the result is itself a pickled object (nested)
-            if isinstance(obj, bytes):
-                obj = pickle.loads(obj)
-            print("Unpickled object: ", obj)
-            return obj
-
-        elif file_type == FileType.TEXT:
-            return file_content.content.decode('utf-8')
-        else:
-            return None
-    else:
+    # the LZ is the durable copy, it is read once per process and then served from memory
+    cached = __get_cached_content(table_name, file_name)
+    if cached is __NOT_CACHED:
+        cached = __load_content(table_name, file_name)
+    if cached is None:
         return None
+    return __decode_content(cached, file_type)
+
 
 def write_to_file(obj: Any, table_name: str, file_name: str, file_type: FileType):
     table_path = utils.get_table_dir(table_name)
     file_full_path = os.path.join(table_path, file_name)
+    # until the push succeeded the LZ state of the file is unknown: neither the cached
+    # content nor the local copy (no ETag) may be served as the LZ version
+    with __state_cache_lock:
+        __state_cache.pop((table_name, file_name), None)
+    __write_etag(table_name, file_name, None)
     with open(file_full_path, FILETYPE_TO_WRITE_MODE_MAP.get(file_type, "w")) as file:
         if file_type == FileType.PICKLE:
             pickle.dump(obj, file)
         elif file_type == FileType.TEXT:
             file.write(obj)
     # write to LZ
-    push_file_to_lz(file_full_path, table_name)
+    etag = push_file_to_lz(file_full_path, table_name)
+    # write-through: the LZ accepted the file, later reads are served from memory
+    with open(file_full_path, "rb") as file:
+        __set_cached_content(table_name, file_name, file.read())
+    __write_etag(table_name, file_name, etag)
 
 
-def append_to_file(obj: Any, table_name: str, file_name: str, file_type: FileType):
-    table_path = utils.get_table_dir(table_name)
-    file_full_path = os.path.join(table_path, file_name)
-    append_mode = "ab" if file_type == FileType.PICKLE else "a"
-    
-    # Create file if it doesn't exist
-    if not os.path.exists(file_full_path):
-        with open(file_full_path, FILETYPE_TO_WRITE_MODE_MAP.get(file_type, "w")) as f:
-            f.write(
-                f"\n{'Document _id':<24} | {'Column Name':<20} | "
-                f"{'Original Value':<24} | {'Converted Value':<20}\n"
-                f"{'-' * 94}\n"
-            )
-    
-    with open(file_full_path, append_mode) as file:
-        if file_type == FileType.PICKLE:
-            pickle.dump(obj, file)
-        elif file_type == FileType.TEXT:
-            file.write(obj)
-    # write to LZ
-    # push_file_to_lz(file_full_path, table_name)
+def get_state_cache_stats() -> dict:
+    """Counters of the state file cache: hits, misses, lz_reads, not_modified."""
+    with __state_cache_lock:
+        return dict(__state_cache_stats)
+
+
+def __get_cached_content(table_name: str, file_name: str):
+    with __state_cache_lock:
+        cached = __state_cache.get((table_name, file_name), __NOT_CACHED)
+        __state_cache_stats["misses" if cached is __NOT_CACHED else "hits"] += 1
+        return cached
+
+
+def __set_cached_content(table_name: str, file_name: str, content: bytes | None):
+    # None caches "file does not exist"
+    with __state_cache_lock:
+        __state_cache[(table_name, file_name)] = content
+
+
+def __load_content(table_name: str, file_name: str) -> bytes | None:
+    file_full_path = os.path.join(utils.get_table_dir(table_name), file_name)
+    etag = None
+    if os.getenv("STATE_CACHE_DISK_MIRROR") and os.path.exists(file_full_path):
+        etag = __read_etag(table_name, file_name)
+    response_status_code, file_content = get_file_from_lz(table_name, file_name, etag)
+    with __state_cache_lock:
+        __state_cache_stats["lz_reads"] += 1
+    if response_status_code == 304:
+        # the local mirror is still the current version
+        with __state_cache_lock:
+            __state_cache_stats["not_modified"] += 1
+        with open(file_full_path, "rb") as file:
+            content = file.read()
+    elif response_status_code == 200:
+        content = file_content.content
+        if os.getenv("STATE_CACHE_DISK_MIRROR"):
+            with open(file_full_path, "wb") as file:
+                file.write(content)
+            __write_etag(table_name, file_name, file_content.headers.get("ETag"))
+    elif file_content is not None and file_content.status_code == 404:
+        content = None
+    else:
+        # the LZ could not be read, do not remember anything
+        return None
+    __set_cached_content(table_name, file_name, content)
+    return content
+
+
+def __decode_content(content: bytes, file_type: FileType):
+    if file_type == FileType.PICKLE:
+        obj = pickle.loads(content)
+        logger.debug(f"Type of object: {isinstance(obj, bytes)}")
+        # Check if the result is itself a pickled object (nested)
+        if isinstance(obj, bytes):
+            obj = pickle.loads(obj)
+        logger.debug(f"Unpickled object: {obj}")
+        return obj
+    elif file_type == FileType.TEXT:
+        return content.decode("utf-8")
+    else:
+        return None
+
+
+def __etag_path(table_name: str, file_name: str) -> str:
+    return os.path.join(utils.get_table_dir(table_name), file_name + STATE_CACHE_ETAG_SUFFIX)
+
+
+def __read_etag(table_name: str, file_name: str) -> str | None:
+    try:
+        with open(__etag_path(table_name, file_name), "r") as file:
+            return file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def __write_etag(table_name: str, file_name: str, etag: str | None):
+    if not os.getenv("STATE_CACHE_DISK_MIRROR"):
+        return
+    if etag:
+        with open(__etag_path(table_name, file_name), "w") as file:
+            file.write(etag)
+    elif os.path.exists(__etag_path(table_name, file_name)):
+        os.remove(__etag_path(table_name, file_name))
 
 
 def delete_file(table_name: str, file_name: str):
     file_full_path = os.path.join(utils.get_table_dir(table_name), file_name)
-    os.remove(file_full_path)
-    # delete from LZ
-    delete_file_from_lz(table_name, file_name)
+    # the local copy may not exist, e.g. after a restart on a new host
+    if os.path.exists(file_full_path):
+        os.remove(file_full_path)
+    __write_etag(table_name, file_name, None)
+    # delete from LZ, until it succeeded the LZ state of the file is unknown
+    with __state_cache_lock:
+        __state_cache.pop((table_name, file_name), None)
+    if delete_file_from_lz(table_name, file_name) is None:
+        logger.warning(f"failed to delete {file_name} of {table_name} from the landing zone")
+        return
+    __set_cached_content(table_name, file_name, None)
@@ -0,0 +1,153 @@
+"""Adaptive flush policy of the change stream listener, per collection."""
+
+from collections import deque
+import logging
+import threading
+import time
+
+from constants import (
+    DELTA_SYNC_FLUSH_ESTIMATE_WEIGHT,
+    DELTA_SYNC_MAX_AWAIT_TIME_MS,
+)
+from utils import get_positive_int_env
+
+logger = logging.getLogger(__name__)
+
+__controllers = {}
+__controllers_lock = threading.Lock()
+
+
+class AdaptiveFlushController:
+    """
+    Decides when the buffered change events of a collection are written to the landing zone.
+
+    An event is in the landing zone after waiting in the buffer plus the time the flush
+    takes (DataFrame, parquet, upload), so buffered events are flushed once the oldest
+    one has waited target_latency_sec minus the observed flush duration, or earlier once
+    the buffer holds as many events as arrive in that interval at the observed event
+    rate. Flushes are at least 3600 / max_files_per_hour seconds apart, the file count
+    bound wins over the latency target; a buffer at max_rows is always flushed.
+    """
+
+    def __init__(self, collection_name: str, target_latency_sec: float, max_files_per_hour: int = 0):
+        self.collection_name = collection_name
+        self.target_latency_sec = target_latency_sec
+        self.min_interval_sec = 3600 / max_files_per_hour if max_files_per_hour else 0.0
+        # events per second and seconds per flush, moving averages
+        self.event_rate = None
+        self.flush_duration = 0.0
+        self.upload_duration = 0.0
+        self.interval_sec = max(self.min_interval_sec, target_latency_sec)
+        self.batch_size = None
+        self.flushes = 0
+        self.last_flush_time = None
+        self.flush_times = deque()
+        self.lock = threading.Lock()
+
+    def should_flush(self, buffered: int, first_event_time: float, max_rows: int, now: float = None) -> bool:
+        """True if the buffer of buffered events, the oldest from first_event_time, is due."""
+        if not buffered:
+            return False
+        if buffered >= max_rows:
+            return True
+        now = now or time.time()
+        with self.lock:
+            self.batch_size = self.__batch_size(max_rows)
+            if (
+                self.last_flush_time is not None
+                and now - self.last_flush_time < self.min_interval_sec
+            ):
+                return False
+            return buffered >= self.batch_size or now - first_event_time >= self.interval_sec
+
+    def record_flush(
+        self, events: int, first_event_time: float, flush_sec: float, upload_sec: float, now: float = None
+    ):
+        """Update the estimates with a flush of events that took flush_sec, upload_sec of it uploading."""
+        now = now or time.time()
+        weight = DELTA_SYNC_FLUSH_ESTIMATE_WEIGHT
+        with self.lock:
+            # events arrived since the previous flush, or since the first one of this batch
+            since = self.last_flush_time if self.last_flush_time is not None else first_event_time
+            event_rate = events / max(now - since, 1e-3)
+            if self.event_rate is None:
+                self.event_rate = event_rate
+                self.flush_duration = flush_sec
+                self.upload_duration = upload_sec
+            else:
+                self.event_rate = weight * event_rate + (1 - weight) * self.event_rate
+                self.flush_duration = weight * flush_sec + (1 - weight) * self.flush_duration
+                self.upload_duration = weight * upload_sec + (1 - weight) * self.upload_duration
+            self.interval_sec = max(
+                self.min_interval_sec, self.target_latency_sec - self.flush_duration
+            )
+            self.flushes += 1
+            self.last_flush_time = now
+            self.flush_times.append(now)
+            while self.flush_times and self.flush_times[0] <= now - 3600:
+                self.flush_times.popleft()
+        logger.debug(
+            f"{self.collection_name}: {events} events flushed in {flush_sec:.2f}s "
+            + f"(upload {upload_sec:.2f}s), {self.event_rate:.2f} events/s, "
+            + f"next flush after {self.interval_sec:.1f}s or {self.batch_size} events"
+        )
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "target_latency_sec": self.target_latency_sec,
+                "min_interval_sec": self.min_interval_sec,
+                "event_rate": self.event_rate or 0.0,
+                "flush_duration_sec": self.flush_duration,
+                "upload_duration_sec": self.upload_duration,
+                "interval_sec": self.interval_sec,
+                "batch_size": self.batch_size or 0,
+                "flushes": self.flushes,
+                "files_last_hour": len(self.flush_times),
+            }
+
+    def __batch_size(self, max_rows: int) -> int:
+        if not self.event_rate:
+            return max_rows
+        return max(1, min(max_rows, int(self.event_rate * self.interval_sec)))
+
+
+def get_flush_controller(collection_name: str) -> AdaptiveFlushController | None:
+    """
+    Flush controller of a collection, or None when DELTA_SYNC_TARGET_LATENCY_SEC is not set
+    (fixed DELTA_SYNC_BATCH_SIZE / TIME_THRESHOLD_IN_SEC policy).
+    """
+    target_latency_sec = get_positive_int_env("DELTA_SYNC_TARGET_LATENCY_SEC", 0)
+    if not target_latency_sec:
+        return None
+    with __controllers_lock:
+        controller = __controllers.get(collection_name)
+        if controller is None:
+            max_files_per_hour = get_positive_int_env("DELTA_SYNC_MAX_FILES_PER_HOUR", 0)
+            logger.info(
+                f"adaptive flush policy for {collection_name}: target latency {target_latency_sec}s, "
+                + f"max files per hour {max_files_per_hour or 'unbounded'}"
+            )
+            controller = AdaptiveFlushController(
+                collection_name, target_latency_sec, max_files_per_hour
+            )
+            __controllers[collection_name] = controller
+        return controller
+
+
+def get_flush_policy_stats() -> dict:
+    """Current estimates and decisions of every adaptive flush controller, by collection."""
+    with __controllers_lock:
+        controllers = dict(__controllers)
+    return {name: controller.get_stats() for name, controller in controllers.items()}
+
+
+def get_change_stream_max_await_time_ms() -> int:
+    """
+    How long try_next() waits for an event before the listener checks its buffer again:
+    a quarter of DELTA_SYNC_TARGET_LATENCY_SEC, at most DELTA_SYNC_MAX_AWAIT_TIME_MS.
+    """
+    target_latency_sec = get_positive_int_env("DELTA_SYNC_TARGET_LATENCY_SEC", 0)
+    if not target_latency_sec:
+        return DELTA_SYNC_MAX_AWAIT_TIME_MS
+    return max(1000, min(DELTA_SYNC_MAX_AWAIT_TIME_MS, target_latency_sec * 250))
@@ -11,6 +11,10 @@ from bson import ObjectId, Decimal128
 from bson.timestamp import Timestamp
 import pickle
 import numpy as np
+import threading
+import queue
+from dataclasses import dataclass
+from typing import Any, Callable
 
 from constants import (
     TYPES_TO_CONVERT_TO_STR,
@@ -24,10 +28,26 @@ from constants import (
     INIT_SYNC_LAST_ID_FILE_NAME,
     INIT_SYNC_MAX_ID_FILE_NAME,
     INIT_SYNC_CLUSTER_TIME_FILE_NAME,
+    INIT_SYNC_PARTITIONS_FILE_NAME,
+    INIT_SYNC_PARTITION_SAMPLES_PER_RANGE,
+    INIT_SYNC_STAGING_PREFIX,
+    INIT_SYNC_PIPELINE_QUEUE_DEPTH_DEFAULT,
 )
 import schema_utils
-from utils import get_parquet_full_path_filename, to_string, get_table_dir
+from arrow_decoder import decode_raw_batches, documents_to_dataframe, read_raw_batches
+from utils import get_parquet_full_path_filename, to_string, get_table_dir, get_positive_int_env
 from push_file_to_lz import push_file_to_lz
+from lz_flow_control import wait_for_lz_capacity
+from metrics import DOCUMENTS_READ, STAGE_DURATION
+import sync_status
+from conversion_log import flush_conversion_log
+from transform_pool import get_transform_process_count, transform_raw_batch
+from parquet_writer import (
+    get_rows_per_file,
+    record_parquet_file,
+    seed_bytes_per_row,
+    write_parquet,
+)
 # not required as now init_sync stat is stored in LZ
 #from flags import set_init_flag, clear_init_flag
 from file_utils import FileType, read_from_file, write_to_file, delete_file
@@ -35,7 +55,7 @@ from file_utils import FileType, read_from_file, write_to_file, delete_file
 from mongo_cluster_time import get_cluster_time
 
 
-def init_sync(collection_name: str):
+def init_sync(collection_name: str, on_cluster_time: Callable[[], None] | None = None):
     logger = logging.getLogger(f"{__name__}[{collection_name}]")
 
     # detect if there's a init_sync_stat file in LZ, and get its value
@@ -72,7 +92,6 @@ def init_sync(collection_name: str):
     db_name = os.getenv("MONGO_DB_NAME")
     logger.debug(f"db_name={db_name}")
     logger.debug(f"collection={collection_name}")
-    enable_perf_timer = os.getenv("DEBUG__ENABLE_PERF_TIMER")
 
     client = pymongo.MongoClient(os.getenv("MONGO_CONN_STR"))
     db = client[os.getenv("MONGO_DB_NAME")]
@@ -93,6 +112,9 @@ def init_sync(collection_name: str):
             INIT_SYNC_CLUSTER_TIME_FILE_NAME,
             FileType.PICKLE,
         )
+    # the change stream can open at N+1 now, changes made during init sync are spilled
+    if on_cluster_time:
+        on_cluster_time()
 
     count = collection.estimated_document_count()
 
@@ -114,10 +136,232 @@ def init_sync(collection_name: str):
                 )
 
         batch_size = int(os.getenv("INIT_LOAD_BATCH_SIZE"))
+        seed_bytes_per_row(collection_name, collection)
+
+        # resume a previously started parallel init sync, or split the _id space
+        # into ranges when INIT_SYNC_PARALLELISM > 1 and this is a fresh start
+        partitions = read_from_file(
+            collection_name, INIT_SYNC_PARTITIONS_FILE_NAME, FileType.PICKLE
+        )
+        if partitions:
+            logger.info(
+                f"interrupted parallel init sync detected, resuming {len(partitions)} partitions"
+            )
+        else:
+            parallelism = get_positive_int_env("INIT_SYNC_PARALLELISM", 1)
+            if parallelism > 1 and last_id:
+                logger.info(
+                    "sequential init sync in progress, ignoring INIT_SYNC_PARALLELISM"
+                )
+            elif parallelism > 1 and max_id is not None:
+                partitions = __build_partitions(
+                    collection, max_id, parallelism, logger, session=session
+                )
+                if partitions:
+                    logger.info(f"writing {len(partitions)} partitions into file")
+                    write_to_file(
+                        partitions,
+                        collection_name,
+                        INIT_SYNC_PARTITIONS_FILE_NAME,
+                        FileType.PICKLE,
+                    )
+
+    if partitions:
+        id_ranges = __get_partition_id_ranges(collection_name, partitions, logger)
+    else:
+
+        def checkpoint(batch_last_id):
+            # write current last_id to file
+            logger.info(f"writing last_id into file: {batch_last_id}")
+            write_to_file(
+                batch_last_id,
+                collection_name,
+                INIT_SYNC_LAST_ID_FILE_NAME,
+                FileType.PICKLE,
+            )
+
+        id_ranges = [_IdRange("r0", last_id, max_id, checkpoint)]
+
+    __run_pipeline(client, collection, collection_name, id_ranges, batch_size, logger)
+
+    if partitions:
+        logger.info("removing the partitions file")
+        delete_file(collection_name, INIT_SYNC_PARTITIONS_FILE_NAME)
+    else:
+        # delete last_id file, as init sync is complete
+        logger.info("removing the last_id file")
+        delete_file(collection_name, INIT_SYNC_LAST_ID_FILE_NAME)
+
+    #set_init_flag_stat as complete = Y
+    logger.info("Setting init_sync_stat flag as Y")
+    init_sync_stat_flag = "Y"
+    write_to_file(
+        init_sync_stat_flag, collection_name, INIT_SYNC_STATUS_FILE_NAME, FileType.PICKLE
+    )
+    logger.info(f"init sync completed for collection {collection_name}")
+    flush_conversion_log(collection_name, force=True)
+
+
+@dataclass
+class _IdRange:
+    """Documents with start_id < _id <= max_id; start_id=None starts from the smallest _id."""
+
+    name: str
+    start_id: Any
+    max_id: Any
+    # called with the last _id of every batch once it is in the LZ, in _id order
+    checkpoint: Callable[[Any], None]
+    # called once the last batch of the range is in the LZ
+    on_done: Callable[[], None] | None = None
 
-        columns_to_convert_to_str = None
 
-        while last_id is None or (max_id is not None and last_id < max_id):
+@dataclass
+class _PipelineBatch:
+    range_index: int
+    seq: int
+    df: pd.DataFrame | None
+    last_id: Any
+    staging_parquet_path: str
+    # with INIT_SYNC_TRANSFORM_PROCESSES: the undecoded batch instead of df
+    raw_bson: bytes | None = None
+
+
+@dataclass
+class _RangeEnd:
+    range_index: int
+    batch_count: int
+
+
+# tells a stage that its upstream is finished (or that the pipeline is stopping)
+_STAGE_DONE = object()
+
+
+def __run_pipeline(
+    client: pymongo.MongoClient,
+    collection: Collection,
+    collection_name: str,
+    id_ranges: list[_IdRange],
+    batch_size: int,
+    logger: logging.Logger,
+):
+    """
+    Copy the given _id ranges to the LZ with overlapping stages:
+    cursor readers (one per range) -> transformer pool -> parquet writer -> uploader.
+
+    Stages are connected by bounded queues (INIT_SYNC_PIPELINE_QUEUE_DEPTH) to cap
+    memory. The single uploader publishes the batches of each range in _id order,
+    so checkpoints only advance once a batch is in the landing zone.
+    """
+    queue_depth = get_positive_int_env(
+        "INIT_SYNC_PIPELINE_QUEUE_DEPTH", INIT_SYNC_PIPELINE_QUEUE_DEPTH_DEFAULT
+    )
+    transform_workers = get_positive_int_env("INIT_SYNC_TRANSFORM_WORKERS", 1)
+    # every transformer thread hands one batch at a time to the worker processes
+    transform_workers = max(transform_workers, get_transform_process_count())
+    transform_queue = queue.Queue(maxsize=queue_depth)
+    write_queue = queue.Queue(maxsize=queue_depth)
+    upload_queue = queue.Queue(maxsize=queue_depth)
+    stop_event = threading.Event()
+    errors = []
+
+    def start_stage(name, target, *args):
+        def run():
+            try:
+                target(*args)
+            except Exception as e:
+                logger.exception(f"init sync {name} failed: {str(e)}")
+                errors.append(e)
+                stop_event.set()
+
+        thread = threading.Thread(target=run, name=f"init_sync[{collection_name}]-{name}")
+        thread.start()
+        return thread
+
+    readers = [
+        start_stage(
+            f"reader-{id_range.name}",
+            __read_id_range,
+            client,
+            collection,
+            collection_name,
+            range_index,
+            id_range,
+            batch_size,
+            transform_queue,
+            stop_event,
+        )
+        for range_index, id_range in enumerate(id_ranges)
+    ]
+    transformers = [
+        start_stage(
+            f"transformer-{index}",
+            __transform_batches,
+            collection_name,
+            transform_queue,
+            write_queue,
+            stop_event,
+            logger,
+        )
+        for index in range(transform_workers)
+    ]
+    writer = start_stage(
+        "writer",
+        __write_batches,
+        collection_name,
+        write_queue,
+        upload_queue,
+        stop_event,
+        logger,
+    )
+    uploader = start_stage(
+        "uploader",
+        __upload_batches,
+        collection_name,
+        id_ranges,
+        upload_queue,
+        stop_event,
+        logger,
+    )
+
+    # shut the stages down in order once their upstream has finished
+    for thread in readers:
+        thread.join()
+    for _ in transformers:
+        __put_stage_item(transform_queue, _STAGE_DONE, stop_event)
+    for thread in transformers:
+        thread.join()
+    __put_stage_item(write_queue, _STAGE_DONE, stop_event)
+    writer.join()
+    __put_stage_item(upload_queue, _STAGE_DONE, stop_event)
+    uploader.join()
+
+    if errors:
+        raise errors[0]
+
+
+def __read_id_range(
+    client: pymongo.MongoClient,
+    collection: Collection,
+    collection_name: str,
+    range_index: int,
+    id_range: _IdRange,
+    batch_size: int,
+    transform_queue: queue.Queue,
+    stop_event: threading.Event,
+):
+    logger = logging.getLogger(f"{__name__}[{collection_name}][{id_range.name}]")
+    enable_perf_timer = os.getenv("DEBUG__ENABLE_PERF_TIMER")
+    last_id = id_range.start_id
+    max_id = id_range.max_id
+    seq = 0
+    # worker processes decode the batches, only their first and last document are read here
+    use_transform_processes = get_transform_process_count() > 0
+    logger.info(f"reading _id range ({last_id}, {max_id}]")
+    # sessions are not thread safe, every reader gets its own
+    with client.start_session() as session:
+        while not stop_event.is_set() and (
+            last_id is None or (max_id is not None and last_id < max_id)
+        ):
             # for debug only
             debug_env_var_sleep_sec = os.getenv("DEBUG__INIT_SYNC_SLEEP_SEC")
             if debug_env_var_sleep_sec and debug_env_var_sleep_sec.isnumeric():
@@ -125,112 +369,333 @@ def init_sync(collection_name: str):
                 time.sleep(int(debug_env_var_sleep_sec))
                 logger.info(f"sleep({debug_env_var_sleep_sec}) ends")
 
-            if not last_id:
-                batch_cursor = (
-                    collection.find(session=session).sort({"_id": 1}).limit(batch_size)
-                )
-            else:
-                batch_cursor = (
-                    collection.find(
-                        {"_id": {"$gt": last_id, "$lte": max_id}},
-                        session=session,
-                    )
-                    .sort({"_id": 1})
-                    .limit(batch_size)
+            id_filter = {}
+            if last_id is not None:
+                id_filter["$gt"] = last_id
+            if max_id is not None:
+                id_filter["$lte"] = max_id
+            # raw BSON batches are decoded in C and turned into Arrow columns per schema
+            batch_cursor = (
+                collection.find_raw_batches(
+                    {"_id": id_filter} if id_filter else {}, session=session
                 )
+                .sort({"_id": 1})
+                .limit(get_rows_per_file(collection_name, batch_size))
+            )
 
             read_start_time = time.time()
-            batch_df = pd.DataFrame(list(batch_cursor))
-
-            read_end_time = time.time()
-            if enable_perf_timer:
-                logger.info(f"TIME: read took {read_end_time-read_start_time:.2f} seconds")
+            batch_df = None
+            raw_bson = None
+            if use_transform_processes:
+                raw_bson, document_count, first_document, last_document = read_raw_batches(batch_cursor)
+                bson_bytes = len(raw_bson)
+            else:
+                documents, bson_bytes = decode_raw_batches(batch_cursor)
+                document_count = len(documents)
+                first_document = documents[0] if documents else None
+                last_document = documents[-1] if documents else None
 
             # quit the loop if no more data
-            if batch_df.empty:
+            if not document_count:
                 break
 
             # get the last _id of its original data type ObjectId, before we convert it to string later
-            raw_last_id = batch_df["_id"].iloc[-1]
-            first_id = batch_df["_id"][0]
+            raw_last_id = last_document["_id"]
+            first_id = first_document["_id"]
+            if not use_transform_processes:
+                batch_df = documents_to_dataframe(collection_name, documents)
+                del documents
+
+            read_end_time = time.time()
+            DOCUMENTS_READ.inc(document_count, collection=collection_name)
+            STAGE_DURATION.observe(
+                read_end_time - read_start_time, collection=collection_name, sync="init", stage="read"
+            )
+            if enable_perf_timer:
+                logger.info(
+                    f"TIME: read took {read_end_time-read_start_time:.2f} seconds "
+                    f"({bson_bytes} BSON bytes)"
+                )
+
             logger.info("starting a new batch.")
             logger.info(f"first _id of this batch: {first_id}")
             logger.info(f"last _id of this batch: {raw_last_id}")
 
-            # process df according to internal schema
-            schema_utils.process_dataframe(collection_name, batch_df)
+            __put_stage_item(
+                transform_queue,
+                _PipelineBatch(
+                    range_index,
+                    seq,
+                    batch_df,
+                    raw_last_id,
+                    __get_staging_parquet_path(collection_name, range_index, seq),
+                    raw_bson,
+                ),
+                stop_event,
+            )
+            seq += 1
+            last_id = raw_last_id
+            logger.debug(f"DATA TYPE OF last_id IS: {type(last_id)}")
+
+    if not stop_event.is_set():
+        __put_stage_item(transform_queue, _RangeEnd(range_index, seq), stop_event)
+
 
-            trans_end_time = time.time()
+def __transform_batches(
+    collection_name: str,
+    transform_queue: queue.Queue,
+    write_queue: queue.Queue,
+    stop_event: threading.Event,
+    logger: logging.Logger,
+):
+    enable_perf_timer = os.getenv("DEBUG__ENABLE_PERF_TIMER")
+    while True:
+        item = __get_stage_item(transform_queue, stop_event)
+        if item is _STAGE_DONE:
+            return
+        if isinstance(item, _PipelineBatch):
+            trans_start_time = time.time()
+            if item.raw_bson is not None:
+                # decoded, processed and written as parquet by a worker process
+                parquet_bytes, row_count = transform_raw_batch(collection_name, item.raw_bson)
+                item.raw_bson = None
+                with open(item.staging_parquet_path, "wb") as file:
+                    file.write(parquet_bytes)
+                record_parquet_file(collection_name, item.staging_parquet_path, row_count)
+            else:
+                # process df according to internal schema
+                schema_utils.process_dataframe(collection_name, item.df)
+                schema_utils.finalize_dataframe_for_parquet(collection_name, item.df)
+            STAGE_DURATION.observe(
+                time.time() - trans_start_time, collection=collection_name, sync="init", stage="transform"
+            )
             if enable_perf_timer:
-                logger.info(f"TIME: trans took {trans_end_time-read_end_time:.2f} seconds")
+                logger.info(f"TIME: trans took {time.time()-trans_start_time:.2f} seconds")
+        __put_stage_item(write_queue, item, stop_event)
+
 
+def __write_batches(
+    collection_name: str,
+    write_queue: queue.Queue,
+    upload_queue: queue.Queue,
+    stop_event: threading.Event,
+    logger: logging.Logger,
+):
+    enable_perf_timer = os.getenv("DEBUG__ENABLE_PERF_TIMER")
+    while True:
+        item = __get_stage_item(write_queue, stop_event)
+        if item is _STAGE_DONE:
+            return
+        # batches transformed by a worker process are already written
+        if isinstance(item, _PipelineBatch) and item.df is not None:
+            write_start_time = time.time()
             logger.debug("creating parquet file...")
-            # changed to get last parquet file number from LZ for resilience
-            #parquet_full_path_filename = get_parquet_full_path_filename(collection_name)
-            last_parquet_file_num = read_from_file(
-            collection_name, LAST_PARQUET_FILE_NUMBER, FileType.PICKLE
+            # Write the parquet file under a staging name, it gets its final number when published
+            write_parquet(item.df, item.staging_parquet_path)
+            # later batches are sized from this file (PARQUET_TARGET_FILE_SIZE_MB)
+            record_parquet_file(collection_name, item.staging_parquet_path, len(item.df))
+            item.df = None
+            STAGE_DURATION.observe(
+                time.time() - write_start_time, collection=collection_name, sync="init", stage="write"
             )
-            if not last_parquet_file_num:
-               last_parquet_file_num = 0
-
-            parquet_full_path_filename = get_parquet_full_path_filename(collection_name, last_parquet_file_num)
-            
-            logger.info(f"writing parquet file: {parquet_full_path_filename}")
+            if enable_perf_timer:
+                logger.info(f"TIME: write took {time.time()-write_start_time:.2f} seconds")
+        __put_stage_item(upload_queue, item, stop_event)
 
-            schema_utils.finalize_dataframe_for_parquet(collection_name, batch_df)
 
-            # Write the parquet file
-            batch_df.to_parquet(parquet_full_path_filename, index=False)
-            # os.remove("temp.csv")
-            write_end_time = time.time()    
-            if enable_perf_timer:
-                logger.info(f"TIME: write took {write_end_time-trans_end_time:.2f} seconds")
-                
-        #>>># changes to remove write metadata.json here as it will now be written as the first file in mongodb_generic_mirroring.py - 6Mar2025
-     #      if not last_id:
-                # do not copy, but send the template file directly
-                # metadata_json_path = os.path.join(
-                #     os.path.dirname(os.path.abspath(__file__)), METADATA_FILE_NAME
-                # )
-                # logger.info("writing metadata file to LZ")
-                # push_file_to_lz(metadata_json_path, collection_name)
-            # write the current batch to LZ
-            push_start_time = time.time()
-            logger.info("writing parquet file to LZ")
-            push_file_to_lz(parquet_full_path_filename, collection_name)
-            push_end_time = time.time()
-            if enable_perf_timer:
-                logger.info(f"TIME: push took {push_end_time-push_start_time:.2f} seconds")
-            last_id = raw_last_id
-            logger.debug(f"DATA TYPE OF last_id IS: {type(last_id)}")
-            # write current last_id to file
-            logger.info(f"writing last_id into file: {last_id}")
-            write_to_file(
-                last_id, collection_name, INIT_SYNC_LAST_ID_FILE_NAME, FileType.PICKLE
-            )
-            # write last parquet file number to file
-            last_parquet_file_num += 1
-            logger.info(f"writing last parquet number into file: {last_parquet_file_num}")
-            write_to_file(
-                last_parquet_file_num,
+def __upload_batches(
+    collection_name: str,
+    id_ranges: list[_IdRange],
+    upload_queue: queue.Queue,
+    stop_event: threading.Event,
+    logger: logging.Logger,
+):
+    # batches can leave the transformer pool out of order; hold them back until
+    # all earlier batches of the same range are published
+    next_seq = [0] * len(id_ranges)
+    batch_counts: list[int | None] = [None] * len(id_ranges)
+    ready: list[dict[int, _PipelineBatch]] = [{} for _ in id_ranges]
+    while True:
+        item = __get_stage_item(upload_queue, stop_event)
+        if item is _STAGE_DONE:
+            return
+        range_index = item.range_index
+        id_range = id_ranges[range_index]
+        if isinstance(item, _RangeEnd):
+            batch_counts[range_index] = item.batch_count
+        else:
+            ready[range_index][item.seq] = item
+        while next_seq[range_index] in ready[range_index]:
+            batch = ready[range_index].pop(next_seq[range_index])
+            __publish_parquet_file(
                 collection_name,
-                LAST_PARQUET_FILE_NUMBER,
-                FileType.PICKLE,
+                batch.staging_parquet_path,
+                lambda: id_range.checkpoint(batch.last_id),
+                logger,
             )
-            #>>># added sleep to ensure that Fabric picks up one file at a time - 14Mar2025
-            time.sleep(30)
+            next_seq[range_index] += 1
+        if next_seq[range_index] == batch_counts[range_index]:
+            logger.info(f"all batches of range {id_range.name} are published")
+            if id_range.on_done:
+                id_range.on_done()
 
-    # delete last_id file, as init sync is complete
-    logger.info("removing the last_id file")
-    delete_file(collection_name, INIT_SYNC_LAST_ID_FILE_NAME)
 
-    #set_init_flag_stat as complete = Y
-    logger.info("Setting init_sync_stat flag as Y")
-    init_sync_stat_flag = "Y"
+def __put_stage_item(stage_queue: queue.Queue, item, stop_event: threading.Event):
+    while not stop_event.is_set():
+        try:
+            stage_queue.put(item, timeout=1)
+            return
+        except queue.Full:
+            continue
+
+
+def __get_stage_item(stage_queue: queue.Queue, stop_event: threading.Event):
+    while not stop_event.is_set():
+        try:
+            return stage_queue.get(timeout=1)
+        except queue.Empty:
+            continue
+    return _STAGE_DONE
+
+
+def __publish_parquet_file(
+    collection_name: str,
+    staging_parquet_path: str,
+    on_published,
+    logger: logging.Logger,
+):
+    enable_perf_timer = os.getenv("DEBUG__ENABLE_PERF_TIMER")
+    # changed to get last parquet file number from LZ for resilience
+    last_parquet_file_num = read_from_file(
+        collection_name, LAST_PARQUET_FILE_NUMBER, FileType.PICKLE
+    )
+    if not last_parquet_file_num:
+        last_parquet_file_num = 0
+
+    parquet_full_path_filename = get_parquet_full_path_filename(
+        collection_name, last_parquet_file_num
+    )
+    logger.info(f"writing parquet file: {parquet_full_path_filename}")
+    os.replace(staging_parquet_path, parquet_full_path_filename)
+
+    # wait for Fabric to drain the table folder instead of a fixed delay
+    wait_for_lz_capacity(collection_name, logger)
+
+    # write the current batch to LZ
+    push_start_time = time.time()
+    logger.info("writing parquet file to LZ")
+    push_file_to_lz(parquet_full_path_filename, collection_name)
+    push_end_time = time.time()
+    STAGE_DURATION.observe(
+        push_end_time - push_start_time, collection=collection_name, sync="init", stage="push"
+    )
+    if enable_perf_timer:
+        logger.info(f"TIME: push took {push_end_time-push_start_time:.2f} seconds")
+
+    on_published()
+
+    # write last parquet file number to file
+    last_parquet_file_num += 1
+    logger.info(f"writing last parquet number into file: {last_parquet_file_num}")
     write_to_file(
-        init_sync_stat_flag, collection_name, INIT_SYNC_STATUS_FILE_NAME, FileType.PICKLE
+        last_parquet_file_num,
+        collection_name,
+        LAST_PARQUET_FILE_NUMBER,
+        FileType.PICKLE,
+    )
+    sync_status.record_published(collection_name, last_parquet_file_num)
+
+
+def __get_partition_id_ranges(
+    collection_name: str, partitions: list[dict], logger: logging.Logger
+) -> list[_IdRange]:
+    """One _IdRange per unfinished partition; each checkpoints into the partitions file."""
+
+    def write_partitions():
+        write_to_file(
+            partitions, collection_name, INIT_SYNC_PARTITIONS_FILE_NAME, FileType.PICKLE
+        )
+
+    def make_id_range(index: int, partition: dict) -> _IdRange:
+        def checkpoint(batch_last_id):
+            partition["last_id"] = batch_last_id
+            logger.info(f"writing last_id of partition {index} into file: {batch_last_id}")
+            write_partitions()
+
+        def on_done():
+            partition["done"] = True
+            logger.info(f"partition {index} finished")
+            write_partitions()
+
+        start_id = partition["last_id"]
+        if start_id is None:
+            start_id = partition["lower_id"]
+        return _IdRange(f"p{index}", start_id, partition["upper_id"], checkpoint, on_done)
+
+    id_ranges = []
+    for index, partition in enumerate(partitions):
+        if partition["done"]:
+            logger.info(f"partition {index} already finished previously, skipping")
+            continue
+        id_ranges.append(make_id_range(index, partition))
+    return id_ranges
+
+
+def __build_partitions(
+    collection: Collection, max_id, parallelism: int, logger: logging.Logger, session=None
+) -> list[dict]:
+    """
+    Split (-inf, max_id] into up to `parallelism` _id ranges using sampled _id quantiles.
+
+    Returns an empty list (sequential init sync) when the collection is too small
+    or the sampled _ids are not all of the same type as max_id, since range
+    queries on _id are type-bracketed.
+    """
+    count = collection.estimated_document_count()
+    sample_size = min(count, parallelism * INIT_SYNC_PARTITION_SAMPLES_PER_RANGE)
+    if sample_size < parallelism:
+        logger.info("collection too small to partition, using sequential init sync")
+        return []
+    pipeline = [
+        {"$sample": {"size": sample_size}},
+        {"$project": {"_id": 1}},
+        {"$sort": {"_id": 1}},
+    ]
+    sampled_ids = [
+        doc["_id"]
+        for doc in collection.aggregate(pipeline, allowDiskUse=True, session=session)
+    ]
+    if not sampled_ids or any(type(_id) is not type(max_id) for _id in sampled_ids):
+        logger.warning(
+            "sampled _id values are not all of the same type as max_id, using sequential init sync"
+        )
+        return []
+
+    boundaries = []
+    for index in range(1, parallelism):
+        candidate = sampled_ids[len(sampled_ids) * index // parallelism]
+        if candidate >= max_id:
+            break
+        if boundaries and candidate <= boundaries[-1]:
+            continue
+        boundaries.append(candidate)
+    if not boundaries:
+        return []
+
+    lower_ids = [None] + boundaries
+    upper_ids = boundaries + [max_id]
+    logger.info(f"split init sync into {len(upper_ids)} partitions at {boundaries}")
+    return [
+        {"lower_id": lower_id, "upper_id": upper_id, "last_id": None, "done": False}
+        for lower_id, upper_id in zip(lower_ids, upper_ids)
+    ]
+
+
+def __get_staging_parquet_path(collection_name: str, range_index: int, seq: int) -> str:
+    return os.path.join(
+        get_table_dir(collection_name),
+        f"{INIT_SYNC_STAGING_PREFIX}{range_index}_{seq}.parquet",
     )
-    logger.info(f"init sync completed for collection {collection_name}")
 
 
 def __get_max_id(collection: Collection, logger: logging.Logger, session=None):
@@ -5,8 +5,11 @@ import logging
 import os
 import pickle
 import logging
+import shutil
 from pymongo.errors import PyMongoError
 from datetime import datetime, timedelta
+from dataclasses import dataclass, field
+from typing import Any
 
 from bson.timestamp import Timestamp
 
@@ -19,23 +22,174 @@ from constants import (
     DATA_FILES_PATH,
     DELTA_SYNC_CACHE_PARQUET_FILE_NAME,
     DELTA_SYNC_RESUME_TOKEN_FILE_NAME,
+    DATABASE_CHANGE_STREAM_FLUSH_CHECK_INTERVAL_SEC,
+    DATABASE_CHANGE_STREAM_RESUME_TOKEN_FILE_NAME,
+    DELTA_SYNC_SPILL_SEGMENT_FILE_NAME,
+    DELTA_SYNC_SPILL_RESUME_TOKEN_FILE_NAME,
 # added the two new files to save the initial sync status and last parquet file number
     INIT_SYNC_STATUS_FILE_NAME,
     INIT_SYNC_CLUSTER_TIME_FILE_NAME,
     LAST_PARQUET_FILE_NUMBER,
+    SYNC_PHASE_CATCH_UP,
     DTYPE_KEY,
     TYPE_KEY,
 )
-from utils import to_string, get_parquet_full_path_filename, get_temp_parquet_full_path_filename, get_table_dir
+from utils import (
+    to_string,
+    get_non_negative_int_env,
+    get_parquet_full_path_filename,
+    get_temp_parquet_full_path_filename,
+    get_table_dir,
+)
 from push_file_to_lz import push_file_to_lz
 #from flags import get_init_flag
 import schemas
 import schema_utils
+from arrow_decoder import documents_to_dataframe
+from parquet_writer import (
+    get_rows_per_file,
+    get_target_file_size_bytes,
+    merge_parquet_files,
+    record_parquet_file,
+    seed_bytes_per_row,
+    write_parquet,
+)
 from file_utils import FileType, read_from_file, write_to_file
+from flush_policy import get_change_stream_max_await_time_ms, get_flush_controller
+from metrics import STAGE_DURATION
+import sync_status
 from mongo_cluster_time import next_timestamp
+import bson
+from bson.errors import InvalidBSON
+import threading
+
+# DELTA_SYNC_COALESCE counters, see get_change_coalescing_stats()
+__coalesce_stats = {"events": 0, "rows": 0, "rows_eliminated": 0}
+__coalesce_stats_lock = threading.Lock()
+
+
+@dataclass
+class _ChangeBuffer:
+    """Change events waiting for the next flush, kept as raw documents until then."""
+
+    documents: list[dict] = field(default_factory=list)
+    row_markers: list[int] = field(default_factory=list)
+    # documentKey _id of every event, rows are coalesced on it
+    document_ids: list = field(default_factory=list)
+    # resume token and clusterTime of the last buffered event
+    resume_token: Any = None
+    cluster_time: Timestamp | None = None
+    # time the first event of this batch was buffered
+    last_sync_time: float | None = None
+
+    def __len__(self) -> int:
+        return len(self.documents)
 
+    def append(
+        self, document: dict, document_id, row_marker: int, resume_token, cluster_time: Timestamp = None
+    ):
+        if not self.documents:
+            self.last_sync_time = time.time()
+        self.documents.append(document)
+        self.document_ids.append(document_id)
+        self.row_markers.append(row_marker)
+        self.resume_token = resume_token
+        self.cluster_time = cluster_time
 
-def listening(collection_name: str):
+    def clear(self):
+        self.documents = []
+        self.row_markers = []
+        self.document_ids = []
+        self.last_sync_time = None
+
+
+class _SpillSegment:
+    """
+    Append-only local log of the change events received while init sync is running.
+
+    Every event is one BSON record {doc, id, marker, token} written to
+    data_files/<table>/_spill_segment.bson, so memory stays flat and a restarted
+    listener can resume after the last spilled event. Records are flushed to the OS,
+    which survives a crash of the process; with DELTA_SYNC_SPILL_FSYNC_EVENTS every
+    that many events are also fsynced, to survive a crash of the host. A torn record at
+    the end (crash while writing) is dropped when the segment is opened.
+    """
+
+    def __init__(self, table_name: str):
+        self.path = os.path.join(get_table_dir(table_name), DELTA_SYNC_SPILL_SEGMENT_FILE_NAME)
+        self.count = 0
+        self.resume_token = None
+        self.file = None
+        self.fsync_events = get_non_negative_int_env("DELTA_SYNC_SPILL_FSYNC_EVENTS", 0)
+        self.unsynced_events = 0
+        valid_size = 0
+        for record, end_offset in self.__records():
+            self.count += 1
+            self.resume_token = record["token"]
+            valid_size = end_offset
+        if os.path.exists(self.path) and not valid_size:
+            os.remove(self.path)
+        elif os.path.exists(self.path) and os.path.getsize(self.path) != valid_size:
+            os.truncate(self.path, valid_size)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, document: dict, document_id, row_marker: int, resume_token):
+        if self.file is None:
+            self.file = open(self.path, "ab")
+        self.file.write(
+            bson.encode(
+                {"doc": document, "id": document_id, "marker": row_marker, "token": resume_token}
+            )
+        )
+        self.file.flush()
+        self.count += 1
+        self.resume_token = resume_token
+        if self.fsync_events:
+            self.unsynced_events += 1
+            if self.unsynced_events >= self.fsync_events:
+                os.fsync(self.file.fileno())
+                self.unsynced_events = 0
+
+    def read(self) -> _ChangeBuffer:
+        if self.file is not None:
+            self.file.flush()
+        change_buffer = _ChangeBuffer()
+        for record, _ in self.__records():
+            # segments spilled by earlier versions have no id
+            document_id = record["id"] if "id" in record else record["doc"]["_id"]
+            change_buffer.append(record["doc"], document_id, record["marker"], record["token"])
+        return change_buffer
+
+    def clear(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.unsynced_events = 0
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.count = 0
+
+    def __records(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as file:
+            data = file.read()
+        offset = 0
+        while offset + 4 <= len(data):
+            size = int.from_bytes(data[offset : offset + 4], "little")
+            if size < 5 or offset + size > len(data):
+                return
+            try:
+                record = bson.decode(data[offset : offset + size])
+            except InvalidBSON:
+                return
+            offset += size
+            yield record, offset
+
+
+def listening(collection_name: str, stop_event: threading.Event | None = None):
     logger = logging.getLogger(f"{__name__}[{collection_name}]")
     db_name = os.getenv("MONGO_DB_NAME")
     logger.debug(f"db_name={db_name}")
@@ -65,23 +219,32 @@ def listening(collection_name: str):
         )
 
     #MongoDB connection and data info
-    client = pymongo.MongoClient(
-        os.getenv("MONGO_CONN_STR"),
-        # 0 or None = no driver‑side socket timeout
-        socketTimeoutMS=None,
-        # (optionally) set a sane connect timeout instead of a read timeout
-        connectTimeoutMS=20000,
-    )
+    client = __get_change_stream_client()
     db = client[db_name]
     collection = db[collection_name]
+    seed_bytes_per_row(collection_name, collection)
 
     #cursor = collection.watch(full_document="updateLookup", resume_after=resume_token, max_await_time_ms=20000)
 
-    # use df  - enables variable schemas
+    # raw change documents, turned into one DataFrame per flush - enables variable schemas
     # and consistent as resume_token is updated when file is pushed to LZ
-    accumulative_df: pd.DataFrame = None
-    init_sync_stat_flag = None
-    last_sync_time: float | None = None
+    change_buffer = _ChangeBuffer()
+    # read up front, a restarted listener of a finished init sync streams from the first turn
+    init_sync_stat_flag = read_from_file(
+        collection_name, INIT_SYNC_STATUS_FILE_NAME, FileType.PICKLE
+    )
+
+    # while init sync runs, events are spilled to a local log instead of kept in memory;
+    # after a crash the listener continues after the last spilled event
+    spill_segment = _SpillSegment(collection_name)
+    spill_resume_token = spill_segment.resume_token or __read_spill_resume_token(
+        collection_name
+    )
+    if not resume_token and spill_resume_token:
+        resume_token = spill_resume_token
+        logger.info(
+            f"interrupted init sync delta detected, continuing after the last spilled change resume_token={resume_token}"
+        )
 
     logger.info(f"start listening to change stream for collection {collection_name}")
     
@@ -91,7 +254,7 @@ def listening(collection_name: str):
         # Prefer resume_after when available; otherwise start at N+1 from init cluster time.
         watch_kwargs = dict(
             full_document="updateLookup",
-            max_await_time_ms=20000,
+            max_await_time_ms=get_change_stream_max_await_time_ms(),
         )
         start_at_operation_time = None
         if resume_token:
@@ -114,6 +277,8 @@ def listening(collection_name: str):
                     resume_token,
                     start_at_operation_time,
                 )
+                if init_sync_stat_flag == "Y":
+                    sync_status.set_phase(collection_name, SYNC_PHASE_CATCH_UP)
                 last_action_time = datetime.now()
                 # Use try_next so we can flush on time threshold even without new events
                 while True:
@@ -121,40 +286,42 @@ def listening(collection_name: str):
                     change = stream.try_next()
                     after = time.time()
 
+                    if stop_event is not None and stop_event.is_set():
+                        # spilled events stay on disk, a restart continues after them
+                        break
+
+                    if init_sync_stat_flag != "Y":
+                        # served from the state cache, init sync writes it through
+                        init_sync_stat_flag = read_from_file(
+                            collection_name,
+                            INIT_SYNC_STATUS_FILE_NAME,
+                            FileType.PICKLE,
+                        )
+
+                    if init_sync_stat_flag == "Y" and not post_init_flush_done:
+                        __post_init_flush(collection_name, logger, spill_segment)
+                        post_init_flush_done = True
+                        sync_status.set_phase(collection_name, SYNC_PHASE_CATCH_UP)
+
                     if change is None:
                         if (datetime.now() - last_action_time >= timedelta(minutes=5)):
                             logger.info("no change; try_next() round-trip took %.3fs", after - before)
                             last_action_time = datetime.now()
                         # No new events in this await interval; consider time-based flush
-                        if (
-                            accumulative_df is not None
-                            and init_sync_stat_flag == "Y"
-                            and last_sync_time is not None
-                        ):
-                            accumulative_df, last_sync_time = process_accumulative_df(
-                                accumulative_df,
+                        if change_buffer and init_sync_stat_flag == "Y":
+                            process_accumulative_df(
+                                change_buffer,
                                 collection_name,
                                 init_sync_stat_flag,
-                                last_sync_time,
                                 time_threshold_in_sec,
-                                resume_token,
                                 logger,
                             )
+                        if init_sync_stat_flag == "Y":
+                            sync_status.set_stream_drained(collection_name)
                         continue
 
                     # ---- We have a real change document here ----
 
-                    if init_sync_stat_flag != "Y":
-                        init_sync_stat_flag = read_from_file(
-                            collection_name,
-                            INIT_SYNC_STATUS_FILE_NAME,
-                            FileType.PICKLE,
-                        )
-
-                    if init_sync_stat_flag == "Y" and not post_init_flush_done:
-                        __post_init_flush(collection_name, logger)
-                        post_init_flush_done = True
-
                     logger.debug("original change from Change Stream:")
                     logger.debug(change)
 
@@ -162,19 +329,20 @@ def listening(collection_name: str):
                     if operationType not in CHANGE_STREAM_OPERATION_MAP:
                         logger.error("ERROR: unsupported operation found: %s", operationType)
                         continue
-
-                    if operationType == "delete":
-                        doc: dict = change["documentKey"]
-                    else:
-                        doc: dict = change["fullDocument"]
-
-                    df = pd.DataFrame([doc])
+                    sync_status.record_received(collection_name, change["clusterTime"])
 
                     # Always update resume_token on every processed change
                     resume_token = change["_id"]
                     logger.debug("resume_token: %s", resume_token)
 
-                    schema_utils.process_dataframe(collection_name, df)
+                    doc = __change_document(change)
+                    if doc is None:
+                        logger.debug(
+                            "skipping %s of a document deleted since: %s",
+                            operationType,
+                            change["documentKey"],
+                        )
+                        continue
 
                     if init_sync_stat_flag != "Y":
                         logger.debug(
@@ -187,30 +355,37 @@ def listening(collection_name: str):
                     else:
                         row_marker_value = CHANGE_STREAM_OPERATION_MAP[operationType]
 
-                    df.insert(0, ROW_MARKER_COLUMN_NAME, [row_marker_value])
-
-                    # Merge into accumulative_df until batch size/time threshold
-                    if accumulative_df is not None:
-                        accumulative_df = pd.concat(
-                            [accumulative_df, df], ignore_index=True
+                    if init_sync_stat_flag != "Y":
+                        # on disk and out of memory until the Temp_ file is written
+                        spill_segment.append(
+                            doc, change["documentKey"]["_id"], row_marker_value, resume_token
                         )
-                        logger.debug("concat accumulative_df result:")
-                        logger.debug(accumulative_df)
-                    else:
-                        logger.info("df created")
-                        accumulative_df = df
-                        last_sync_time = time.time()
+                        if len(spill_segment) >= get_rows_per_file(
+                            collection_name, int(os.getenv("DELTA_SYNC_BATCH_SIZE"))
+                        ):
+                            __roll_spill_segment(collection_name, spill_segment, logger)
+                        sync_status.set_buffered_rows(collection_name, len(spill_segment))
+                        continue
+
+                    # Buffer until batch size/time threshold, schema processing runs once per flush
+                    change_buffer.append(
+                        doc,
+                        change["documentKey"]["_id"],
+                        row_marker_value,
+                        resume_token,
+                        change["clusterTime"],
+                    )
+                    if len(change_buffer) == 1:
                         logger.info(
-                            "last_sync_time when first record added: %s", last_sync_time
+                            "last_sync_time when first record added: %s",
+                            change_buffer.last_sync_time,
                         )
 
-                    accumulative_df, last_sync_time = process_accumulative_df(
-                        accumulative_df,
+                    process_accumulative_df(
+                        change_buffer,
                         collection_name,
                         init_sync_stat_flag,
-                        last_sync_time,
                         time_threshold_in_sec,
-                        resume_token,
                         logger,
                     )
 
@@ -262,8 +437,10 @@ def listening(collection_name: str):
                 )
 
                 # Optional: clear any in-memory batch since we've lost continuity anyway.
-                accumulative_df = None
-                last_sync_time = None
+                change_buffer.clear()
+                # spilled events are still valid, but their token must not be resumed from
+                __roll_spill_segment(collection_name, spill_segment, logger)
+                __remove_spill_resume_token(collection_name)
             else:
                 # Resumable errors: keep the last known resume_token.
                 logger.warning(
@@ -280,6 +457,11 @@ def listening(collection_name: str):
             time.sleep(2)
             continue
 
+        if stop_event is not None and stop_event.is_set():
+            logger.info(f"stopped listening to change stream for collection {collection_name}")
+            client.close()
+            return
+
         # If we ever exit the inner loop *without* an exception:
         # check stream.alive to see if the server closed the cursor.
         if not stream.alive:
@@ -291,31 +473,320 @@ def listening(collection_name: str):
             # Outer while True will reopen
             continue
 
+def listening_database(collection_names: list[str]):
+    """
+    Listen to the changes of several collections with one database change stream.
+
+    Events are filtered on ns.coll, routed to one buffer per collection and flushed
+    like in listening(). The stream resumes from one token stored at the landing zone
+    root, which never moves past the oldest event still buffered; events replayed after
+    a restart are skipped per collection by comparing them with the resume token saved
+    at that collection's last flush (or its init cluster time N+1).
+    """
+    db_name = os.getenv("MONGO_DB_NAME")
+    logger = logging.getLogger(f"{__name__}[{db_name}]")
+    time_threshold_in_sec = float(os.getenv("TIME_THRESHOLD_IN_SEC"))
+
+    change_buffers = {}
+    # last flushed event of each collection, or where its changes start
+    flushed_tokens = {}
+    start_times = {}
+    for collection_name in collection_names:
+        change_buffers[collection_name] = _ChangeBuffer()
+        flushed_tokens[collection_name] = read_from_file(
+            collection_name, DELTA_SYNC_RESUME_TOKEN_FILE_NAME, FileType.PICKLE
+        )
+        init_cluster_time = read_from_file(
+            collection_name, INIT_SYNC_CLUSTER_TIME_FILE_NAME, FileType.PICKLE
+        )
+        if isinstance(init_cluster_time, Timestamp):
+            start_times[collection_name] = next_timestamp(init_cluster_time)
+        # init sync of every collection has finished before this stream is opened
+        __post_init_flush(
+            collection_name, logging.getLogger(f"{__name__}[{collection_name}]")
+        )
+
+    resume_token = read_from_file(
+        "", DATABASE_CHANGE_STREAM_RESUME_TOKEN_FILE_NAME, FileType.PICKLE
+    )
+    if resume_token:
+        logger.info(
+            f"interrupted incremental sync detected, continuing with resume_token={resume_token}"
+        )
+    # last event seen, and per non-empty buffer the last event seen before its first one
+    last_seen_token = resume_token
+    buffer_start_tokens = {}
+    # time all buffers were last checked, an event only checks the buffer it goes to
+    last_flush_check_time = time.time()
+
+    client = __get_change_stream_client()
+    db = client[db_name]
+    for collection_name in collection_names:
+        seed_bytes_per_row(collection_name, db[collection_name])
+    pipeline = [{"$match": {"ns.coll": {"$in": collection_names}}}]
+
+    logger.info(
+        f"start listening to database change stream for {len(collection_names)} collections"
+    )
+
+    while True:
+        watch_kwargs = dict(
+            full_document="updateLookup",
+            max_await_time_ms=get_change_stream_max_await_time_ms(),
+        )
+        start_at_operation_time = None
+        if last_seen_token:
+            # continue after the last event seen, buffered events are kept
+            watch_kwargs["resume_after"] = last_seen_token
+        elif start_times:
+            # the earliest N+1, earlier events of the other collections are skipped
+            start_at_operation_time = min(start_times.values())
+            watch_kwargs["start_at_operation_time"] = start_at_operation_time
+        else:
+            logger.warning(
+                "no resume token or init cluster time for database %s; "
+                "opening change stream from latest (possible data gap)",
+                db_name,
+            )
+
+        try:
+            with db.watch(pipeline, **watch_kwargs) as stream:
+                logger.info(
+                    "opened database change stream with resume_token=%s start_at_operation_time=%s",
+                    last_seen_token,
+                    start_at_operation_time,
+                )
+                for collection_name in collection_names:
+                    sync_status.set_phase(collection_name, SYNC_PHASE_CATCH_UP)
+                while True:
+                    change = stream.try_next()
+
+                    if (
+                        change is None
+                        or time.time() - last_flush_check_time
+                        >= DATABASE_CHANGE_STREAM_FLUSH_CHECK_INTERVAL_SEC
+                    ):
+                        # time-based flush of every collection, also while another one has
+                        # steady traffic, so its start token does not hold the resume token back
+                        resume_token = __flush_change_buffers(
+                            change_buffers,
+                            buffer_start_tokens,
+                            flushed_tokens,
+                            time_threshold_in_sec,
+                            last_seen_token,
+                            resume_token,
+                        )
+                        last_flush_check_time = time.time()
+
+                    if change is None:
+                        for collection_name in collection_names:
+                            sync_status.set_stream_drained(collection_name)
+                        continue
+
+                    previous_token = last_seen_token
+                    last_seen_token = change["_id"]
+                    collection_name = change["ns"]["coll"]
+
+                    operationType = change["operationType"]
+                    if operationType not in CHANGE_STREAM_OPERATION_MAP:
+                        logger.error("ERROR: unsupported operation found: %s", operationType)
+                        continue
+                    sync_status.record_received(collection_name, change["clusterTime"])
+
+                    if __is_replayed_change(
+                        change,
+                        flushed_tokens.get(collection_name),
+                        start_times.get(collection_name),
+                    ):
+                        logger.debug(
+                            "skipping change of %s already in the landing zone", collection_name
+                        )
+                        continue
+
+                    doc = __change_document(change)
+                    if doc is None:
+                        logger.debug(
+                            "skipping %s of a document of %s deleted since: %s",
+                            operationType,
+                            collection_name,
+                            change["documentKey"],
+                        )
+                        continue
+
+                    change_buffer = change_buffers[collection_name]
+                    if not change_buffer:
+                        buffer_start_tokens[collection_name] = previous_token
+                    change_buffer.append(
+                        doc,
+                        change["documentKey"]["_id"],
+                        CHANGE_STREAM_OPERATION_MAP[operationType],
+                        last_seen_token,
+                        change["clusterTime"],
+                    )
+
+                    resume_token = __flush_change_buffers(
+                        {collection_name: change_buffer},
+                        buffer_start_tokens,
+                        flushed_tokens,
+                        time_threshold_in_sec,
+                        last_seen_token,
+                        resume_token,
+                    )
+
+        except (
+            pymongo.errors.ConnectionFailure,
+            pymongo.errors.CursorNotFound,
+            pymongo.errors.OperationFailure,
+            PyMongoError,
+        ) as exc:
+            is_non_resumable = (
+                isinstance(exc, pymongo.errors.OperationFailure)
+                and (
+                    exc.code == 286  # ChangeStreamHistoryLost
+                    or exc.has_error_label("NonResumableChangeStreamError")
+                )
+            )
+
+            if is_non_resumable:
+                logger.error(
+                    "Non-resumable Change Stream error (ChangeStreamHistoryLost) for database %s: %s. "
+                    "Clearing resume token; will reopen from the init cluster times "
+                    "(history may still be too old — gap possible).",
+                    db_name,
+                    exc,
+                    exc_info=True,
+                )
+                resume_token = None
+                last_seen_token = None
+                write_to_file(
+                    None,
+                    "",
+                    DATABASE_CHANGE_STREAM_RESUME_TOKEN_FILE_NAME,
+                    FileType.PICKLE,
+                )
+                for change_buffer in change_buffers.values():
+                    change_buffer.clear()
+                buffer_start_tokens.clear()
+            else:
+                # Resumable errors: keep the buffers and the last seen resume token.
+                logger.warning(
+                    "Resumable change stream error for database %s: %s; "
+                    "will reopen with last resume_token=%s",
+                    db_name,
+                    exc,
+                    last_seen_token,
+                    exc_info=True,
+                )
+
+            time.sleep(2)
+            continue
+
+
+def __flush_change_buffers(
+    change_buffers,
+    buffer_start_tokens,
+    flushed_tokens,
+    time_threshold_in_sec,
+    last_seen_token,
+    resume_token,
+):
+    """
+    Flush the buffers that reached batch size or time threshold and persist the database
+    resume token if it can move. Returns the current database resume token.
+    """
+    flushed = False
+    for collection_name, change_buffer in change_buffers.items():
+        if not change_buffer:
+            continue
+        buffer_resume_token = change_buffer.resume_token
+        process_accumulative_df(
+            change_buffer,
+            collection_name,
+            "Y",
+            time_threshold_in_sec,
+            logging.getLogger(f"{__name__}[{collection_name}]"),
+        )
+        if not change_buffer:
+            flushed_tokens[collection_name] = buffer_resume_token
+            buffer_start_tokens.pop(collection_name, None)
+            flushed = True
+    if not flushed:
+        return resume_token
+
+    # resume right after the last event seen, unless a buffer still holds older events
+    pending_start_tokens = list(buffer_start_tokens.values())
+    if last_seen_token is None or None in pending_start_tokens:
+        return resume_token
+    safe_token = min(
+        pending_start_tokens + [last_seen_token], key=lambda token: token["_data"]
+    )
+    if safe_token != resume_token:
+        write_to_file(
+            safe_token,
+            "",
+            DATABASE_CHANGE_STREAM_RESUME_TOKEN_FILE_NAME,
+            FileType.PICKLE,
+        )
+    return safe_token
+
+
+def __change_document(change) -> dict | None:
+    """
+    The row of a change event: the document key of a delete, otherwise the full document.
+    None for an update whose document was deleted before updateLookup read it, its
+    delete event follows in the stream.
+    """
+    if change["operationType"] == "delete":
+        return change["documentKey"]
+    return change.get("fullDocument")
+
+
+def __is_replayed_change(change, flushed_token, start_time) -> bool:
+    """True for an event of a collection that is already in the landing zone."""
+    if flushed_token:
+        # resume tokens sort by their hex encoded _data
+        return change["_id"]["_data"] <= flushed_token["_data"]
+    if start_time is not None:
+        return change["clusterTime"] < start_time
+    return False
+
+
+def __get_change_stream_client() -> pymongo.MongoClient:
+    return pymongo.MongoClient(
+        os.getenv("MONGO_CONN_STR"),
+        # 0 or None = no driver‑side socket timeout
+        socketTimeoutMS=None,
+        # (optionally) set a sane connect timeout instead of a read timeout
+        connectTimeoutMS=20000,
+    )
+
 ##>> enhancement to check time elapsed even if no event comes - no waiting indefinitely for a change
-def process_accumulative_df(accumulative_df, collection_name, init_sync_stat_flag, last_sync_time, time_threshold_in_sec, resume_token, logger):
+def process_accumulative_df(change_buffer, collection_name, init_sync_stat_flag, time_threshold_in_sec, logger):
     if not init_sync_stat_flag == "Y":
-        if (accumulative_df is not None
+        if (change_buffer
             and (
-                (accumulative_df.shape[0] >= int(os.getenv("DELTA_SYNC_BATCH_SIZE")))
+                (len(change_buffer) >= get_rows_per_file(collection_name, int(os.getenv("DELTA_SYNC_BATCH_SIZE"))))
             )
         ):
-            prefix = TEMP_PREFIX_DURING_INIT
-            parquet_full_path_filename = get_temp_parquet_full_path_filename(
-                collection_name, prefix=prefix
-            )
-            logger.info(f"writing TEMP parquet file: {parquet_full_path_filename}")
-            schema_utils.finalize_dataframe_for_parquet(
-                collection_name, accumulative_df
-            )
-            accumulative_df.to_parquet(parquet_full_path_filename)
-            accumulative_df = None
+            __write_temp_parquet(collection_name, change_buffer, logger)
     else:        
-        if (accumulative_df is not None
+        if (change_buffer
         ):
-            if(
-                (accumulative_df.shape[0] >= int(os.getenv("DELTA_SYNC_BATCH_SIZE")))
-                or ((time.time() - last_sync_time) >= time_threshold_in_sec)
-            ):
+            max_rows = get_rows_per_file(collection_name, int(os.getenv("DELTA_SYNC_BATCH_SIZE")))
+            flush_controller = get_flush_controller(collection_name)
+            if flush_controller:
+                flush_due = flush_controller.should_flush(
+                    len(change_buffer), change_buffer.last_sync_time, max_rows
+                )
+            else:
+                flush_due = (
+                    (len(change_buffer) >= max_rows)
+                    or ((time.time() - change_buffer.last_sync_time) >= time_threshold_in_sec)
+                )
+            if flush_due:
+                flush_start_time = time.time()
+                flushed_events = len(change_buffer)
+                first_event_time = change_buffer.last_sync_time
                 prefix = ""
                 last_parquet_file_num = read_from_file(
                     collection_name, LAST_PARQUET_FILE_NUMBER, FileType.PICKLE
@@ -326,14 +797,31 @@ def process_accumulative_df(accumulative_df, collection_name, init_sync_stat_fla
                 parquet_full_path_filename = get_parquet_full_path_filename(collection_name, last_parquet_file_num)
 
                 logger.info(f"writing parquet file: {parquet_full_path_filename}")
+                accumulative_df = __change_buffer_to_dataframe(collection_name, change_buffer)
                 schema_utils.finalize_dataframe_for_parquet(
                     collection_name, accumulative_df
                 )
+                write_start_time = time.time()
+                STAGE_DURATION.observe(
+                    write_start_time - flush_start_time, collection=collection_name, sync="delta", stage="transform"
+                )
                 # Write the parquet file
-                accumulative_df.to_parquet(parquet_full_path_filename)
+                write_parquet(accumulative_df, parquet_full_path_filename)
+                record_parquet_file(collection_name, parquet_full_path_filename, len(accumulative_df))
                 accumulative_df = None
+                resume_token = change_buffer.resume_token
+                cluster_time = change_buffer.cluster_time
+                change_buffer.clear()
 
+                upload_start_time = time.time()
+                STAGE_DURATION.observe(
+                    upload_start_time - write_start_time, collection=collection_name, sync="delta", stage="write"
+                )
                 push_file_to_lz(parquet_full_path_filename, collection_name)
+                upload_sec = time.time() - upload_start_time
+                STAGE_DURATION.observe(
+                    upload_sec, collection=collection_name, sync="delta", stage="push"
+                )
             #    resume_token = change["_id"]
                 logger.info(f"writing resume_token into file: {resume_token}")
                 write_to_file(
@@ -350,9 +838,147 @@ def process_accumulative_df(accumulative_df, collection_name, init_sync_stat_fla
                     LAST_PARQUET_FILE_NUMBER,
                     FileType.PICKLE,
             )
-    return accumulative_df, last_sync_time
+                sync_status.record_published(collection_name, last_parquet_file_num, cluster_time)
+                if flush_controller:
+                    flush_controller.record_flush(
+                        flushed_events,
+                        first_event_time,
+                        time.time() - flush_start_time,
+                        upload_sec,
+                    )
+    sync_status.set_buffered_rows(collection_name, len(change_buffer))
+
+
+def __write_temp_parquet(collection_name, change_buffer, logger):
+    """Write the buffered events of a collection still in init sync to a local Temp_ parquet file."""
+    prefix = TEMP_PREFIX_DURING_INIT
+    parquet_full_path_filename = get_temp_parquet_full_path_filename(
+        collection_name, prefix=prefix
+    )
+    logger.info(f"writing TEMP parquet file: {parquet_full_path_filename}")
+    accumulative_df = __change_buffer_to_dataframe(collection_name, change_buffer)
+    schema_utils.finalize_dataframe_for_parquet(
+        collection_name, accumulative_df
+    )
+    write_parquet(accumulative_df, parquet_full_path_filename)
+    record_parquet_file(collection_name, parquet_full_path_filename, len(accumulative_df))
+    change_buffer.clear()
+
+
+def __roll_spill_segment(collection_name, spill_segment, logger):
+    """Turn the spilled events into a Temp_ parquet file and start a new segment."""
+    if not spill_segment:
+        return
+    change_buffer = spill_segment.read()
+    logger.info(f"rolling {len(change_buffer)} spilled change events into a TEMP parquet file")
+    __write_temp_parquet(collection_name, change_buffer, logger)
+    # the Temp_ file now holds everything up to this token, keep it for a restart
+    __write_spill_resume_token(collection_name, spill_segment.resume_token)
+    spill_segment.clear()
+
+
+def __spill_resume_token_path(collection_name) -> str:
+    return os.path.join(get_table_dir(collection_name), DELTA_SYNC_SPILL_RESUME_TOKEN_FILE_NAME)
+
+
+def __read_spill_resume_token(collection_name):
+    """Resume token of the last event in a local Temp_ file, None if there is none."""
+    try:
+        with open(__spill_resume_token_path(collection_name), "rb") as file:
+            return pickle.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def __write_spill_resume_token(collection_name, resume_token):
+    # local only like the Temp_ files it belongs to; replaced atomically
+    token_path = __spill_resume_token_path(collection_name)
+    with open(token_path + ".tmp", "wb") as file:
+        pickle.dump(resume_token, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(token_path + ".tmp", token_path)
 
-def __post_init_flush(table_name: str, logger):
+
+def __remove_spill_resume_token(collection_name):
+    token_path = __spill_resume_token_path(collection_name)
+    if os.path.exists(token_path):
+        os.remove(token_path)
+
+
+def __change_buffer_to_dataframe(collection_name, change_buffer) -> pd.DataFrame:
+    """One DataFrame for all buffered events: decode, schema processing, then the row markers."""
+    logger = logging.getLogger(f"{__name__}[{collection_name}]")
+    logger.debug(f"building DataFrame from {len(change_buffer)} buffered change events")
+    documents, row_markers = change_buffer.documents, change_buffer.row_markers
+    if os.getenv("DELTA_SYNC_COALESCE"):
+        documents, row_markers = __coalesce_changes(
+            documents, change_buffer.document_ids, row_markers
+        )
+        logger.debug(
+            f"coalesced {len(change_buffer)} change events into {len(documents)} rows"
+        )
+    df = documents_to_dataframe(collection_name, documents)
+    schema_utils.process_dataframe(collection_name, df)
+    df.insert(0, ROW_MARKER_COLUMN_NAME, row_markers)
+    return df
+
+
+def __coalesce_changes(documents: list, document_ids: list, row_markers: list) -> tuple[list, list]:
+    """
+    Keep one row per documentKey _id: the last state of the document in this batch, at the
+    position of its last event. The row marker is delete if the last event is a
+    delete, insert if the document did not exist before the batch (first event is an
+    insert), upsert if any event was an upsert (init sync running), otherwise update.
+    """
+    insert_marker = CHANGE_STREAM_OPERATION_MAP["insert"]
+    update_marker = CHANGE_STREAM_OPERATION_MAP["update"]
+    delete_marker = CHANGE_STREAM_OPERATION_MAP["delete"]
+    upsert_marker = CHANGE_STREAM_OPERATION_MAP_WHEN_INIT["insert"]
+    # key -> [index of last event, first row marker, upsert seen]
+    states = {}
+    for index, (document_id, row_marker) in enumerate(zip(document_ids, row_markers)):
+        key = __coalesce_key(document_id)
+        state = states.get(key)
+        if state is None:
+            states[key] = [index, row_marker, row_marker == upsert_marker]
+        else:
+            state[0] = index
+            state[2] = state[2] or row_marker == upsert_marker
+    with __coalesce_stats_lock:
+        __coalesce_stats["events"] += len(documents)
+        __coalesce_stats["rows"] += len(states)
+        __coalesce_stats["rows_eliminated"] += len(documents) - len(states)
+    if len(states) == len(documents):
+        return documents, row_markers
+    coalesced_documents, coalesced_row_markers = [], []
+    for index, first_row_marker, upsert_seen in sorted(states.values()):
+        if row_markers[index] == delete_marker:
+            row_marker = delete_marker
+        elif first_row_marker == insert_marker:
+            row_marker = insert_marker
+        elif upsert_seen:
+            row_marker = upsert_marker
+        else:
+            row_marker = update_marker
+        coalesced_documents.append(documents[index])
+        coalesced_row_markers.append(row_marker)
+    return coalesced_documents, coalesced_row_markers
+
+
+def __coalesce_key(document_id):
+    # embedded document _ids are not hashable, and True must not match 1
+    if isinstance(document_id, (dict, list)):
+        return bson.encode({"_id": document_id})
+    return document_id.__class__, document_id
+
+
+def get_change_coalescing_stats() -> dict:
+    """Counters of DELTA_SYNC_COALESCE: events in, rows written, rows_eliminated."""
+    with __coalesce_stats_lock:
+        return dict(__coalesce_stats)
+
+def __post_init_flush(table_name: str, logger, spill_segment=None):
     if not logger:
         logger = logging.getLogger(f"{__name__}[{table_name}]")
     logger.info(f"begin post init flush of delta change for collection {table_name}")
@@ -360,6 +986,10 @@ def __post_init_flush(table_name: str, logger):
     table_dir = get_table_dir(table_name)
     if not os.path.exists(table_dir):
         return
+    # events still in the spill log go out with the Temp_ files
+    if spill_segment is None:
+        spill_segment = _SpillSegment(table_name)
+    __roll_spill_segment(table_name, spill_segment, logger)
     temp_parquet_filename_list = sorted(
         [
             filename
@@ -368,26 +998,49 @@ def __post_init_flush(table_name: str, logger):
             and os.path.splitext(filename)[0].startswith(TEMP_PREFIX_DURING_INIT)
         ]
     )
+    # changed to get last parquet file number from LZ for resilience
+    last_parquet_file_num = read_from_file(
+        table_name, LAST_PARQUET_FILE_NUMBER, FileType.PICKLE
+    )
+    if not last_parquet_file_num:
+        last_parquet_file_num = 0
+    # compact the Temp_ files, in order, into files of about PARQUET_TARGET_FILE_SIZE_MB
+    target_file_size = get_target_file_size_bytes()
+    temp_parquet_groups = []
+    group_size = 0
     for temp_parquet_filename in temp_parquet_filename_list:
         temp_parquet_full_path = os.path.join(table_dir, temp_parquet_filename)
-        # changed to get last parquet file number from LZ for resilience
-        #new_parquet_full_path = get_parquet_full_path_filename(table_name)
-        last_parquet_file_num = read_from_file(
-            table_name, LAST_PARQUET_FILE_NUMBER, FileType.PICKLE
-        )
-        if not last_parquet_file_num:
-            last_parquet_file_num = 0
-        new_parquet_full_path = get_parquet_full_path_filename(table_name, last_parquet_file_num)   
-        logger.debug("renaming temp parquet file")
-        logger.debug(f"old name: {temp_parquet_full_path}")
-        logger.debug(f"new name: {new_parquet_full_path}")
+        file_size = os.path.getsize(temp_parquet_full_path)
+        if not temp_parquet_groups or group_size + file_size > target_file_size:
+            temp_parquet_groups.append([])
+            group_size = 0
+        temp_parquet_groups[-1].append(temp_parquet_full_path)
+        group_size += file_size
+    if temp_parquet_filename_list:
         logger.info(
-            f"renaming parquet file from {temp_parquet_full_path} to {new_parquet_full_path}"
+            f"compacting {len(temp_parquet_filename_list)} temp parquet files into {len(temp_parquet_groups)} files"
         )
-        os.rename(temp_parquet_full_path, new_parquet_full_path)
+    # the Temp_ files are kept until the counter is written: a restart in between
+    # publishes the same content under the same numbers again
+    for temp_parquet_group in temp_parquet_groups:
+        new_parquet_full_path = get_parquet_full_path_filename(table_name, last_parquet_file_num)
+        if os.path.exists(new_parquet_full_path):
+            os.remove(new_parquet_full_path)
+        if len(temp_parquet_group) == 1:
+            logger.info(
+                f"publishing parquet file {temp_parquet_group[0]} as {new_parquet_full_path}"
+            )
+            # a copy, not a link: /home on App Service does not support hard links
+            shutil.copyfile(temp_parquet_group[0], new_parquet_full_path)
+        else:
+            logger.info(
+                f"merging {len(temp_parquet_group)} temp parquet files into {new_parquet_full_path}"
+            )
+            merge_parquet_files(temp_parquet_group, new_parquet_full_path)
         push_file_to_lz(new_parquet_full_path, table_name)
-        # write last parquet file number to file
         last_parquet_file_num +=  1
+    if temp_parquet_groups:
+        # write last parquet file number to file
         logger.info(f"writing last parquet number into file: {last_parquet_file_num}")
         write_to_file(
             last_parquet_file_num,
@@ -395,3 +1048,23 @@ def __post_init_flush(table_name: str, logger):
             LAST_PARQUET_FILE_NUMBER,
             FileType.PICKLE,
         )
+        # every event received so far was spilled into the Temp_ files
+        sync_status.record_published(
+            table_name,
+            last_parquet_file_num,
+            sync_status.get_last_received_cluster_time(table_name),
+        )
+        sync_status.set_buffered_rows(table_name, 0)
+    for temp_parquet_filename in temp_parquet_filename_list:
+        os.remove(os.path.join(table_dir, temp_parquet_filename))
+    # the published Temp_ files hold every change up to the spilled token
+    spill_resume_token = __read_spill_resume_token(table_name)
+    if spill_resume_token:
+        logger.info(f"writing resume_token into file: {spill_resume_token}")
+        write_to_file(
+            spill_resume_token,
+            table_name,
+            DELTA_SYNC_RESUME_TOKEN_FILE_NAME,
+            FileType.PICKLE,
+        )
+        __remove_spill_resume_token(table_name)
@@ -0,0 +1,169 @@
+"""Pooled, retrying HTTP client shared by every landing zone (ADLS Gen2 DFS) call."""
+
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+from constants import (
+    LZ_HTTP_MAX_RETRIES_DEFAULT,
+    LZ_HTTP_TIMEOUT_SEC,
+    LZ_HTTP_BACKOFF_BASE_SEC,
+    LZ_HTTP_BACKOFF_MAX_SEC,
+    LZ_HTTP_RETRY_STATUS_CODES,
+    LZ_HTTP_RETRY_STATUS_CODES_NOT_IDEMPOTENT,
+    LZ_UPLOAD_PARALLEL_CHUNKS_DEFAULT,
+)
+from metrics import LZ_HTTP_RESPONSES
+from utils import get_non_negative_int_env, get_positive_int_env
+
+logger = logging.getLogger(__name__)
+
+__client = None
+__client_lock = threading.Lock()
+
+
+class LandingZoneClient:
+    """
+    Keep-alive requests.Session with one connection pool per OneLake host.
+
+    Throttling and transient server errors (LZ_HTTP_RETRY_STATUS_CODES) and failed
+    connects are retried with exponential backoff, honouring Retry-After. A request that
+    is not idempotent, e.g. the rename of a _TEMP file, may already have taken effect
+    after a 408 / 500 / 502 / 504 response, a timeout or a connection lost after it was
+    sent, so it is only retried after 429 / 503 or a failed connect.
+    """
+
+    def __init__(self, pool_size: int, max_retries: int):
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(
+        self, method: str, url: str, idempotent: bool = True, **kwargs
+    ) -> requests.Response:
+        kwargs.setdefault("timeout", LZ_HTTP_TIMEOUT_SEC)
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                LZ_HTTP_RESPONSES.inc(method=method, status="connection_error")
+                # nothing was sent if the connection could not be opened
+                reason = getattr(e.args[0], "reason", None) if e.args else None
+                request_not_sent = isinstance(
+                    e, requests.exceptions.ConnectTimeout
+                ) or isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+                if attempt >= self.max_retries or not (idempotent or request_not_sent):
+                    raise
+                delay = self.__backoff(attempt)
+                logger.warning(
+                    f"{method} to landing zone failed ({e.__class__.__name__}), "
+                    + f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s"
+                )
+            except requests.exceptions.Timeout as e:
+                LZ_HTTP_RESPONSES.inc(method=method, status="timeout")
+                if attempt >= self.max_retries or not idempotent:
+                    raise
+                delay = self.__backoff(attempt)
+                logger.warning(
+                    f"{method} to landing zone timed out, "
+                    + f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s"
+                )
+            else:
+                LZ_HTTP_RESPONSES.inc(method=method, status=response.status_code)
+                retry_status_codes = (
+                    LZ_HTTP_RETRY_STATUS_CODES
+                    if idempotent
+                    else LZ_HTTP_RETRY_STATUS_CODES_NOT_IDEMPOTENT
+                )
+                if (
+                    response.status_code not in retry_status_codes
+                    or attempt >= self.max_retries
+                ):
+                    return response
+                delay = self.__retry_after(response)
+                if delay is None:
+                    delay = self.__backoff(attempt)
+                logger.warning(
+                    f"{method} to landing zone returned {response.status_code}, "
+                    + f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s"
+                )
+                response.close()
+            attempt += 1
+            time.sleep(delay)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    @staticmethod
+    def __backoff(attempt: int) -> float:
+        return min(LZ_HTTP_BACKOFF_MAX_SEC, LZ_HTTP_BACKOFF_BASE_SEC * 2**attempt)
+
+    @staticmethod
+    def __retry_after(response: requests.Response) -> float | None:
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            delay = float(value)
+        except ValueError:
+            try:
+                delay = (
+                    parsedate_to_datetime(value) - datetime.now(timezone.utc)
+                ).total_seconds()
+            except (TypeError, ValueError):
+                return None
+        return min(LZ_HTTP_BACKOFF_MAX_SEC, max(0.0, delay))
+
+
+def get_lz_client() -> LandingZoneClient:
+    """Process-wide landing zone client, created on first use."""
+    global __client
+    with __client_lock:
+        if __client is None:
+            pool_size = get_positive_int_env("LZ_HTTP_POOL_SIZE", __get_default_pool_size())
+            # 0 sends every request once
+            max_retries = get_non_negative_int_env(
+                "LZ_HTTP_MAX_RETRIES", LZ_HTTP_MAX_RETRIES_DEFAULT
+            )
+            logger.info(
+                f"creating landing zone HTTP client, pool_size={pool_size}, max_retries={max_retries}"
+            )
+            __client = LandingZoneClient(pool_size, max_retries)
+        return __client
+
+
+def __get_default_pool_size() -> int:
+    """
+    Connections the init sync workers use at the same time: per collection synced at once,
+    the parallel chunk uploads plus the transformers, which write schema and log files.
+    """
+    collections = get_positive_int_env("INIT_SYNC_MAX_WORKERS", 1)
+    upload_workers = get_positive_int_env(
+        "LZ_UPLOAD_PARALLEL_CHUNKS", LZ_UPLOAD_PARALLEL_CHUNKS_DEFAULT
+    )
+    # like init_sync: one transformer thread per worker process
+    transform_workers = max(
+        get_positive_int_env("INIT_SYNC_TRANSFORM_WORKERS", 1),
+        get_non_negative_int_env("INIT_SYNC_TRANSFORM_PROCESSES", 0),
+    )
+    return collections * (upload_workers + transform_workers)
@@ -0,0 +1,84 @@
+"""Pace parquet publishing on how fast Fabric drains the landing zone table folder."""
+
+import logging
+import os
+import time
+
+from constants import (
+    LZ_MAX_IN_FLIGHT_FILES_DEFAULT,
+    LZ_FLOW_CONTROL_MAX_WAIT_SEC_DEFAULT,
+    LZ_FLOW_CONTROL_MIN_POLL_SEC,
+    LZ_FLOW_CONTROL_MAX_POLL_SEC,
+    LZ_FLOW_CONTROL_FALLBACK_DELAY_SEC,
+)
+from push_file_to_lz import list_files_from_lz
+from utils import get_positive_int_env
+
+logger = logging.getLogger(__name__)
+
+
+def count_pending_parquet_files(table_name: str) -> int | None:
+    """
+    Number of data parquet files Fabric has not picked up yet.
+
+    Fabric moves processed files out of the table folder, so every numbered
+    parquet file still directly under it is in flight. None if listing failed.
+    """
+    file_names = list_files_from_lz(table_name)
+    if file_names is None:
+        return None
+    return sum(
+        1
+        for file_name in file_names
+        if os.path.splitext(file_name)[1] == ".parquet"
+        and os.path.splitext(file_name)[0].isnumeric()
+    )
+
+
+def wait_for_lz_capacity(table_name: str, table_logger: logging.Logger = None) -> None:
+    """
+    Block until fewer than LZ_MAX_IN_FLIGHT_FILES parquet files are pending in the
+    landing zone table folder, polling with exponential backoff.
+
+    Gives up waiting after LZ_FLOW_CONTROL_MAX_WAIT_SEC, and falls back to a fixed
+    delay when the folder can not be listed.
+    """
+    if os.getenv("DEBUG__SKIP_PUSH_TO_LZ"):
+        return
+    table_logger = table_logger or logger
+    max_in_flight = get_positive_int_env(
+        "LZ_MAX_IN_FLIGHT_FILES", LZ_MAX_IN_FLIGHT_FILES_DEFAULT
+    )
+    max_wait_sec = get_positive_int_env(
+        "LZ_FLOW_CONTROL_MAX_WAIT_SEC", LZ_FLOW_CONTROL_MAX_WAIT_SEC_DEFAULT
+    )
+    deadline = time.time() + max_wait_sec
+    poll_sec = LZ_FLOW_CONTROL_MIN_POLL_SEC
+    while True:
+        try:
+            pending = count_pending_parquet_files(table_name)
+        except Exception as e:
+            table_logger.warning(f"Error listing landing zone folder: {str(e)}")
+            pending = None
+        if pending is None:
+            table_logger.warning(
+                f"can not observe landing zone state, waiting {LZ_FLOW_CONTROL_FALLBACK_DELAY_SEC}s"
+            )
+            time.sleep(LZ_FLOW_CONTROL_FALLBACK_DELAY_SEC)
+            return
+        if pending < max_in_flight:
+            table_logger.debug(f"{pending} parquet files pending in landing zone")
+            return
+        if time.time() >= deadline:
+            table_logger.warning(
+                f"{pending} parquet files still pending in landing zone after "
+                f"{max_wait_sec}s, publishing anyway"
+            )
+            return
+        table_logger.info(
+            f"{pending} parquet files pending in landing zone (max {max_in_flight}), "
+            f"waiting {poll_sec}s"
+        )
+        time.sleep(poll_sec)
+        poll_sec = min(poll_sec * 2, LZ_FLOW_CONTROL_MAX_POLL_SEC)
+
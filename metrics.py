@@ -0,0 +1,193 @@
+"""Process-wide metrics in the Prometheus text exposition format, served on /metrics by app.py."""
+
+import math
+import threading
+
+from constants import METRICS_PREFIX, METRICS_DURATION_BUCKETS_SEC
+
+__metrics = []
+__stats_sources = []
+__registry_lock = threading.Lock()
+
+
+class _Metric:
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = METRICS_PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def label_values(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        for label_values, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labelnames, label_values)), value
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets=METRICS_DURATION_BUCKETS_SEC):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            # [count per bucket..., count in +Inf, sum]
+            counts = self.values.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self.lock:
+            values = {key: list(counts) for key, counts in self.values.items()}
+        for label_values, counts in sorted(values.items()):
+            labels = dict(zip(self.labelnames, label_values))
+            for bound, count in zip(self.buckets, counts):
+                yield self.name + "_bucket", {**labels, "le": str(float(bound))}, count
+            yield self.name + "_bucket", {**labels, "le": "+Inf"}, counts[-2]
+            yield self.name + "_count", labels, counts[-2]
+            yield self.name + "_sum", labels, counts[-1]
+
+
+def counter(name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+    return __register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+    return __register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: tuple = (), buckets=METRICS_DURATION_BUCKETS_SEC) -> Histogram:
+    return __register(Histogram(name, documentation, labelnames, buckets))
+
+
+def register_stats(name: str, documentation: str, get_stats, labelname: str = None):
+    """
+    Expose an existing stats function as gauges, one per key: name_<key>. With labelname,
+    get_stats returns {label value: {key: value}}, e.g. per collection.
+    """
+    with __registry_lock:
+        __stats_sources.append((METRICS_PREFIX + name, documentation, get_stats, labelname))
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text format (version 0.0.4)."""
+    with __registry_lock:
+        metrics = list(__metrics)
+        stats_sources = list(__stats_sources)
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+        for sample_name, labels, value in metric.samples():
+            lines.append(__format_sample(sample_name, labels, value))
+    for name, documentation, get_stats, labelname in stats_sources:
+        stats = get_stats()
+        if labelname:
+            rows = [({labelname: label}, values) for label, values in sorted(stats.items())]
+        else:
+            rows = [({}, stats)]
+        keys = sorted(
+            {
+                key
+                for _, values in rows
+                for key, value in values.items()
+                if isinstance(value, (int, float))
+            }
+        )
+        for key in keys:
+            sample_name = f"{name}_{key}"
+            lines.append(f"# HELP {sample_name} {documentation}: {key}")
+            lines.append(f"# TYPE {sample_name} gauge")
+            for labels, values in rows:
+                if key in values:
+                    lines.append(__format_sample(sample_name, labels, values[key]))
+    return "\n".join(lines) + "\n"
+
+
+def __register(metric: _Metric) -> _Metric:
+    with __registry_lock:
+        __metrics.append(metric)
+    return metric
+
+
+def __format_sample(name: str, labels: dict, value) -> str:
+    if labels:
+        label_text = ",".join(
+            f'{label}="{__escape_label_value(label_value)}"' for label, label_value in labels.items()
+        )
+        return f"{name}{{{label_text}}} {__format_value(value)}"
+    return f"{name} {__format_value(value)}"
+
+
+def __escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def __format_value(value) -> str:
+    value = float(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+DOCUMENTS_READ = counter(
+    "documents_read_total", "Documents read by init sync", ("collection",)
+)
+STAGE_DURATION = histogram(
+    "stage_duration_seconds",
+    "Duration of one batch in a stage: read, transform, write or push",
+    ("collection", "sync", "stage"),
+)
+BYTES_UPLOADED = counter(
+    "bytes_uploaded_total", "Bytes uploaded to the landing zone", ("collection",)
+)
+FILES_PUBLISHED = counter(
+    "files_published_total", "Parquet files published to the landing zone", ("collection",)
+)
+CHANGE_STREAM_LAG = gauge(
+    "change_stream_lag_seconds",
+    "Wall clock minus clusterTime of the last change event received",
+    ("collection",),
+)
+CHANGE_BUFFER_DEPTH = gauge(
+    "change_buffer_depth", "Change events buffered and not yet written", ("collection",)
+)
+LZ_HTTP_RESPONSES = counter(
+    "lz_http_responses_total",
+    "Landing zone and token HTTP responses, including retried ones, by status code",
+    ("method", "status"),
+)
@@ -2,21 +2,31 @@ import logging.handlers
 import os
 import logging
 from threading import Event, Thread
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pymongo
-from pymongo.errors import ServerSelectionTimeoutError
+from pymongo.errors import PyMongoError, ServerSelectionTimeoutError
 from dotenv import load_dotenv
 import json
 
 from init_sync import init_sync
-from listening import listening
+from listening import listening, listening_database
 from schema_utils import init_table_schema
 from constants import (
     METADATA_FILE_NAME,
     PARTNER_EVENTS_FILE_NAME,
     APP_VERSION,
+    CHANGE_STREAM_MODE_COLLECTION,
+    CHANGE_STREAM_MODE_DATABASE,
+    INIT_SYNC_ORDER_LARGEST_FIRST,
+    INIT_SYNC_ORDER_SMALLEST_FIRST,
+    SYNC_PHASE_BOOTSTRAP,
+    SYNC_PHASE_INIT,
+    SYNC_PHASE_CATCH_UP,
 )
 from push_file_to_lz import push_file_to_lz, get_file_from_lz_root, push_file_to_lz_root
 from file_utils import FileType, read_from_file
+from utils import get_positive_int_env
+import sync_status
 
 def mirror():
     load_dotenv()
@@ -83,44 +93,145 @@ def mirror():
     for non_exists_collection in removed_collections:
         logger.warning(f"removed non-exists collection {non_exists_collection}")
 
-    __ensure_partner_events_in_lz(logger)
+    change_stream_mode = os.getenv("CHANGE_STREAM_MODE", CHANGE_STREAM_MODE_COLLECTION)
+    if change_stream_mode not in (CHANGE_STREAM_MODE_COLLECTION, CHANGE_STREAM_MODE_DATABASE):
+        raise ValueError(f"Invalid CHANGE_STREAM_MODE: {change_stream_mode}")
+    synced_collections = []
 
-    for collection_name in collection_list:
-    #>>># changes to write metadata.json a the first file - 6Mar2025
-        metadata_file_exists = read_from_file(
-            collection_name, METADATA_FILE_NAME, FileType.TEXT
-        )
-        if not metadata_file_exists: 
-            metadata_json_path = os.path.join(
-                    os.path.dirname(os.path.abspath(__file__)), METADATA_FILE_NAME
-                )
-            logger.info("writing metadata file to LZ")
-            push_file_to_lz(metadata_json_path, collection_name)
+    __ensure_partner_events_in_lz(logger)
 
-        try:
-            init_table_schema(collection_name)
-        except Exception:
-            logger.exception(
-                "schema bootstrap failed for collection %s; continuing with init sync",
-                collection_name,
-            )
+    init_sync_order = os.getenv("INIT_SYNC_ORDER", "")
+    if init_sync_order:
+        if init_sync_order not in (INIT_SYNC_ORDER_LARGEST_FIRST, INIT_SYNC_ORDER_SMALLEST_FIRST):
+            raise ValueError(f"Invalid INIT_SYNC_ORDER: {init_sync_order}")
+        collection_list = __order_collections_by_size(collection_list, init_sync_order, logger)
 
-        try:
-            init_sync(collection_name)
-        except Exception:
-            logger.exception(
-                "init sync failed for collection %s; skipping change stream listening",
-                collection_name,
-            )
-            continue
+    # schema bootstrap and init sync of several collections at once, each listener
+    # starts as soon as the init sync of its own collection is done
+    max_workers = get_positive_int_env("INIT_SYNC_MAX_WORKERS", 1)
+    logger.info(
+        f"initial sync of {len(collection_list)} collections with {max_workers} workers"
+    )
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="init_sync") as executor:
+        futures = {
+            executor.submit(__sync_collection, collection_name, change_stream_mode, logger): collection_name
+            for collection_name in collection_list
+        }
+        for future in as_completed(futures):
+            try:
+                if future.result():
+                    synced_collections.append(futures[future])
+            except Exception:
+                logger.exception(
+                    "initial sync failed for collection %s; skipping change stream listening",
+                    futures[future],
+                )
 
-        Thread(target=listening, args=(collection_name,)).start()
+    if change_stream_mode == CHANGE_STREAM_MODE_DATABASE and synced_collections:
+        Thread(target=listening_database, args=(synced_collections,)).start()
 
     # Keep the mirror thread alive for App Service / non-interactive hosts.
     # Do not use input(): stdin is closed there and raises EOFError.
     Event().wait()
 
 
+def __sync_collection(collection_name: str, change_stream_mode: str, logger: logging.Logger) -> bool:
+    """Metadata file, schema bootstrap and init sync of one collection; True if init sync succeeded."""
+    #>>># changes to write metadata.json a the first file - 6Mar2025
+    metadata_file_exists = read_from_file(
+        collection_name, METADATA_FILE_NAME, FileType.TEXT
+    )
+    if not metadata_file_exists: 
+        metadata_json_path = os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), METADATA_FILE_NAME
+            )
+        logger.info("writing metadata file to LZ")
+        push_file_to_lz(metadata_json_path, collection_name)
+
+    sync_status.set_phase(collection_name, SYNC_PHASE_BOOTSTRAP)
+    try:
+        init_table_schema(collection_name)
+    except Exception:
+        logger.exception(
+            "schema bootstrap failed for collection %s; continuing with init sync",
+            collection_name,
+        )
+
+    # the listener starts as soon as init sync has its cluster time N and spills the changes
+    # made during init sync (listening._SpillSegment); it is stopped if init sync fails
+    listener_stop_event = Event()
+    listener_started = False
+
+    def start_listener():
+        nonlocal listener_started
+        if not listener_started:
+            listener_started = True
+            Thread(target=listening, args=(collection_name, listener_stop_event)).start()
+
+    sync_status.set_phase(collection_name, SYNC_PHASE_INIT)
+    try:
+        # in database mode one change stream for all collections starts once every init sync is done
+        init_sync(
+            collection_name,
+            on_cluster_time=(
+                start_listener if change_stream_mode != CHANGE_STREAM_MODE_DATABASE else None
+            ),
+        )
+    except Exception:
+        listener_stop_event.set()
+        logger.exception(
+            "init sync failed for collection %s; stopping change stream listening",
+            collection_name,
+        )
+        return False
+
+    sync_status.set_phase(collection_name, SYNC_PHASE_CATCH_UP)
+    # init sync had finished before, e.g. on a restart
+    if change_stream_mode != CHANGE_STREAM_MODE_DATABASE:
+        start_listener()
+    return True
+
+
+def __order_collections_by_size(
+    collection_list: list[str], init_sync_order: str, logger: logging.Logger
+) -> list[str]:
+    """
+    Collections sorted by storage size ($collStats). If $collStats fails for one of them,
+    all are sorted by estimated document count instead, never by a mix of both.
+    """
+    client = pymongo.MongoClient(os.getenv("MONGO_CONN_STR"))
+    db = client[os.getenv("MONGO_DB_NAME")]
+    sizes = {}
+    for collection_name in collection_list:
+        try:
+            stats = next(
+                db[collection_name].aggregate([{"$collStats": {"storageStats": {}}}]), {}
+            )
+            sizes[collection_name] = stats["storageStats"]["size"]
+        except (PyMongoError, KeyError) as e:
+            logger.info(
+                f"$collStats not available for {collection_name} ({e}), "
+                f"ordering all collections by estimated_document_count"
+            )
+            sizes = None
+            break
+    if sizes is None:
+        sizes = {}
+        for collection_name in collection_list:
+            try:
+                sizes[collection_name] = db[collection_name].estimated_document_count()
+            except PyMongoError:
+                sizes[collection_name] = 0
+    client.close()
+    ordered = sorted(
+        collection_list,
+        key=lambda name: sizes[name],
+        reverse=init_sync_order == INIT_SYNC_ORDER_LARGEST_FIRST,
+    )
+    logger.info(f"initial sync order ({init_sync_order}): {ordered}")
+    return ordered
+
+
 # def __get_all_collections() -> list[str]:
 #     client = pymongo.MongoClient(os.getenv("MONGO_CONN_STR"))
 #     # check database existence
@@ -0,0 +1,160 @@
+"""Parquet output: encoding profile, and rows per file derived from the observed bytes per row."""
+
+import logging
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pymongo.collection import Collection
+from pymongo.errors import PyMongoError
+
+from constants import (
+    PARQUET_TARGET_FILE_SIZE_MB_DEFAULT,
+    PARQUET_SIZE_ESTIMATE_WEIGHT,
+    PARQUET_SIZE_ESTIMATE_MIN_BYTES,
+    PARQUET_COMPRESSION_DEFAULT,
+)
+from utils import get_positive_int_env
+
+logger = logging.getLogger(__name__)
+
+# table_name -> (bytes per row, True once measured on a written parquet file)
+__bytes_per_row = {}
+__bytes_per_row_lock = threading.Lock()
+
+
+def get_target_file_size_bytes() -> int:
+    return (
+        get_positive_int_env("PARQUET_TARGET_FILE_SIZE_MB", PARQUET_TARGET_FILE_SIZE_MB_DEFAULT)
+        * 1024
+        * 1024
+    )
+
+
+def get_rows_per_file(table_name: str, max_rows: int) -> int:
+    """
+    Rows for the next parquet file of a table: as many as fit the target file size
+    (PARQUET_TARGET_FILE_SIZE_MB) at the current bytes-per-row estimate, never more
+    than max_rows (INIT_LOAD_BATCH_SIZE / DELTA_SYNC_BATCH_SIZE).
+    """
+    with __bytes_per_row_lock:
+        estimate = __bytes_per_row.get(table_name)
+    if not estimate:
+        return max_rows
+    return max(1, min(max_rows, int(get_target_file_size_bytes() / estimate[0])))
+
+
+def record_parquet_file(table_name: str, file_path: str, row_count: int):
+    """
+    Update the bytes-per-row estimate of a table with a parquet file just written. The
+    footer is not counted, and files with less than PARQUET_SIZE_ESTIMATE_MIN_BYTES of
+    data (e.g. small delta files) are skipped, their fixed overhead would inflate it.
+    """
+    if row_count <= 0 or not os.path.exists(file_path):
+        return
+    # footer metadata, its length and the magic bytes at both ends
+    footer_size = pq.read_metadata(file_path).serialized_size + 12
+    data_size = os.path.getsize(file_path) - footer_size
+    if data_size < PARQUET_SIZE_ESTIMATE_MIN_BYTES:
+        return
+    observed = data_size / row_count
+    with __bytes_per_row_lock:
+        estimate = __bytes_per_row.get(table_name)
+        if estimate and estimate[1]:
+            observed = (
+                PARQUET_SIZE_ESTIMATE_WEIGHT * observed
+                + (1 - PARQUET_SIZE_ESTIMATE_WEIGHT) * estimate[0]
+            )
+        # the first measured file replaces the seed
+        __bytes_per_row[table_name] = (observed, True)
+    logger.debug(f"{table_name}: {observed:.1f} parquet bytes per row")
+
+
+def seed_bytes_per_row(table_name: str, collection: Collection):
+    """
+    Start the estimate of a table from the average BSON document size ($collStats),
+    so the very first file is already bounded; BSON is larger than compressed parquet,
+    files are smaller than the target until the first one has been measured.
+    """
+    with __bytes_per_row_lock:
+        if table_name in __bytes_per_row:
+            return
+    try:
+        stats = next(collection.aggregate([{"$collStats": {"storageStats": {}}}]), {})
+        avg_obj_size = stats["storageStats"]["avgObjSize"]
+    except (PyMongoError, KeyError) as e:
+        logger.debug(f"no average document size for {table_name}: {e}")
+        return
+    if avg_obj_size:
+        with __bytes_per_row_lock:
+            __bytes_per_row.setdefault(table_name, (float(avg_obj_size), False))
+
+
+def get_parquet_write_options() -> dict:
+    """
+    Parquet encoding profile from the environment, as DataFrame.to_parquet() keyword
+    arguments: PARQUET_COMPRESSION, PARQUET_COMPRESSION_LEVEL, PARQUET_ROW_GROUP_SIZE,
+    PARQUET_USE_DICTIONARY (true / false / comma separated columns) and
+    PARQUET_WRITE_STATISTICS (true / false). The index is never written.
+    """
+    options = {
+        "engine": "pyarrow",
+        "index": False,
+        "compression": os.getenv("PARQUET_COMPRESSION", PARQUET_COMPRESSION_DEFAULT).lower(),
+    }
+    if options["compression"] == "none":
+        options["compression"] = None
+    compression_level = os.getenv("PARQUET_COMPRESSION_LEVEL")
+    if compression_level:
+        options["compression_level"] = int(compression_level)
+    row_group_size = get_positive_int_env("PARQUET_ROW_GROUP_SIZE", 0)
+    if row_group_size:
+        options["row_group_size"] = row_group_size
+    use_dictionary = os.getenv("PARQUET_USE_DICTIONARY")
+    if use_dictionary:
+        if use_dictionary.lower() in ("true", "false"):
+            options["use_dictionary"] = use_dictionary.lower() == "true"
+        else:
+            options["use_dictionary"] = [
+                column.strip() for column in use_dictionary.split(",") if column.strip()
+            ]
+    write_statistics = os.getenv("PARQUET_WRITE_STATISTICS")
+    if write_statistics:
+        options["write_statistics"] = write_statistics.lower() != "false"
+    return options
+
+
+def write_parquet(df: pd.DataFrame, file_path: str):
+    """Write a DataFrame with the configured parquet profile."""
+    df.to_parquet(file_path, **get_parquet_write_options())
+
+
+def merge_parquet_files(input_paths: list[str], output_path: str):
+    """
+    Concatenate parquet files, in order, into one file with the configured profile.
+
+    Inputs are read one at a time; columns missing from a file are written as nulls
+    and types are unified across files.
+    """
+    schema = pa.unify_schemas(
+        [pq.read_schema(input_path) for input_path in input_paths],
+        promote_options="permissive",
+    ).remove_metadata()
+    options = get_parquet_write_options()
+    options.pop("engine")
+    options.pop("index")
+    row_group_size = options.pop("row_group_size", None)
+    with pq.ParquetWriter(output_path, schema, **options) as writer:
+        for input_path in input_paths:
+            table = pq.read_table(input_path)
+            columns = [
+                table[field.name].cast(field.type)
+                if field.name in table.column_names
+                else pa.nulls(table.num_rows, field.type)
+                for field in schema
+            ]
+            writer.write_table(
+                pa.Table.from_arrays(columns, schema=schema), row_group_size=row_group_size
+            )
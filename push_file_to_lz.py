@@ -1,14 +1,42 @@
 import os
 from dotenv import load_dotenv
-import requests
 import json
 import logging
 from datetime import datetime
+from urllib.parse import urlsplit
+from threading import Lock, Thread
+from concurrent.futures import ThreadPoolExecutor
+import time
 import utils
+from utils import get_positive_int_env
+from lz_client import get_lz_client
+from metrics import BYTES_UPLOADED, FILES_PUBLISHED
 import constants
+from constants import (
+    LZ_TOKEN_SCOPE,
+    LZ_TOKEN_AUTHORITY_HOST_DEFAULT,
+    LZ_TOKEN_DEFAULT_EXPIRES_IN_SEC,
+    LZ_TOKEN_REFRESH_AHEAD_SEC,
+    LZ_TOKEN_EXPIRY_MARGIN_SEC,
+    LZ_UPLOAD_CHUNK_SIZE_MB_DEFAULT,
+    LZ_UPLOAD_PARALLEL_CHUNKS_DEFAULT,
+)
 
 logger = logging.getLogger(__name__)
 
+# process-wide access token cache: (tenant, app id, scope) -> (token, expires_at)
+__token_cache = {}
+__token_cache_lock = Lock()
+__token_fetch_lock = Lock()
+__token_refreshing = set()
+__token_cache_stats = {
+    "hits": 0,
+    "misses": 0,
+    "fetches": 0,
+    "refreshes": 0,
+    "refresh_failures": 0,
+}
+
 
 def _lz_folder_url(lz_url: str, table_name: str = "") -> str:
     """Landing zone folder URL; empty table_name = mirrored database root (LandingZone/)."""
@@ -22,7 +50,9 @@ def push_file_to_lz(
     filepath: str,
     table_name: str,
 ):
+    """Push a file to the landing zone, returns its ETag there (None if unknown)."""
     logger.info(f"pushing file to lz. table_name={table_name}, filepath={filepath}")
+    etag = None
     try:
         if os.getenv("DEBUG__SKIP_PUSH_TO_LZ"):
             logger.info("Push to LZ skipped by environment variable DEBUG__SKIP_PUSH_TO_LZ")
@@ -30,9 +60,13 @@ def push_file_to_lz(
             access_token = __get_access_token(
                 os.getenv("APP_ID"), os.getenv("SECRET"), os.getenv("TENANT_ID")
             )
-            __patch_file(access_token, filepath, os.getenv("LZ_URL"), table_name)
+            etag = __patch_file(access_token, filepath, os.getenv("LZ_URL"), table_name)
+            BYTES_UPLOADED.inc(os.path.getsize(filepath), collection=table_name)
+            if os.path.splitext(filepath)[1] == ".parquet":
+                FILES_PUBLISHED.inc(collection=table_name)
         # identify if any other parquet files in the dir, and remove them, leaving only the last one we just pushed
         __clean_up_old_parquet_files(filepath)
+        return etag
     except Exception as e:
         logger.error(f"Error pushing file to lz: {str(e)}")
         raise
@@ -62,23 +96,88 @@ def __clean_up_old_parquet_files(filepath: str):
 
 
 def __get_access_token(app_id, client_secret, directory_id):
+    """
+    Access token for the landing zone from the process-wide cache.
+
+    A cached token is served until shortly before it expires; once it enters the
+    refresh window a background thread fetches the next one, so callers only wait
+    for AAD on the very first call (or if the refresh failed).
+    """
+    key = (directory_id, app_id, LZ_TOKEN_SCOPE)
+    with __token_cache_lock:
+        cached = __token_cache.get(key)
+        now = time.time()
+        if cached and now < cached[1] - LZ_TOKEN_EXPIRY_MARGIN_SEC:
+            __token_cache_stats["hits"] += 1
+            if now >= cached[1] - LZ_TOKEN_REFRESH_AHEAD_SEC and key not in __token_refreshing:
+                __token_refreshing.add(key)
+                Thread(
+                    target=__refresh_access_token,
+                    args=(key, app_id, client_secret, directory_id),
+                    name="lz_token_refresh",
+                    daemon=True,
+                ).start()
+            return cached[0]
+        __token_cache_stats["misses"] += 1
+    # one fetch at a time, another thread may have fetched the token meanwhile
+    with __token_fetch_lock:
+        with __token_cache_lock:
+            cached = __token_cache.get(key)
+            if cached and time.time() < cached[1] - LZ_TOKEN_EXPIRY_MARGIN_SEC:
+                return cached[0]
+        token, expires_at = __request_access_token(app_id, client_secret, directory_id)
+        with __token_cache_lock:
+            __token_cache[key] = (token, expires_at)
+        return token
+
+
+def __refresh_access_token(key, app_id, client_secret, directory_id):
+    try:
+        with __token_fetch_lock:
+            token, expires_at = __request_access_token(app_id, client_secret, directory_id)
+        with __token_cache_lock:
+            __token_cache[key] = (token, expires_at)
+            __token_cache_stats["refreshes"] += 1
+        logger.debug("refreshed landing zone access token ahead of expiry")
+    except Exception as e:
+        with __token_cache_lock:
+            __token_cache_stats["refresh_failures"] += 1
+        logger.warning(f"Error refreshing access token ahead of expiry: {str(e)}")
+    finally:
+        with __token_cache_lock:
+            __token_refreshing.discard(key)
+
+
+def get_access_token_cache_stats() -> dict:
+    """Counters of the access token cache: hits, misses, fetches, refreshes, refresh_failures."""
+    with __token_cache_lock:
+        return dict(__token_cache_stats)
+
+
+def __request_access_token(app_id, client_secret, directory_id):
     """It will create a access token to access the mail apis"""
     app_id = app_id  # Application Id - on the azure app overview page
     client_secret = client_secret
     directory_id = directory_id
+    authority_host = os.getenv("AAD_AUTHORITY_HOST", LZ_TOKEN_AUTHORITY_HOST_DEFAULT)
     token_url = (
-        "https://login.microsoftonline.com/" + directory_id + "/oauth2/v2.0/token"
+        authority_host.rstrip("/") + "/" + directory_id + "/oauth2/v2.0/token"
     )
     token_data = {
         "grant_type": "client_credentials",
         "client_id": app_id,
         "client_secret": client_secret,
-        "scope": "https://storage.azure.com/.default",
+        "scope": LZ_TOKEN_SCOPE,
     }
     token_headers = {"Content-Type": "application/x-www-form-urlencoded"}
     # logger.debug(token_url)
-    token_response = requests.post(token_url, data=token_data, headers=token_headers)
+    requested_at = time.time()
+    token_response = get_lz_client().request(
+        "POST", token_url, data=token_data, headers=token_headers
+    )
     token_response_dict = json.loads(token_response.text)
+    with __token_cache_lock:
+        __token_cache_stats["fetches"] += 1
 
     # logger.debug(token_response.text)
 
@@ -90,7 +189,8 @@ def __get_access_token(app_id, client_secret, directory_id):
         raise Exception("Error in getting in access token")
     else:
         #   logger.debug("Token is:" + token)
-        return token
+        expires_in = int(token_response_dict.get("expires_in", LZ_TOKEN_DEFAULT_EXPIRES_IN_SEC))
+        return token, requested_at + expires_in
 
 
 def __patch_file(access_token, file_path, lz_url, table_name):
@@ -110,23 +210,28 @@ def __patch_file(access_token, file_path, lz_url, table_name):
         logger.debug("creating file in lake")
 
         # Code to create file in lakehouse
-        response = requests.put(token_url_temp, data={}, headers=token_headers)
+        response = get_lz_client().put(token_url_temp, data={}, headers=token_headers)
         logger.debug(response)
+        if not response.ok:
+            raise Exception(
+                f"creating {file_name_temp}_TEMP failed. Server responded with code {response.status_code}"
+            )
 
-        token_url_temp = base_url + file_name_temp + '_TEMP' + "?position=0&action=append&flush=true"
-        token_headers = {
-            "Authorization": "Bearer " + access_token,
-            "x-ms-file-name": file_name,
-        }
-            
-        logger.debug(token_url_temp)    
-        logger.debug("pushing data to file in lake")
+        token_url_temp = base_url + file_name_temp + '_TEMP'
+        file_size = os.path.getsize(file_path)
+        chunk_size = (
+            get_positive_int_env("LZ_UPLOAD_CHUNK_SIZE_MB", LZ_UPLOAD_CHUNK_SIZE_MB_DEFAULT)
+            * 1024
+            * 1024
+        )
+        logger.debug(f"pushing data to file in lake, {file_size} bytes")
 
         # Code to push Data to Lakehouse
-        with open(file_path, "rb") as file:
-            file_contents = file.read()
-            response = requests.patch(token_url_temp, data=file_contents, headers=token_headers)
-        logger.debug(response)
+        if file_size <= chunk_size:
+            with open(file_path, "rb") as file:
+                __append_data(access_token, token_url_temp, file_name, 0, file.read(), flush=True)
+        else:
+            __append_chunks(access_token, token_url_temp, file_path, file_name, file_size, chunk_size)
 
         # Rename file from temp to actual name
         token_headers = {
@@ -134,14 +239,97 @@ def __patch_file(access_token, file_path, lz_url, table_name):
             "x-ms-rename-source": base_url + file_name_temp + '_TEMP' + "?resource=file",
             "x-ms-version": "2020-06-12"
         }
-        response = requests.put(token_url, headers=token_headers)
+        # the source is gone once a rename went through, so never resend it blindly
+        response = get_lz_client().put(token_url, headers=token_headers, idempotent=False)
         logger.debug(response)
+        if response.status_code == 404:
+            # a resent rename finds no source if the first one went through
+            response = __get_renamed_file(access_token, token_url, file_size) or response
+        if not response.ok:
+            raise Exception(
+                f"renaming {file_name_temp}_TEMP to {file_name} failed. Server responded with code {response.status_code}"
+            )
+        return response.headers.get("ETag")
     except Exception as e:
         logger.error(f"Error patching file to landing zone: {str(e)}")
         raise
 
 
-def get_file_from_lz(table_name, file_name):
+def __get_renamed_file(access_token, url, file_size):
+    """HEAD response of the file at url if it exists with file_size bytes, otherwise None."""
+    headers = {"Authorization": "Bearer " + access_token, "x-ms-version": "2020-06-12"}
+    response = get_lz_client().request("HEAD", url, headers=headers)
+    if not response.ok or response.headers.get("Content-Length") != str(file_size):
+        return None
+    logger.info(f"{os.path.basename(url)} is already in the landing zone, the rename went through")
+    return response
+
+
+def __append_chunks(access_token, url, file_path, file_name, file_size, chunk_size):
+    """
+    Upload a file as positional appends of chunk_size bytes, then commit it with one flush.
+
+    Only the chunks being sent are held in memory; with LZ_UPLOAD_PARALLEL_CHUNKS > 1
+    several chunks are appended at once, their positions keep the file in order.
+    """
+    parallel_chunks = get_positive_int_env(
+        "LZ_UPLOAD_PARALLEL_CHUNKS", LZ_UPLOAD_PARALLEL_CHUNKS_DEFAULT
+    )
+    positions = range(0, file_size, chunk_size)
+    logger.debug(
+        f"uploading {file_name} in {len(positions)} chunks of {chunk_size} bytes, {parallel_chunks} at a time"
+    )
+
+    def append_chunk(position):
+        with open(file_path, "rb") as file:
+            file.seek(position)
+            data = file.read(chunk_size)
+        __append_data(access_token, url, file_name, position, data)
+
+    with ThreadPoolExecutor(max_workers=parallel_chunks) as executor:
+        # list() re-raises the first failed chunk
+        list(executor.map(append_chunk, positions))
+    __flush_data(access_token, url, file_name, file_size)
+
+
+def __append_data(access_token, url, file_name, position, data, flush=False):
+    action = f"?position={position}&action=append" + ("&flush=true" if flush else "")
+    headers = {
+        "Authorization": "Bearer " + access_token,
+        "x-ms-file-name": file_name,
+    }
+    __send_chunk(
+        url + action, data, headers, f"append of {file_name} at position {position}"
+    )
+
+
+def __flush_data(access_token, url, file_name, file_size):
+    headers = {
+        "Authorization": "Bearer " + access_token,
+        "x-ms-file-name": file_name,
+        "content-length": "0",
+    }
+    __send_chunk(
+        url + f"?position={file_size}&action=flush", b"", headers, f"flush of {file_name}"
+    )
+
+
+def __send_chunk(url, data, headers, description):
+    # the landing zone client retries throttled / failed requests, positional appends
+    # and the flush are idempotent
+    response = get_lz_client().patch(url, data=data, headers=headers)
+    logger.debug(response)
+    if not response.ok:
+        raise Exception(
+            f"{description} failed. Server responded with code {response.status_code}"
+        )
+
+
+def get_file_from_lz(table_name, file_name, etag=None):
+    """
+    (200, response) with the file content, (304, response) if etag is given and the
+    file is unchanged, otherwise (None, response) so callers can check for a 404.
+    """
     logger.info(
         f"trying to get file from lz. table_name={table_name}, file_name={file_name}"
     )
@@ -149,14 +337,18 @@ def get_file_from_lz(table_name, file_name):
         os.getenv("APP_ID"), os.getenv("SECRET"), os.getenv("TENANT_ID")
     )
     token_headers = {"Authorization": "Bearer " + access_token, "content-length": "0"}
+    if etag:
+        token_headers["If-None-Match"] = etag
     url = _lz_folder_url(os.getenv("LZ_URL"), table_name) + file_name
-    response = requests.get(url, headers=token_headers)
+    response = get_lz_client().get(url, headers=token_headers)
     response_status_code = response.status_code
+    if etag and response_status_code == 304:
+        return (response_status_code, response)
     if response_status_code != 200:
         logger.warning(
             f"failed to get file from Landing Zone. Server responded with code {response_status_code}"
         )
-        return None, None
+        return None, response
     local_file_path = os.path.join(utils.get_table_dir(table_name), file_name)
     # Commented out to stop re-write
     # with open(local_file_path, "wb") as local_file:
@@ -172,10 +364,42 @@ def get_file_from_lz_root(file_name: str):
 
 def push_file_to_lz_root(filepath: str):
     """Push a file to the landing zone root (mirrored database level, not per table)."""
-    push_file_to_lz(filepath, "")
+    return push_file_to_lz(filepath, "")
+
+
+def list_files_from_lz(table_name):
+    """
+    Names of the files directly under a landing zone table folder (sub folders excluded),
+    using the ADLS Gen2 "List Paths" API. Returns None if the listing failed.
+    """
+    lz_url = urlsplit(_lz_folder_url(os.getenv("LZ_URL"), table_name))
+    # first path segment is the filesystem (workspace), the rest is the directory
+    filesystem, _, directory = lz_url.path.strip("/").partition("/")
+    url = f"{lz_url.scheme}://{lz_url.netloc}/{filesystem}"
+    access_token = __get_access_token(
+        os.getenv("APP_ID"), os.getenv("SECRET"), os.getenv("TENANT_ID")
+    )
+    token_headers = {"Authorization": "Bearer " + access_token, "x-ms-version": "2020-06-12"}
+    params = {"resource": "filesystem", "directory": directory, "recursive": "false"}
+    file_names = []
+    while True:
+        response = get_lz_client().get(url, params=params, headers=token_headers)
+        if response.status_code != 200:
+            logger.warning(
+                f"failed to list files in Landing Zone. Server responded with code {response.status_code}"
+            )
+            return None
+        for path in response.json().get("paths", []):
+            if str(path.get("isDirectory", "false")).lower() != "true":
+                file_names.append(path["name"].rsplit("/", 1)[-1])
+        continuation = response.headers.get("x-ms-continuation")
+        if not continuation:
+            return file_names
+        params["continuation"] = continuation
 
 
 def delete_file_from_lz(table_name, file_name):
+    """200 if the file was deleted, 404 if it did not exist, None if the delete failed."""
     logger.info(
         f"trying to delete file from lz. table_name={table_name}, file_name={file_name}"
     )
@@ -184,6 +408,6 @@ def delete_file_from_lz(table_name, file_name):
     )
     token_headers = {"Authorization": "Bearer " + access_token, "content-length": "0"}
     url = _lz_folder_url(os.getenv("LZ_URL"), table_name) + file_name
-    response = requests.delete(url, headers=token_headers)
+    response = get_lz_client().delete(url, headers=token_headers)
     logger.debug(f"delete response: {response}")
-    return response.status_code if response.status_code == 200 else None
+    return response.status_code if response.status_code in (200, 404) else None
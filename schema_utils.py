@@ -1,21 +1,24 @@
+from contextvars import ContextVar
+from dataclasses import dataclass, field
 from datetime import date, datetime
 import os
 import json
 import logging
+import threading
 import time
+from typing import Callable
 #17June2025 - doesnt work for 3.9 and lesser Python versions
 #from types import NoneType
 import bson.int64
 import pymongo
 import pandas as pd
 import numpy as np
+import pyarrow as pa
 import pickle
 # from bson import Decimal128, int64
 import bson
-from push_file_to_lz import push_file_to_lz
 from utils import get_table_dir
 from constants import (
-    CONVERSION_LOG_FILE_NAME,
     INTERNAL_SCHEMA_FILE_NAME,
     TYPE_KEY,
     DTYPE_KEY,
@@ -25,7 +28,8 @@ from constants import (
     SCHEMA_BOOTSTRAP_SAMPLE_MAX_ATTEMPTS,
 )
 import schemas
-from file_utils import FileType, append_to_file, read_from_file
+from file_utils import FileType, read_from_file
+import conversion_log
 from pandas.api.types import (
     is_numeric_dtype,
     is_string_dtype,
@@ -41,10 +45,26 @@ NoneType = type(None)
 INT64_MIN = np.iinfo(np.int64).min
 INT64_MAX = np.iinfo(np.int64).max
 
-current_column_name = None
-current_document_id = None
-table_name = None
-conversion_flag = False
+
+@dataclass
+class _ConversionContext:
+    """Table, column and document a process_dataframe call is converting, for the conversion log."""
+    table_name: str
+    column_name: str | None = None
+    document_id: object = None
+
+
+# set by process_dataframe for the calling thread (or task), so concurrent calls
+# for different tables and batches do not see each other's context
+_conversion_context: ContextVar[_ConversionContext | None] = ContextVar(
+    "conversion_context", default=None
+)
+# held while a column new to a table schema is added, so concurrent batches agree on its schema
+_new_column_lock = threading.Lock()
+
+# table_name -> (schema version, {column name in the DataFrame: _ColumnPlan})
+_column_plans = {}
+_column_plans_lock = threading.Lock()
 
 
 def _is_null_value(item) -> bool:
@@ -244,19 +264,19 @@ def finalize_dataframe_for_parquet(table_name: str, df: pd.DataFrame) -> None:
 
 
 def _log_conversion_failure(obj, type_name, default_value, error=None):
-    global conversion_flag
-    conversion_flag = True
-    doc_id = str(current_document_id) if current_document_id is not None else "unknown"
+    # outside of process_dataframe there is no table to log the failure to
+    context = _conversion_context.get() or _ConversionContext(table_name=None)
+    if context.table_name is not None and not conversion_log.record_failure(
+        context.table_name, context.column_name, context.document_id, obj, type_name, default_value
+    ):
+        # not the first failure of the column in the open conversion log segment
+        return
+    doc_id = str(context.document_id) if context.document_id is not None else "unknown"
     error_detail = f" ({error})" if error else ""
     logger.warning(
-        f"Unsuccessful conversion for document {doc_id}, column {current_column_name}: "
-        f'"{obj}" ({type(obj).__name__}) to {type_name}{error_detail}. Using {default_value!r}.'
-    )
-    append_to_file(
-        f"\n{doc_id:<24} | {current_column_name:<20} | {str(obj):<24} | {str(default_value):<20}",
-        table_name,
-        CONVERSION_LOG_FILE_NAME,
-        FileType.TEXT,
+        f"Unsuccessful conversion for document {doc_id}, column {context.column_name}: "
+        f'"{obj}" ({type(obj).__name__}) to {type_name}{error_detail}. Using {default_value!r}. '
+        f"Further failures of this column are aggregated in the conversion log."
     )
 
 
@@ -312,19 +332,204 @@ def _coerce_to_float64_value(obj):
     raise ValueError(f"cannot convert {type(obj).__name__} to float64")
 
 
-def _apply_column_conversion(df: pd.DataFrame, col_name: str, conversion_fcn):
-    global current_document_id
-    has_id = "_id" in df.columns
-    converted = []
-    for idx, item in df[col_name].items():
-        if has_id:
-            current_document_id = df.at[idx, "_id"]
+def _apply_column_conversion(df: pd.DataFrame, col_name: str, conversion_fcn, positions=None):
+    """
+    Convert the values of a column with conversion_fcn, row by row.
+
+    When positions is given only those rows are converted, the others are kept as-is.
+    """
+    context = _conversion_context.get()
+    values = df[col_name].to_numpy(dtype=object)
+    document_ids = df["_id"].to_numpy(dtype=object) if "_id" in df.columns else None
+    if positions is None:
+        positions = range(len(values))
+    converted = values.copy()
+    for position in positions:
+        item = values[position]
+        if document_ids is not None and context is not None:
+            context.document_id = document_ids[position]
         try:
-            converted.append(conversion_fcn(item))
+            converted[position] = conversion_fcn(item)
         except Exception as error:
             _log_conversion_failure(item, type(error).__name__, None, error)
-            converted.append(None)
-    return pd.Series(converted, index=df[col_name].index)
+            converted[position] = None
+    return pd.Series(converted.tolist(), index=df[col_name].index)
+
+
+# Schema types whose converter returns already-matching values unchanged, so only
+# the rows that do not match need to go through it
+SUBSET_CONVERSION_TYPES = (bool, int, float, str)
+
+NULL_VALUE_TYPES = (NoneType, type(pd.NA), type(pd.NaT))
+
+NEVER_NULL_VALUE_TYPES = (
+    bool,
+    np.bool_,
+    int,
+    np.integer,
+    str,
+    bytes,
+    dict,
+    list,
+    tuple,
+    date,
+    bson.ObjectId,
+    bson.Decimal128,
+)
+
+
+def _dtype_matches_expected_type(dtype, expected_type) -> bool:
+    """
+    True when every value of a column with this (non-object) dtype matches expected_type,
+    so the per-value check can be skipped.
+    """
+    if isinstance(dtype, pd.ArrowDtype):
+        arrow_type = dtype.pyarrow_dtype
+        if pa.types.is_null(arrow_type):
+            return True
+        if expected_type == int:
+            return pa.types.is_signed_integer(arrow_type) or arrow_type in (
+                pa.uint8(), pa.uint16(), pa.uint32()
+            )
+        if expected_type == float:
+            return pa.types.is_floating(arrow_type)
+        if expected_type == bool:
+            return pa.types.is_boolean(arrow_type)
+        if expected_type == str:
+            return pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type)
+        if expected_type in (datetime, date):
+            return pa.types.is_timestamp(arrow_type)
+        return False
+    if is_object_dtype(dtype):
+        return False
+    if expected_type == int:
+        return dtype.kind == "i" or (dtype.kind == "u" and dtype.itemsize < 8)
+    if expected_type == float:
+        return dtype.kind == "f"
+    if expected_type == bool:
+        return dtype.kind == "b"
+    if expected_type == str:
+        return is_string_dtype(dtype)
+    if expected_type in (datetime, date):
+        return dtype.kind == "M"
+    return False
+
+
+def _value_type_needs_conversion(item_type, expected_type) -> bool | None:
+    """
+    Classify a Python value type against the schema type: False if every value of
+    this type matches, True if none does, None if it depends on the value.
+    """
+    if issubclass(item_type, NULL_VALUE_TYPES):
+        return False
+    if expected_type == bool:
+        if issubclass(item_type, (bool, np.bool_)):
+            return False
+    elif expected_type == int:
+        if issubclass(item_type, np.integer) and not issubclass(item_type, np.uint64):
+            return False
+        if issubclass(item_type, (int, np.uint64)) and not issubclass(item_type, bool):
+            # int64 range check
+            return None
+    elif expected_type == float:
+        if issubclass(item_type, (float, np.floating)):
+            return False
+    elif expected_type == str:
+        if issubclass(item_type, str):
+            return False
+    else:
+        return None
+    # values of these types are never null, any other type may hold a null (e.g. NaN)
+    return True if issubclass(item_type, NEVER_NULL_VALUE_TYPES) else None
+
+
+def _classify_column_values(series: pd.Series, expected_type):
+    """
+    Positions of the values that do not match expected_type and of the null values,
+    classifying each distinct value type once instead of checking every value.
+    """
+    empty = np.empty(0, dtype=np.intp)
+    if _dtype_matches_expected_type(series.dtype, expected_type):
+        return empty, empty
+    values = series.to_numpy(dtype=object)
+    item_types = list(map(type, values))
+    type_decisions = {
+        item_type: _value_type_needs_conversion(item_type, expected_type)
+        for item_type in set(item_types)
+    }
+    if all(decision is False for decision in type_decisions.values()):
+        return empty, empty
+    # 0 = keep, 1 = needs conversion, 2 = null
+    value_states = np.fromiter(
+        (
+            (2 if _is_null_value(item) else int(_needs_type_conversion(item, expected_type)))
+            if type_decisions[item_type] is None
+            else (2 if issubclass(item_type, NULL_VALUE_TYPES) else int(type_decisions[item_type]))
+            for item, item_type in zip(values, item_types)
+        ),
+        dtype=np.int8,
+        count=len(values),
+    )
+    return np.flatnonzero(value_states == 1), np.flatnonzero(value_states == 2)
+
+
+def _bulk_convert_values(values: np.ndarray, expected_type):
+    """
+    Convert values with a single Arrow cast when it gives the same result as the
+    per-value converter (int -> float, integral float -> int, int -> str).
+    Returns None when the values need the per-value converter.
+    """
+    value_types = set(map(type, values))
+    is_int_values = all(
+        issubclass(t, (int, np.integer)) and not issubclass(t, (bool, np.bool_))
+        for t in value_types
+    )
+    is_float_values = all(issubclass(t, (float, np.floating)) for t in value_types)
+    try:
+        if expected_type == float and is_int_values:
+            return pa.array(values, type=pa.int64()).cast(pa.float64()).to_pylist()
+        if expected_type == int and is_float_values:
+            # a safe cast fails on any fractional value
+            return pa.array(values, type=pa.float64()).cast(pa.int64()).to_pylist()
+        if expected_type == str and is_int_values:
+            return pa.array(values, type=pa.int64()).cast(pa.string()).to_pylist()
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError, OverflowError):
+        return None
+    return None
+
+
+def _convert_column_to_expected_type(
+    df: pd.DataFrame, col_name: str, expected_type, conversion_fcn
+):
+    """
+    Convert the values of a column that do not match expected_type.
+
+    Columns whose dtype already matches are skipped without looking at values. For
+    bool/int/float/str only the non-matching (and null) rows are converted, with one
+    Arrow cast when possible and the per-value converter for the rest; other schema
+    types keep converting the whole column when any value does not match.
+    """
+    mismatch_positions, null_positions = _classify_column_values(df[col_name], expected_type)
+    if len(mismatch_positions) == 0:
+        return
+    logger.debug(
+        f"Converting {len(mismatch_positions)} values of column {col_name} to expected type {expected_type}"
+    )
+    if expected_type not in SUBSET_CONVERSION_TYPES:
+        df[col_name] = _apply_column_conversion(df, col_name, conversion_fcn)
+        return
+    # nulls go through the converter as well (e.g. "" for strings), like a full conversion
+    bulk_converted = _bulk_convert_values(
+        df[col_name].to_numpy(dtype=object)[mismatch_positions], expected_type
+    )
+    if bulk_converted is None:
+        positions = np.union1d(mismatch_positions, null_positions)
+        df[col_name] = _apply_column_conversion(df, col_name, conversion_fcn, positions)
+        return
+    values = df[col_name].to_numpy(dtype=object).copy()
+    values[mismatch_positions] = bulk_converted
+    df[col_name] = pd.Series(values, index=df[col_name].index, dtype=object)
+    df[col_name] = _apply_column_conversion(df, col_name, conversion_fcn, null_positions)
 
 
 def to_string(obj) -> str:
@@ -694,121 +899,166 @@ def init_table_schema(table_name: str):
             )
 
 
-def process_dataframe(table_name_param: str, df: pd.DataFrame):
-    global current_column_name, table_name, conversion_flag
-    table_name = table_name_param
-    conversion_flag = False
-    typed_df = df.convert_dtypes(dtype_backend="pyarrow")
-    for column in typed_df.columns:
-        df[column] = typed_df[column]
-    for col_name in df.keys().values:
-        current_dtype = df[col_name].dtype
-        current_first_item = _get_first_item(df, col_name)
-        #current_item_type = type(current_first_item)
-        
+@dataclass
+class _ColumnPlan:
+    """How process_dataframe handles a known column, for one schema version of its table."""
+    column_name: str
+    schema_of_this_column: dict
+    expected_type: type
+    conversion_fcn: Callable
+    # datetime columns are not cast to an object schema dtype
+    object_schema_dtype: bool
+    # dtypes already known to match expected_type, their values are not looked at
+    matching_dtypes: set = field(default_factory=set)
 
-        processed_col_name = schemas.find_column_renaming(table_name, col_name)
-        logger.debug(
-                    f"%%%% Processed col name found: processed_col_name is {processed_col_name} %%%%%"
-        )
-        schema_of_this_column = schemas.get_table_column_schema(table_name, col_name)
-        logger.debug(
-                    f"%%%% In process_df: schema_of_this_column is {schema_of_this_column} %%%%%"
-                )
-        if not processed_col_name and not schema_of_this_column:
-            logger.debug(
-                    f"%%%% In process_df, schema of col doesnt exist: schema_of_this_column is {schema_of_this_column} and processed_col_name is {processed_col_name} %%%%%"
-                )
-            # new column, process it and append schema
-            schema_of_this_column = init_column_schema(
-                current_dtype, current_first_item
-            )
-            processed_col_name = process_column_name(col_name)
-            if processed_col_name != col_name:
-                schemas.add_column_renaming(table_name, col_name, processed_col_name)
-            schemas.append_schema_column(
-                table_name, processed_col_name, schema_of_this_column
-            )
 
-        # processed_col_name might have been updated for new column, so no need to use elif here
-        # 2 scenarios are included by this if clause:
-        #       1. existing column renaming found
-        #       2. new column with the need to rename
-        # and the extra processed_col_name can make sure to exclude the scenario
-        # of existing column without the need to rename, in which case processed_col_name
-        # from find_column_renaming() will be None.
-        if processed_col_name and processed_col_name != col_name:
-            df.rename(columns={col_name: processed_col_name}, inplace=True)
-            col_name = processed_col_name
-            # May 9 : get schema from file for the renamed column
-            schema_of_this_column = schemas.get_table_column_schema(table_name, col_name)
-
-        # schema_of_this_column should always exists at this point
-        # existing column or new column with schema appended, process according to schema_of_this_column
-        #if current_item_type != schema_of_this_column[TYPE_KEY]:
-        expected_type = schema_of_this_column[TYPE_KEY]
-        conversion_fcn = TYPE_TO_CONVERT_FUNCTION_MAP.get(expected_type, do_nothing)
-        if any(_needs_type_conversion(item, expected_type) for item in df[col_name]):
-            current_column_name = col_name
-            logger.debug(
-                f"Converting column {col_name} values to expected type {expected_type}"
-            )
-            df[col_name] = _apply_column_conversion(df, col_name, conversion_fcn)
-        # for index, item in enumerate(df[col_name]):
-            # print(f"Row {index}: Value={item}, Type={type(item)}")
-            
-        current_dtype = df[col_name].dtype
-        logger.debug(f"current_dtype={current_dtype}")
-        logger.debug(
-            f"schema_of_this_column[DTYPE_KEY]={schema_of_this_column[DTYPE_KEY]}"
-        )
+def _get_column_plan(table_name: str, col_name: str) -> _ColumnPlan | None:
+    """
+    Cached renaming, schema and converter of a column, None for a column not in the
+    schema yet. Cached per table until schemas.get_schema_version() changes.
+    """
+    version = schemas.get_schema_version(table_name)
+    with _column_plans_lock:
+        cached = _column_plans.get(table_name)
+        if cached is None or cached[0] != version:
+            cached = (version, {})
+            _column_plans[table_name] = cached
+        plan = cached[1].get(col_name)
+    if plan:
+        return plan
+    processed_col_name = schemas.find_column_renaming(table_name, col_name) or col_name
+    schema_of_this_column = schemas.get_table_column_schema(table_name, processed_col_name)
+    if not schema_of_this_column:
+        return None
+    expected_type = schema_of_this_column[TYPE_KEY]
+    plan = _ColumnPlan(
+        column_name=processed_col_name,
+        schema_of_this_column=schema_of_this_column,
+        expected_type=expected_type,
+        conversion_fcn=TYPE_TO_CONVERT_FUNCTION_MAP.get(expected_type, do_nothing),
+        object_schema_dtype=is_object_dtype(schema_of_this_column[DTYPE_KEY]),
+    )
+    cached[1][col_name] = plan
+    return plan
+
+
+def merge_schema_columns(table_name: str, column_schemas: dict, column_renaming: dict) -> bool:
+    """
+    Add the columns and column renamings that process_dataframe added in another
+    process to the table schema. Returns False, changing nothing, when one of them is
+    already in the schema with another type, dtype or name.
+    """
+    with _new_column_lock:
+        for column_name, column_schema in column_schemas.items():
+            existing_schema = schemas.get_table_column_schema(table_name, column_name)
+            if existing_schema and (
+                existing_schema[TYPE_KEY] != column_schema[TYPE_KEY]
+                or str(existing_schema[DTYPE_KEY]) != str(column_schema[DTYPE_KEY])
+            ):
+                return False
+        for original_column_name, new_column_name in column_renaming.items():
+            existing_name = schemas.find_column_renaming(table_name, original_column_name)
+            if existing_name and existing_name != new_column_name:
+                return False
+        for original_column_name, new_column_name in column_renaming.items():
+            if not schemas.find_column_renaming(table_name, original_column_name):
+                schemas.add_column_renaming(table_name, original_column_name, new_column_name)
+        for column_name, column_schema in column_schemas.items():
+            if not schemas.get_table_column_schema(table_name, column_name):
+                schemas.append_schema_column(table_name, column_name, column_schema)
+    return True
+
+
+def process_dataframe(table_name: str, df: pd.DataFrame):
+    """
+    Convert the columns of df in place to the table schema, adding new columns to it.
+    Safe to call concurrently, for the same or different tables.
+    """
+    context = _ConversionContext(table_name=table_name)
+    token = _conversion_context.set(context)
+    try:
+        _process_dataframe(context, df)
+    finally:
+        _conversion_context.reset(token)
+    # uploads the failures of this table once CONVERSION_LOG_UPLOAD_INTERVAL_SEC is over
+    conversion_log.flush_conversion_log(table_name)
+
+
+def _process_dataframe(context: _ConversionContext, df: pd.DataFrame):
+    table_name = context.table_name
+    # decoded columns already have Arrow dtypes, only infer the others
+    untyped_columns = [
+        column for column, dtype in df.dtypes.items() if not isinstance(dtype, pd.ArrowDtype)
+    ]
+    if untyped_columns:
+        typed_df = df[untyped_columns].convert_dtypes(dtype_backend="pyarrow")
+        for column in typed_df.columns:
+            df[column] = typed_df[column]
+    plans = []
+    for col_name in df.keys().values:
+        plan = _get_column_plan(table_name, col_name)
+        if plan is None:
+            with _new_column_lock:
+                # another batch may have added the column meanwhile
+                plan = _get_column_plan(table_name, col_name)
+                if plan is None:
+                    # new column, process it and append schema
+                    schema_of_this_column = init_column_schema(
+                        df[col_name].dtype, _get_first_item(df, col_name)
+                    )
+                    processed_col_name = process_column_name(col_name)
+                    if processed_col_name != col_name:
+                        schemas.add_column_renaming(table_name, col_name, processed_col_name)
+                    schemas.append_schema_column(
+                        table_name, processed_col_name, schema_of_this_column
+                    )
+                    plan = _get_column_plan(table_name, col_name)
+        plans.append((col_name, plan))
+    column_renaming = {
+        col_name: plan.column_name for col_name, plan in plans if plan.column_name != col_name
+    }
+    if column_renaming:
+        df.rename(columns=column_renaming, inplace=True)
+
+    for _, plan in plans:
+        col_name = plan.column_name
+        schema_of_this_column = plan.schema_of_this_column
+        expected_type = plan.expected_type
+        context.column_name = col_name
+        series = df[col_name]
+        if series.dtype not in plan.matching_dtypes:
+            if _dtype_matches_expected_type(series.dtype, expected_type):
+                plan.matching_dtypes.add(series.dtype)
+            else:
+                _convert_column_to_expected_type(df, col_name, expected_type, plan.conversion_fcn)
+                series = df[col_name]
+        # the remaining steps work on the column and write it back once
+        column = series
+        current_dtype = series.dtype
 
         if (expected_type == bson.int64.Int64 or expected_type == int) and current_dtype == "float64":
             # Convert to int64
             logger.debug(
                 f"Converting column {col_name} from float64 to Int64"
-            )   
-            df[col_name] = df[col_name].astype("Int64")
-
-        current_dtype = df[col_name].dtype
-        #if current_dtype != schema_of_this_column[DTYPE_KEY]:
-        logger.debug(
-            f">>>>>>>>>>current_dtype: {current_dtype}"
             )
-        ##column_final_dtype = COLUMN_DTYPE_CONVERSION_MAP.get(current_dtype.__str__(), DEFAULT_DTYPE)
+            series = series.astype("Int64")
+            current_dtype = series.dtype
+
         # Date type needs to be converted to MILLIS from NANOS in all cases
-        if is_datetime64_any_dtype(df[col_name]):
+        if is_datetime64_any_dtype(current_dtype):
             try:
-                logger.debug(
-                    f"different column dtype detected: current_dtype={current_dtype}, item type from default=datetime64[ms]"
-                )
-                #df[col_name] = df[col_name].dt.floor('ms')
-                df[col_name] = df[col_name].dt.tz_localize(None)
-                df[col_name] = df[col_name].astype("datetime64[ms]")      
+                series = series.dt.tz_localize(None).astype("datetime64[ms]")
             except (ValueError, TypeError, OverflowError) as e:
                 logger.warning(
                     f"An {e.__class__.__name__} was caught when trying to convert "
                     + f"the dtype of the column {col_name} from {current_dtype} to datetime64[ms]"
                 )
-        
-        current_dtype = df[col_name].dtype
-        #if current_dtype != schema_of_this_column[DTYPE_KEY]:
-        logger.debug(
-            f">>>>>>>>>>current_dtype 1: {current_dtype}, "
-            f">>>>>>>>>>schema_of_this_column[DTYPE_KEY] 1: {schema_of_this_column[DTYPE_KEY]}, "
-            f"****is_datetime64_any_dtype(df['col_name']): {is_datetime64_any_dtype(df[col_name])}, "
-            f"****is_object_dtype(schema_of_this_column[DTYPE_KEY]): {is_object_dtype(schema_of_this_column[DTYPE_KEY])}"
-            )
-        ##if current_dtype == datetime and schema_of_this_column[DTYPE_KEY] == object:
-        #print(f"****is_datetime64_any_dtype(df['col_name']): {is_datetime64_any_dtype(df[col_name])}")
-        #print(f"****is_object_dtype(schema_of_this_column[DTYPE_KEY]): {is_object_dtype(schema_of_this_column[DTYPE_KEY])}")
-        if not (
-            is_datetime64_any_dtype(df[col_name])
-            and is_object_dtype(schema_of_this_column[DTYPE_KEY])
-        ):
+            current_dtype = series.dtype
+
+        if not (plan.object_schema_dtype and is_datetime64_any_dtype(current_dtype)):
             try:
-                df[col_name] = _cast_column_to_schema_dtype(
-                    col_name, df[col_name], schema_of_this_column[DTYPE_KEY]
+                series = _cast_column_to_schema_dtype(
+                    col_name, series, schema_of_this_column[DTYPE_KEY]
                 )
             except (ValueError, TypeError, OverflowError) as e:
                 logger.warning(
@@ -816,8 +1066,5 @@ def process_dataframe(table_name_param: str, df: pd.DataFrame):
                     f"the dtype of the column {col_name} from {current_dtype} "
                     f"to {schema_of_this_column[DTYPE_KEY]}"
                 )
-    # Check if conversion log file exists before pushing
-    logger.debug("conversion_flag: %s", conversion_flag)
-    conversion_log_path = os.path.join(get_table_dir(table_name), CONVERSION_LOG_FILE_NAME)
-    if os.path.exists(conversion_log_path) and conversion_flag:
-        push_file_to_lz(conversion_log_path, table_name)
+        if series is not column:
+            df[col_name] = series
@@ -12,11 +12,15 @@ logger = logging.getLogger(__name__)
 __schemas = {}
 __locks = {}
 __column_renamings = {}
+# bumped on every schema or column renaming change, see get_schema_version()
+__schema_versions = {}
+# False in transform worker processes, their schema changes are merged by the parent
+__persist_changes = True
 
 
 def write_table_schema_to_file(table_name: str):
     schema_of_this_table = __schemas.get(table_name, None)
-    if not schema_of_this_table:
+    if not schema_of_this_table or not __persist_changes:
         return
     logger.info(f"writing schema of {table_name} into file")
     write_to_file(
@@ -27,12 +31,14 @@ def write_table_schema_to_file(table_name: str):
 def init_table_schema(table_name: str, table_schema: dict):
     __schemas[table_name] = table_schema
     __locks[table_name] = threading.Lock()
+    __bump_schema_version(table_name)
     write_table_schema_to_file(table_name)
 
 # 9 May 2025 when schema file exists no need to rewrite it
 def init_table_schema_to_mem(table_name: str, table_schema: dict):
     __schemas[table_name] = table_schema
     __locks[table_name] = threading.Lock()
+    __bump_schema_version(table_name)
 #    write_table_schema_to_file(table_name)
 
 
@@ -49,13 +55,14 @@ def append_schema_column(table_name: str, column_name: str, column_schema: dict)
     with __locks[table_name]:
         # 1. append column
         __schemas.setdefault(table_name, {})[column_name] = column_schema
+        __bump_schema_version(table_name)
         # 2. write into file
         write_table_schema_to_file(table_name)
 
 
 def write_table_column_renaming_to_file(table_name: str):
     table_column_renaming = __column_renamings.get(table_name, None)
-    if not table_column_renaming:
+    if not table_column_renaming or not __persist_changes:
         return
     logger.info(f"writing column renaming of {table_name} into file")
     write_to_file(
@@ -65,9 +72,15 @@ def write_table_column_renaming_to_file(table_name: str):
 
 def init_column_renaming(table_name: str, column_renaming: dict):
     __column_renamings[table_name] = column_renaming
+    __bump_schema_version(table_name)
     write_table_column_renaming_to_file(table_name)
 
 
+def init_column_renaming_to_mem(table_name: str, column_renaming: dict):
+    __column_renamings[table_name] = column_renaming
+    __bump_schema_version(table_name)
+
+
 def add_column_renaming(
     table_name: str, original_column_name: str, new_column_name: str
 ):
@@ -75,6 +88,7 @@ def add_column_renaming(
         __column_renamings.setdefault(table_name, {})[
             original_column_name
         ] = new_column_name
+        __bump_schema_version(table_name)
         write_table_column_renaming_to_file(table_name)
 
 
@@ -84,3 +98,18 @@ def find_column_renaming(table_name: str, column_name: str) -> str:
 
 def get_table_column_renaming(table_name: str) -> dict:
     return __column_renamings.get(table_name, None)
+
+
+def set_schema_persistence(enabled: bool):
+    """With enabled=False schema and column renaming changes are kept in memory only."""
+    global __persist_changes
+    __persist_changes = enabled
+
+
+def get_schema_version(table_name: str) -> int:
+    """Changes whenever the schema or the column renaming of the table changes."""
+    return __schema_versions.get(table_name, 0)
+
+
+def __bump_schema_version(table_name: str):
+    __schema_versions[table_name] = __schema_versions.get(table_name, 0) + 1
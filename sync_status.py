@@ -0,0 +1,160 @@
+"""Per-collection replication status and change stream lag, served on /status by app.py."""
+
+from dataclasses import dataclass
+import logging
+import os
+import threading
+import time
+
+import pymongo
+from bson.timestamp import Timestamp
+from pymongo.errors import PyMongoError
+
+from constants import SYNC_PHASE_CATCH_UP, SYNC_PHASE_STREAMING
+from metrics import CHANGE_BUFFER_DEPTH, CHANGE_STREAM_LAG
+from mongo_cluster_time import get_cluster_time
+
+logger = logging.getLogger(__name__)
+
+__statuses = {}
+__statuses_lock = threading.Lock()
+__client = None
+__client_lock = threading.Lock()
+
+
+@dataclass
+class _CollectionStatus:
+    phase: str | None = None
+    # clusterTime of the last change event received, and of the last one in the landing zone
+    last_received_cluster_time: Timestamp | None = None
+    last_published_cluster_time: Timestamp | None = None
+    last_file_number: int | None = None
+    buffered_rows: int = 0
+    # the change stream had no further event and nothing is buffered
+    caught_up: bool = False
+    updated_at: float | None = None
+
+
+def set_phase(collection_name: str, phase: str):
+    with __statuses_lock:
+        status = __get_status(collection_name)
+        if status.phase != phase:
+            logger.info(f"{collection_name}: sync phase {status.phase} -> {phase}")
+        status.phase = phase
+        if phase != SYNC_PHASE_STREAMING:
+            status.caught_up = False
+
+
+def record_received(collection_name: str, cluster_time: Timestamp):
+    """A change event of the collection was received from the change stream."""
+    with __statuses_lock:
+        status = __get_status(collection_name)
+        status.last_received_cluster_time = cluster_time
+        status.caught_up = False
+    CHANGE_STREAM_LAG.set(time.time() - cluster_time.time, collection=collection_name)
+
+
+def record_published(collection_name: str, last_file_number: int, cluster_time: Timestamp = None):
+    """
+    A parquet file is in the landing zone; cluster_time is the clusterTime of its last
+    change event (None for init sync files).
+    """
+    with __statuses_lock:
+        status = __get_status(collection_name)
+        status.last_file_number = last_file_number
+        if cluster_time is not None:
+            status.last_published_cluster_time = cluster_time
+
+
+def set_buffered_rows(collection_name: str, buffered_rows: int):
+    with __statuses_lock:
+        __get_status(collection_name).buffered_rows = buffered_rows
+    CHANGE_BUFFER_DEPTH.set(buffered_rows, collection=collection_name)
+
+
+def set_stream_drained(collection_name: str):
+    """
+    The change stream had no further event: catch-up is over, and with nothing buffered
+    everything received is in the landing zone.
+    """
+    with __statuses_lock:
+        status = __get_status(collection_name)
+        if status.phase == SYNC_PHASE_CATCH_UP:
+            logger.info(f"{collection_name}: sync phase {status.phase} -> {SYNC_PHASE_STREAMING}")
+            status.phase = SYNC_PHASE_STREAMING
+        status.caught_up = status.phase == SYNC_PHASE_STREAMING and status.buffered_rows == 0
+
+
+def get_last_received_cluster_time(collection_name: str) -> Timestamp | None:
+    with __statuses_lock:
+        status = __statuses.get(collection_name)
+        return status.last_received_cluster_time if status else None
+
+
+def get_last_published_cluster_time(collection_name: str) -> Timestamp | None:
+    with __statuses_lock:
+        status = __statuses.get(collection_name)
+        return status.last_published_cluster_time if status else None
+
+
+def get_sync_status() -> dict:
+    """
+    Status of every collection, with lag_seconds of the last published change against
+    the current cluster time (0 once caught up, None if unknown) and receive_lag_seconds
+    of the last received change.
+    """
+    cluster_time = __get_current_cluster_time()
+    with __statuses_lock:
+        statuses = {name: _CollectionStatus(**vars(status)) for name, status in __statuses.items()}
+    collections = {}
+    for collection_name, status in sorted(statuses.items()):
+        collections[collection_name] = {
+            "phase": status.phase,
+            "last_file_number": status.last_file_number,
+            "buffered_rows": status.buffered_rows,
+            "caught_up": status.caught_up,
+            "last_received_cluster_time": __format_cluster_time(status.last_received_cluster_time),
+            "last_published_cluster_time": __format_cluster_time(status.last_published_cluster_time),
+            "receive_lag_seconds": __lag_seconds(cluster_time, status.last_received_cluster_time),
+            "lag_seconds": 0
+            if status.caught_up
+            else __lag_seconds(cluster_time, status.last_published_cluster_time),
+            "updated_at": status.updated_at,
+        }
+    return {
+        "cluster_time": __format_cluster_time(cluster_time),
+        "collections": collections,
+    }
+
+
+def __get_status(collection_name: str) -> _CollectionStatus:
+    # caller holds __statuses_lock
+    status = __statuses.get(collection_name)
+    if status is None:
+        status = __statuses[collection_name] = _CollectionStatus()
+    status.updated_at = time.time()
+    return status
+
+
+def __get_current_cluster_time() -> Timestamp | None:
+    global __client
+    try:
+        with __client_lock:
+            if __client is None:
+                __client = pymongo.MongoClient(os.getenv("MONGO_CONN_STR"))
+        return get_cluster_time(__client)
+    except (PyMongoError, RuntimeError) as e:
+        logger.warning(f"could not read the current cluster time: {e}")
+        return None
+
+
+def __lag_seconds(cluster_time: Timestamp | None, event_cluster_time: Timestamp | None) -> int | None:
+    if cluster_time is None or event_cluster_time is None:
+        return None
+    return max(0, cluster_time.time - event_cluster_time.time)
+
+
+def __format_cluster_time(cluster_time: Timestamp | None) -> str | None:
+    if cluster_time is None:
+        return None
+    return f"{cluster_time.as_datetime().isoformat()} (inc {cluster_time.inc})"
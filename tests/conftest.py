@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# nothing is uploaded from the tests
+os.environ.setdefault("DEBUG__SKIP_PUSH_TO_LZ", "1")
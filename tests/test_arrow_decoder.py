@@ -0,0 +1,64 @@
+from datetime import datetime
+
+import bson
+from bson.int64 import Int64
+import pandas as pd
+import pytest
+
+import schemas
+from arrow_decoder import documents_to_dataframe
+from constants import TYPE_KEY
+
+TIME = datetime(2024, 1, 1, 1, 2, 3, 456000)
+
+
+@pytest.fixture(autouse=True)
+def no_schema_persistence():
+    schemas.set_schema_persistence(False)
+    yield
+    schemas.set_schema_persistence(True)
+
+
+@pytest.mark.parametrize(
+    "schema_type, values, dtype",
+    [
+        (int, [1, Int64(2), None], "int64[pyarrow]"),
+        (int, [1, 1.5], "object"),
+        (int, [1, 2.0], "object"),
+        (int, [1, True], "object"),
+        (int, [1, 2**70], "object"),
+        (int, [None, None], "int64[pyarrow]"),
+        (float, [1.5, None, float("nan")], "double[pyarrow]"),
+        (float, [1.5, 2], "object"),
+        (float, [1.5, True], "object"),
+        (bool, [True, None], "bool[pyarrow]"),
+        (bool, [True, 1], "object"),
+        (str, ["a", None], "string[pyarrow]"),
+        (str, ["a", b"b"], "object"),
+        (str, ["a", bson.ObjectId()], "object"),
+        (datetime, [TIME, None], "timestamp[ms][pyarrow]"),
+        (datetime, [TIME, 5], "object"),
+    ],
+)
+def test_only_values_of_the_schema_type_are_decoded_by_arrow(schema_type, values, dtype):
+    schemas.init_table_schema_to_mem("arrow_decoder", {"c": {TYPE_KEY: schema_type}})
+    schemas.init_column_renaming_to_mem("arrow_decoder", {})
+    documents = [{"_id": index, "c": value} for index, value in enumerate(values)]
+
+    df = documents_to_dataframe("arrow_decoder", documents)
+
+    assert str(df["c"].dtype) == dtype
+    assert df["_id"].dtype == object
+    expected = pd.Series(values, dtype=object)
+    assert df["c"].astype(object).isna().tolist() == expected.isna().tolist()
+
+
+def test_columns_in_order_of_first_appearance():
+    schemas.init_table_schema_to_mem("arrow_decoder", {"a": {TYPE_KEY: int}})
+    schemas.init_column_renaming_to_mem("arrow_decoder", {})
+    documents = [{"_id": 1, "b": "x"}, {"a": 1, "_id": 2}, {"_id": 3, "b": "y", "a": 2}]
+
+    df = documents_to_dataframe("arrow_decoder", documents)
+
+    assert list(df.columns) == ["_id", "b", "a"]
+    assert df["a"].tolist()[1:] == [1, 2]
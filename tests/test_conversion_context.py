@@ -0,0 +1,86 @@
+import random
+import sys
+import threading
+
+import pandas as pd
+import pytest
+
+import conversion_log
+import schema_utils
+import schemas
+from constants import TYPE_KEY
+
+THREADS = 16
+TABLES = 6
+BATCHES_PER_THREAD = 40
+
+
+@pytest.fixture
+def recorded_failures(monkeypatch):
+    """Failures passed to conversion_log as (table, column, document _id, value); nothing is written."""
+    recorded = []
+    lock = threading.Lock()
+
+    def record_failure(table_name, column_name, document_id, original_value, target_type, converted_value):
+        with lock:
+            recorded.append((table_name, column_name, str(document_id), original_value))
+        return False
+
+    monkeypatch.setattr(conversion_log, "record_failure", record_failure)
+    monkeypatch.setattr(conversion_log, "flush_conversion_log", lambda *args, **kwargs: None)
+    schemas.set_schema_persistence(False)
+    switch_interval = sys.getswitchinterval()
+    # switch threads as often as possible to surface races
+    sys.setswitchinterval(1e-6)
+    yield recorded
+    sys.setswitchinterval(switch_interval)
+    schemas.set_schema_persistence(True)
+
+
+def test_process_dataframe_from_many_threads(recorded_failures):
+    table_names = [f"conversion_context_{index}" for index in range(TABLES)]
+    for table_name in table_names:
+        schemas.init_table_schema_to_mem(table_name, {})
+        schemas.init_column_renaming_to_mem(table_name, {})
+    expected_failures = []
+    errors = []
+    lock = threading.Lock()
+
+    def process_batches(seed: int):
+        rng = random.Random(seed)
+        for _ in range(BATCHES_PER_THREAD):
+            table_name = rng.choice(table_names)
+            column_names = [f"c{index}" for index in range(rng.randint(1, 6))]
+            ids = [rng.randint(0, 10**9) for _ in range(rng.randint(2, 50))]
+            data = {"_id": ids}
+            for column_name in column_names:
+                # the first value makes the column int, every other one fails and names its origin
+                data[column_name] = [1] + [f"{table_name}|{column_name}|{_id}" for _id in ids[1:]]
+            try:
+                schema_utils.process_dataframe(table_name, pd.DataFrame(data))
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+            with lock:
+                expected_failures.extend(
+                    (table_name, column_name, str(_id)) for column_name in column_names for _id in ids[1:]
+                )
+
+    threads = [threading.Thread(target=process_batches, args=(seed,)) for seed in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    # every failure is attributed to the table, column and document of its value
+    misattributed = [
+        failure for failure in recorded_failures if failure[3] != "|".join(failure[:3])
+    ]
+    assert not misattributed
+    assert sorted(failure[:3] for failure in recorded_failures) == sorted(expected_failures)
+    # concurrent batches agreed on one schema per column
+    for table_name in table_names:
+        for column_name, column_schema in schemas.get_table_schema(table_name).items():
+            if column_name != "_id":
+                assert column_schema[TYPE_KEY] is int, (table_name, column_name)
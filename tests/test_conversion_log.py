@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+import conversion_log
+from utils import get_table_dir
+
+
+@pytest.fixture
+def landing_zone(monkeypatch):
+    """Conversion log files in a fake landing zone; uploads fail while "fail" is set."""
+    lz = {"files": set(), "fail": False, "deleted": []}
+
+    def push_file_to_lz(file_path, table_name):
+        if lz["fail"]:
+            raise ConnectionError("landing zone not reachable")
+        lz["files"].add(os.path.basename(file_path))
+
+    def delete_file_from_lz(table_name, file_name):
+        lz["files"].discard(file_name)
+        lz["deleted"].append(file_name)
+
+    monkeypatch.delenv("DEBUG__SKIP_PUSH_TO_LZ", raising=False)
+    monkeypatch.setenv("CONVERSION_LOG_MAX_SEGMENTS", "2")
+    monkeypatch.setattr(conversion_log, "push_file_to_lz", push_file_to_lz)
+    monkeypatch.setattr(conversion_log, "delete_file_from_lz", delete_file_from_lz)
+    monkeypatch.setattr(conversion_log, "list_files_from_lz", lambda table_name: sorted(lz["files"]))
+    monkeypatch.setattr(conversion_log, "__start_uploader", lambda: None)
+    return lz
+
+
+def _record_failure(table_name: str):
+    conversion_log.record_failure(table_name, "a", 1, "x", "int", None)
+
+
+def _local_segments(table_name: str) -> list:
+    return [
+        file_name
+        for file_name in os.listdir(get_table_dir(table_name))
+        if file_name.startswith(conversion_log.CONVERSION_LOG_FILE_PREFIX)
+    ]
+
+
+def test_failed_uploads_are_uploaded_with_the_next_segment(landing_zone):
+    table_name = "conversion_log_requeue"
+    _record_failure(table_name)
+    landing_zone["fail"] = True
+
+    assert conversion_log.flush_conversion_log(table_name, force=True) is None
+    failed_segments = _local_segments(table_name)
+    assert len(failed_segments) == 1
+
+    landing_zone["fail"] = False
+    _record_failure(table_name)
+    file_name = conversion_log.flush_conversion_log(table_name, force=True)
+
+    assert landing_zone["files"] == {failed_segments[0], file_name}
+    assert _local_segments(table_name) == []
+
+
+def test_segments_of_earlier_runs_are_pruned(landing_zone):
+    table_name = "conversion_log_earlier_runs"
+    earlier_segments = [
+        f"{conversion_log.CONVERSION_LOG_FILE_PREFIX}20200101T000000_{number}.txt" for number in (1, 2, 10)
+    ]
+    landing_zone["files"].update(earlier_segments + ["00000000000000000001.parquet"])
+    _record_failure(table_name)
+
+    file_name = conversion_log.flush_conversion_log(table_name, force=True)
+
+    assert landing_zone["deleted"] == earlier_segments[:2]
+    assert landing_zone["files"] == {earlier_segments[2], file_name, "00000000000000000001.parquet"}
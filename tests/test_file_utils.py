@@ -0,0 +1,101 @@
+import os
+import pickle
+
+import pytest
+
+import file_utils
+from utils import get_table_dir
+
+TABLE_NAME = "file_utils_state"
+FILE_NAME = "_last_created_parquet.pkl"
+
+
+class _Response:
+    def __init__(self, status_code, content=b"", etag=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {"ETag": etag}
+
+
+@pytest.fixture
+def landing_zone(monkeypatch):
+    """A state file in a fake landing zone, served with its ETag and If-None-Match."""
+    lz = {"content": pickle.dumps(1), "etag": '"1"', "push_fails": False, "delete_status": 200}
+
+    def get_file_from_lz(table_name, file_name, etag=None):
+        if lz["content"] is None:
+            return None, _Response(404)
+        if etag == lz["etag"]:
+            return 304, _Response(304)
+        return 200, _Response(200, lz["content"], lz["etag"])
+
+    def push_file_to_lz(file_path, table_name):
+        if lz["push_fails"]:
+            raise ConnectionError("landing zone not reachable")
+        with open(file_path, "rb") as file:
+            lz["content"] = file.read()
+        lz["etag"] = f'"{int(lz["etag"].strip(chr(34))) + 1}"'
+        return lz["etag"]
+
+    def delete_file_from_lz(table_name, file_name):
+        if lz["delete_status"] == 200:
+            lz["content"] = None
+        return lz["delete_status"]
+
+    monkeypatch.setenv("STATE_CACHE_DISK_MIRROR", "1")
+    monkeypatch.setattr(file_utils, "get_file_from_lz", get_file_from_lz)
+    monkeypatch.setattr(file_utils, "push_file_to_lz", push_file_to_lz)
+    monkeypatch.setattr(file_utils, "delete_file_from_lz", delete_file_from_lz)
+    for path in (FILE_NAME, FILE_NAME + file_utils.STATE_CACHE_ETAG_SUFFIX):
+        if os.path.exists(os.path.join(get_table_dir(TABLE_NAME), path)):
+            os.remove(os.path.join(get_table_dir(TABLE_NAME), path))
+    yield lz
+    getattr(file_utils, "__state_cache").pop((TABLE_NAME, FILE_NAME), None)
+
+
+def _restart():
+    """A new process: the disk mirror stays, the in-memory cache is gone."""
+    getattr(file_utils, "__state_cache").pop((TABLE_NAME, FILE_NAME), None)
+
+
+def _read():
+    return file_utils.read_from_file(TABLE_NAME, FILE_NAME, file_utils.FileType.PICKLE)
+
+
+def test_failed_write_is_not_served_as_the_landing_zone_version(landing_zone):
+    assert _read() == 1
+    landing_zone["push_fails"] = True
+
+    with pytest.raises(ConnectionError):
+        file_utils.write_to_file(2, TABLE_NAME, FILE_NAME, file_utils.FileType.PICKLE)
+    _restart()
+
+    assert _read() == 1
+
+
+def test_mirrored_write_is_revalidated(landing_zone):
+    file_utils.write_to_file(2, TABLE_NAME, FILE_NAME, file_utils.FileType.PICKLE)
+    _restart()
+    not_modified = file_utils.get_state_cache_stats()["not_modified"]
+
+    assert _read() == 2
+    assert file_utils.get_state_cache_stats()["not_modified"] == not_modified + 1
+
+
+def test_failed_delete_is_not_cached_as_missing(landing_zone):
+    assert _read() == 1
+    landing_zone["delete_status"] = None
+
+    file_utils.delete_file(TABLE_NAME, FILE_NAME)
+
+    assert _read() == 1
+
+
+@pytest.mark.parametrize("delete_status", [200, 404])
+def test_deleted_file_is_cached_as_missing(landing_zone, delete_status):
+    landing_zone["delete_status"] = delete_status
+
+    file_utils.delete_file(TABLE_NAME, FILE_NAME)
+    landing_zone["content"] = pickle.dumps(3)
+
+    assert _read() is None
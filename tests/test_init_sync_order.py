@@ -0,0 +1,58 @@
+import logging
+
+from pymongo.errors import OperationFailure
+
+import mongodb_generic_mirroring
+from constants import INIT_SYNC_ORDER_LARGEST_FIRST
+
+
+class _Collection:
+    def __init__(self, storage_size, document_count):
+        self.storage_size = storage_size
+        self.document_count = document_count
+
+    def aggregate(self, pipeline):
+        if self.storage_size is None:
+            raise OperationFailure("$collStats is not allowed")
+        return iter([{"storageStats": {"size": self.storage_size}}])
+
+    def estimated_document_count(self):
+        return self.document_count
+
+
+class _Database:
+    def __init__(self, collections):
+        self.collections = collections
+
+    def __getitem__(self, name):
+        # client[db_name] and db[collection_name]
+        return self.collections[name] if name in self.collections else self
+
+    def close(self):
+        pass
+
+
+def _order(monkeypatch, collections):
+    monkeypatch.setattr(
+        mongodb_generic_mirroring.pymongo, "MongoClient", lambda *args, **kwargs: _Database(collections)
+    )
+    order_collections_by_size = getattr(mongodb_generic_mirroring, "__order_collections_by_size")
+    return order_collections_by_size(
+        list(collections), INIT_SYNC_ORDER_LARGEST_FIRST, logging.getLogger(__name__)
+    )
+
+
+def test_orders_by_storage_size(monkeypatch):
+    collections = {"small": _Collection(10, 1000), "big": _Collection(10**9, 10)}
+
+    assert _order(monkeypatch, collections) == ["big", "small"]
+
+
+def test_orders_all_by_document_count_if_one_has_no_storage_size(monkeypatch):
+    collections = {
+        "big": _Collection(10**9, 10),
+        "many_documents": _Collection(None, 1000),
+        "some_documents": _Collection(10, 100),
+    }
+
+    assert _order(monkeypatch, collections) == ["many_documents", "some_documents", "big"]
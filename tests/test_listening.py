@@ -0,0 +1,208 @@
+import os
+
+from bson.timestamp import Timestamp
+import pytest
+
+import listening
+import sync_status
+from constants import (
+    CHANGE_STREAM_OPERATION_MAP,
+    INIT_SYNC_STATUS_FILE_NAME,
+    SYNC_PHASE_STREAMING,
+    TEMP_PREFIX_DURING_INIT,
+)
+
+
+class _StopListening(Exception):
+    pass
+
+
+class _Stream:
+    def __init__(self, changes):
+        self.changes = list(changes)
+        self.alive = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def try_next(self):
+        if self.changes:
+            return self.changes.pop(0)
+        raise _StopListening()
+
+
+class _Database:
+    def __init__(self, changes):
+        self.changes = changes
+
+    def __getitem__(self, collection_name):
+        return self
+
+    def watch(self, *args, **kwargs):
+        return _Stream(self.changes)
+
+
+class _Client:
+    def __init__(self, changes):
+        self.changes = changes
+
+    def __getitem__(self, db_name):
+        return _Database(self.changes)
+
+
+def _change(number: int, collection_name: str, operation_type: str, document_id, full_document=True):
+    change = {
+        "_id": {"_data": f"{number:04d}"},
+        "ns": {"db": "db", "coll": collection_name},
+        "operationType": operation_type,
+        "clusterTime": Timestamp(100, number),
+        "documentKey": {"_id": document_id},
+    }
+    if operation_type != "delete":
+        # updateLookup finds no document if it was deleted before the lookup
+        change["fullDocument"] = {"_id": document_id, "a": number} if full_document else None
+    return change
+
+
+@pytest.fixture
+def buffered_rows(monkeypatch):
+    """Rows of every buffer the listener hands to process_accumulative_df; nothing is flushed."""
+    buffered = []
+
+    def process_accumulative_df(change_buffer, collection_name, *args):
+        # what a flush does first, fails on a row that is not a document
+        listening.documents_to_dataframe(collection_name, change_buffer.documents)
+        buffered.append((collection_name, list(change_buffer.documents)))
+
+    monkeypatch.setenv("MONGO_DB_NAME", "db")
+    monkeypatch.setenv("TIME_THRESHOLD_IN_SEC", "1000")
+    monkeypatch.setenv("DELTA_SYNC_BATCH_SIZE", "1000")
+    monkeypatch.setattr(listening, "process_accumulative_df", process_accumulative_df)
+    monkeypatch.setattr(
+        listening,
+        "read_from_file",
+        lambda table_name, file_name, file_type: "Y" if file_name == INIT_SYNC_STATUS_FILE_NAME else None,
+    )
+    monkeypatch.setattr(listening, "write_to_file", lambda *args: None)
+    monkeypatch.setattr(listening, "seed_bytes_per_row", lambda *args: None)
+    monkeypatch.setattr(listening, "__post_init_flush", lambda *args: None)
+    return buffered
+
+
+def test_listening_skips_updates_of_deleted_documents(monkeypatch, buffered_rows):
+    changes = [
+        _change(1, "listening_c1", "insert", 1),
+        _change(2, "listening_c1", "update", 1, full_document=False),
+        _change(3, "listening_c1", "delete", 1),
+    ]
+    monkeypatch.setattr(listening, "__get_change_stream_client", lambda: _Client(changes))
+
+    with pytest.raises(_StopListening):
+        listening.listening("listening_c1")
+
+    assert buffered_rows[-1] == ("listening_c1", [{"_id": 1, "a": 1}, {"_id": 1}])
+
+
+def test_listening_database_skips_updates_of_deleted_documents(monkeypatch, buffered_rows):
+    changes = [
+        _change(1, "listening_c1", "insert", 1),
+        _change(2, "listening_c2", "update", 2, full_document=False),
+        _change(3, "listening_c1", "update", 1, full_document=False),
+        _change(4, "listening_c2", "insert", 3),
+    ]
+    monkeypatch.setattr(listening, "__get_change_stream_client", lambda: _Client(changes))
+
+    with pytest.raises(_StopListening):
+        listening.listening_database(["listening_c1", "listening_c2"])
+
+    assert ("listening_c1", [{"_id": 1, "a": 1}]) in buffered_rows
+    assert buffered_rows[-1] == ("listening_c2", [{"_id": 3, "a": 4}])
+    assert all(None not in rows for _, rows in buffered_rows)
+
+
+def test_coalesce_changes_keys_on_the_document_key():
+    coalesce_changes = getattr(listening, "__coalesce_changes")
+    insert, update, delete = (CHANGE_STREAM_OPERATION_MAP[op] for op in ("insert", "update", "delete"))
+    # rows are matched by the documentKey _id of their events, not by the rows themselves
+    documents = [{"a": 1}, {"a": 2}, {"a": 3}, {"_id": 2}]
+    document_ids = [1, 2, 1, 2]
+
+    assert coalesce_changes(documents, document_ids, [insert, update, update, delete]) == (
+        [{"a": 3}, {"_id": 2}],
+        [insert, delete],
+    )
+
+
+def test_listening_database_checks_every_buffer_under_steady_traffic(monkeypatch, buffered_rows):
+    changes = [_change(1, "listening_c1", "insert", 1)] + [
+        _change(number, "listening_c2", "insert", number) for number in range(2, 6)
+    ]
+    monkeypatch.setattr(listening, "__get_change_stream_client", lambda: _Client(changes))
+    monkeypatch.setattr(listening, "DATABASE_CHANGE_STREAM_FLUSH_CHECK_INTERVAL_SEC", 0)
+
+    with pytest.raises(_StopListening):
+        listening.listening_database(["listening_c1", "listening_c2"])
+
+    # the time threshold of listening_c1 is checked while only listening_c2 gets events
+    assert [collection_name for collection_name, _ in buffered_rows].count("listening_c1") == 5
+
+
+def test_listening_streams_without_events_after_init_sync(monkeypatch, buffered_rows):
+    post_init_flushes = []
+    # the change stream has no event
+    monkeypatch.setattr(listening, "__get_change_stream_client", lambda: _Client([None]))
+    monkeypatch.setattr(listening, "__post_init_flush", lambda *args: post_init_flushes.append(args[0]))
+    monkeypatch.setattr(sync_status, "__get_current_cluster_time", lambda: None)
+
+    with pytest.raises(_StopListening):
+        listening.listening("listening_idle")
+
+    assert post_init_flushes == ["listening_idle"]
+    assert sync_status.get_sync_status()["collections"]["listening_idle"]["phase"] == SYNC_PHASE_STREAMING
+
+
+@pytest.mark.parametrize("fsync_events, expected_fsyncs", [(None, 0), ("0", 0), ("1", 5), ("2", 2)])
+def test_spill_segment_fsyncs_every_n_events(monkeypatch, fsync_events, expected_fsyncs):
+    fsyncs = []
+    if fsync_events is not None:
+        monkeypatch.setenv("DELTA_SYNC_SPILL_FSYNC_EVENTS", fsync_events)
+    monkeypatch.setattr(listening.os, "fsync", fsyncs.append)
+    spill_segment = listening._SpillSegment("listening_spill")
+    spill_segment.clear()
+
+    for number in range(5):
+        spill_segment.append({"_id": number}, number, 0, {"_data": f"{number:04d}"})
+
+    assert len(fsyncs) == expected_fsyncs
+    assert len(spill_segment.read()) == 5
+    spill_segment.clear()
+
+
+def test_post_init_flush_publishes_a_single_temp_file_without_hard_links(monkeypatch):
+    table_name = "listening_post_init_flush"
+    table_dir = listening.get_table_dir(table_name)
+    temp_file_path = os.path.join(table_dir, f"{TEMP_PREFIX_DURING_INIT}00000000000000000001.parquet")
+    with open(temp_file_path, "wb") as file:
+        file.write(b"parquet")
+    published = {}
+
+    def link(source, target):
+        raise OSError("hard links are not supported")
+
+    def push_file_to_lz(file_path, table_name):
+        with open(file_path, "rb") as file:
+            published[os.path.basename(file_path)] = file.read()
+
+    monkeypatch.setattr(listening.os, "link", link)
+    monkeypatch.setattr(listening, "push_file_to_lz", push_file_to_lz)
+    monkeypatch.setattr(listening, "read_from_file", lambda *args: 3)
+    monkeypatch.setattr(listening, "write_to_file", lambda *args: None)
+
+    getattr(listening, "__post_init_flush")(table_name, None)
+
+    new_file_name = os.path.basename(listening.get_parquet_full_path_filename(table_name, 3))
+    assert published == {new_file_name: b"parquet"}
+    assert not os.path.exists(temp_file_path)
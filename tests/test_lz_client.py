@@ -0,0 +1,66 @@
+import pytest
+
+import lz_client
+
+
+class _Response:
+    status_code = 503
+    headers = {}
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def new_client(monkeypatch):
+    """get_lz_client() builds a new client from the environment."""
+    monkeypatch.setattr(lz_client, "__client", None)
+    for name in (
+        "LZ_HTTP_POOL_SIZE",
+        "LZ_HTTP_MAX_RETRIES",
+        "INIT_SYNC_MAX_WORKERS",
+        "LZ_UPLOAD_PARALLEL_CHUNKS",
+        "INIT_SYNC_TRANSFORM_WORKERS",
+        "INIT_SYNC_TRANSFORM_PROCESSES",
+    ):
+        monkeypatch.delenv(name, raising=False)
+
+
+def test_pool_size_defaults_to_the_init_sync_workers(monkeypatch, new_client):
+    monkeypatch.setattr(lz_client, "LandingZoneClient", lambda pool_size, max_retries: pool_size)
+    monkeypatch.setenv("INIT_SYNC_MAX_WORKERS", "3")
+    monkeypatch.setenv("LZ_UPLOAD_PARALLEL_CHUNKS", "4")
+    monkeypatch.setenv("INIT_SYNC_TRANSFORM_WORKERS", "2")
+
+    assert lz_client.get_lz_client() == 3 * (4 + 2)
+
+
+def test_no_retries(monkeypatch, new_client):
+    requests_sent = []
+    monkeypatch.setenv("LZ_HTTP_MAX_RETRIES", "0")
+    client = lz_client.get_lz_client()
+    monkeypatch.setattr(
+        client.session, "request", lambda *args, **kwargs: requests_sent.append(args) or _Response()
+    )
+
+    assert client.get("https://onelake.example/file").status_code == 503
+    assert len(requests_sent) == 1
+
+
+@pytest.mark.parametrize("status_code, requests_expected", [(500, 1), (504, 1), (503, 2), (429, 2)])
+def test_non_idempotent_request_is_only_retried_when_rejected(
+    monkeypatch, status_code, requests_expected
+):
+    status_codes = [status_code, 201]
+    client = lz_client.LandingZoneClient(pool_size=1, max_retries=5)
+    monkeypatch.setattr(lz_client.time, "sleep", lambda seconds: None)
+
+    def request(*args, **kwargs):
+        response = _Response()
+        response.status_code = status_codes.pop(0)
+        return response
+
+    monkeypatch.setattr(client.session, "request", request)
+
+    client.put("https://onelake.example/file", idempotent=False)
+    assert len(status_codes) == 2 - requests_expected
@@ -0,0 +1,23 @@
+import pandas as pd
+
+import parquet_writer
+
+
+def _write(tmp_path, rows: int) -> str:
+    file_path = str(tmp_path / f"{rows}.parquet")
+    parquet_writer.write_parquet(pd.DataFrame({"a": range(rows), "b": ["value"] * rows}), file_path)
+    return file_path
+
+
+def test_small_files_do_not_update_the_bytes_per_row_estimate(tmp_path):
+    table_name = "parquet_writer_small_files"
+    max_rows = 10**9
+    large_file = _write(tmp_path, 100000)
+    parquet_writer.record_parquet_file(table_name, large_file, 100000)
+    rows_per_file = parquet_writer.get_rows_per_file(table_name, max_rows)
+
+    for _ in range(5):
+        parquet_writer.record_parquet_file(table_name, _write(tmp_path, 3), 3)
+
+    assert rows_per_file < max_rows
+    assert parquet_writer.get_rows_per_file(table_name, max_rows) == rows_per_file
@@ -0,0 +1,108 @@
+import pytest
+
+import lz_client
+import push_file_to_lz
+
+
+class _Response:
+    headers = {}
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.ok = status_code < 400
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def responses(monkeypatch):
+    """Status codes the landing zone answers with, in order; sent requests are counted."""
+    sent = {"codes": [], "count": 0}
+
+    def request(*args, **kwargs):
+        sent["count"] += 1
+        return _Response(sent["codes"].pop(0))
+
+    client = lz_client.LandingZoneClient(pool_size=1, max_retries=5)
+    monkeypatch.setattr(client.session, "request", request)
+    monkeypatch.setattr(push_file_to_lz, "get_lz_client", lambda: client)
+    monkeypatch.setattr(lz_client.time, "sleep", lambda seconds: None)
+    return sent
+
+
+def _append_chunk():
+    getattr(push_file_to_lz, "__append_data")(
+        "token", "https://onelake.example/_00000000000000000001.parquet_TEMP", "file", 0, b"data"
+    )
+
+
+def test_chunk_rejected_by_the_landing_zone_is_sent_once(responses):
+    responses["codes"] = [403]
+
+    with pytest.raises(Exception, match="403"):
+        _append_chunk()
+    assert responses["count"] == 1
+
+
+def test_throttled_chunk_is_retried_by_the_client(responses):
+    responses["codes"] = [503, 202]
+
+    _append_chunk()
+    assert responses["count"] == 2
+
+
+class _LandingZone:
+    """Answers create / append / rename requests with the given status codes, HEAD with the file size."""
+
+    def __init__(self, create=201, rename=201, renamed_size=None):
+        self.status_codes = {"PUT create": create, "PATCH": 200, "PUT rename": rename}
+        self.renamed_size = renamed_size
+
+    def request(self, method, url, **kwargs):
+        response = _Response(404 if self.renamed_size is None else 200)
+        if method == "HEAD":
+            response.headers = {"Content-Length": str(self.renamed_size), "ETag": '"renamed"'}
+            return response
+        if method == "PUT":
+            method += " rename" if "x-ms-rename-source" in kwargs["headers"] else " create"
+        response = _Response(self.status_codes[method])
+        response.headers = {"ETag": '"published"'}
+        return response
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+
+def _patch_file(monkeypatch, tmp_path, landing_zone):
+    file_path = tmp_path / "00000000000000000001.parquet"
+    file_path.write_bytes(b"data")
+    monkeypatch.setattr(push_file_to_lz, "get_lz_client", lambda: landing_zone)
+    return getattr(push_file_to_lz, "__patch_file")(
+        "token", str(file_path), "https://onelake.example/LandingZone", "table"
+    )
+
+
+def test_published_file_returns_its_etag(monkeypatch, tmp_path):
+    assert _patch_file(monkeypatch, tmp_path, _LandingZone()) == '"published"'
+
+
+@pytest.mark.parametrize("landing_zone", [_LandingZone(create=403), _LandingZone(rename=409)])
+def test_failed_create_or_rename_raises(monkeypatch, tmp_path, landing_zone):
+    with pytest.raises(Exception, match="Server responded with code"):
+        _patch_file(monkeypatch, tmp_path, landing_zone)
+
+
+def test_rename_that_already_went_through_is_published(monkeypatch, tmp_path):
+    landing_zone = _LandingZone(rename=404, renamed_size=len(b"data"))
+
+    assert _patch_file(monkeypatch, tmp_path, landing_zone) == '"renamed"'
+
+
+@pytest.mark.parametrize("renamed_size", [None, 3])
+def test_rename_without_the_published_file_raises(monkeypatch, tmp_path, renamed_size):
+    with pytest.raises(Exception, match="404"):
+        _patch_file(monkeypatch, tmp_path, _LandingZone(rename=404, renamed_size=renamed_size))
@@ -0,0 +1,190 @@
+import logging
+import os
+import threading
+import time
+
+from bson.timestamp import Timestamp
+import pandas as pd
+import pytest
+
+import file_utils
+import listening
+import mongodb_generic_mirroring
+import schemas
+from constants import (
+    CHANGE_STREAM_MODE_COLLECTION,
+    CHANGE_STREAM_OPERATION_MAP_WHEN_INIT,
+    DELTA_SYNC_SPILL_SEGMENT_FILE_NAME,
+    INIT_SYNC_CLUSTER_TIME_FILE_NAME,
+    INIT_SYNC_STATUS_FILE_NAME,
+    ROW_MARKER_COLUMN_NAME,
+)
+from file_utils import FileType, write_to_file
+from utils import get_table_dir
+
+
+class _Response:
+    def __init__(self, status_code, content=b""):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {}
+
+
+class _Stream:
+    """Hands out the changes, then sets drained and waits like an idle change stream."""
+
+    def __init__(self, changes, drained):
+        self.changes = changes
+        self.drained = drained
+        self.alive = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def try_next(self):
+        if self.changes:
+            return self.changes.pop(0)
+        self.drained.set()
+        time.sleep(0.01)
+        return None
+
+
+class _Client:
+    def __init__(self, changes, drained):
+        self.stream = _Stream(changes, drained)
+        self.watch_kwargs = None
+
+    def __getitem__(self, name):
+        return self
+
+    def watch(self, **kwargs):
+        self.watch_kwargs = kwargs
+        return self.stream
+
+    def close(self):
+        pass
+
+
+def _insert(number: int):
+    return {
+        "_id": {"_data": f"{number:04d}"},
+        "operationType": "insert",
+        "clusterTime": Timestamp(200, number),
+        "documentKey": {"_id": number},
+        "fullDocument": {"_id": number, "a": number},
+    }
+
+
+@pytest.fixture
+def collection(monkeypatch):
+    """A collection whose listener runs in a thread; published parquet files and threads are collected."""
+    collection_name = "sync_collection_overlap"
+    lz = {}
+    published = []
+    threads = []
+
+    def get_file_from_lz(table_name, file_name, etag=None):
+        if (table_name, file_name) in lz:
+            return 200, _Response(200, lz[(table_name, file_name)])
+        return None, _Response(404)
+
+    def push_file_to_lz(file_path, table_name):
+        with open(file_path, "rb") as file:
+            lz[(table_name, os.path.basename(file_path))] = file.read()
+
+    def publish(file_path, table_name):
+        published.append(pd.read_parquet(file_path))
+
+    def thread(target, args):
+        threads.append((threading.Thread(target=target, args=args), args[1]))
+        return threads[-1][0]
+
+    for file_name in os.listdir(get_table_dir(collection_name)):
+        os.remove(os.path.join(get_table_dir(collection_name), file_name))
+    monkeypatch.setenv("MONGO_DB_NAME", "db")
+    monkeypatch.setenv("TIME_THRESHOLD_IN_SEC", "1000")
+    monkeypatch.setenv("DELTA_SYNC_BATCH_SIZE", "2")
+    monkeypatch.setattr(file_utils, "get_file_from_lz", get_file_from_lz)
+    monkeypatch.setattr(file_utils, "push_file_to_lz", push_file_to_lz)
+    monkeypatch.setattr(listening, "push_file_to_lz", publish)
+    monkeypatch.setattr(listening, "seed_bytes_per_row", lambda *args: None)
+    monkeypatch.setattr(mongodb_generic_mirroring, "push_file_to_lz", lambda *args: None)
+    monkeypatch.setattr(
+        mongodb_generic_mirroring,
+        "init_table_schema",
+        lambda collection_name: schemas.init_table_schema_to_mem(collection_name, {}),
+    )
+    monkeypatch.setattr(mongodb_generic_mirroring, "Thread", thread)
+    yield collection_name, published, threads
+    for thread, stop_event in threads:
+        stop_event.set()
+        thread.join(timeout=5)
+    getattr(file_utils, "__state_cache").clear()
+
+
+def _sync_collection(monkeypatch, collection_name, init_sync):
+    monkeypatch.setattr(mongodb_generic_mirroring, "init_sync", init_sync)
+    sync_collection = getattr(mongodb_generic_mirroring, "__sync_collection")
+    return sync_collection(collection_name, CHANGE_STREAM_MODE_COLLECTION, logging.getLogger(__name__))
+
+
+def _start_init_sync(collection_name):
+    write_to_file("N", collection_name, INIT_SYNC_STATUS_FILE_NAME, FileType.PICKLE)
+    write_to_file(Timestamp(200, 0), collection_name, INIT_SYNC_CLUSTER_TIME_FILE_NAME, FileType.PICKLE)
+
+
+def _wait_for(condition):
+    deadline = time.time() + 5
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    assert condition()
+
+
+def test_changes_made_during_init_sync_are_spilled_and_published(monkeypatch, collection):
+    collection_name, published, threads = collection
+    drained = threading.Event()
+    client = _Client([_insert(number) for number in (1, 2, 3)], drained)
+    monkeypatch.setattr(listening, "__get_change_stream_client", lambda: client)
+
+    def init_sync(collection_name, on_cluster_time=None):
+        _start_init_sync(collection_name)
+        on_cluster_time()
+        # the listener receives every change while init sync is still running
+        assert drained.wait(timeout=5)
+        assert published == []
+        assert os.path.exists(os.path.join(get_table_dir(collection_name), DELTA_SYNC_SPILL_SEGMENT_FILE_NAME))
+        write_to_file("Y", collection_name, INIT_SYNC_STATUS_FILE_NAME, FileType.PICKLE)
+
+    assert _sync_collection(monkeypatch, collection_name, init_sync)
+
+    _wait_for(lambda: published)
+    assert client.watch_kwargs["start_at_operation_time"] == Timestamp(200, 1)
+    rows = pd.concat(published)
+    assert rows["_id"].tolist() == [1, 2, 3]
+    assert set(rows[ROW_MARKER_COLUMN_NAME]) == {CHANGE_STREAM_OPERATION_MAP_WHEN_INIT["insert"]}
+    assert len(threads) == 1
+
+
+def test_listener_is_stopped_when_init_sync_fails(monkeypatch, collection):
+    collection_name, published, threads = collection
+    drained = threading.Event()
+    monkeypatch.setattr(listening, "__get_change_stream_client", lambda: _Client([_insert(1)], drained))
+
+    def init_sync(collection_name, on_cluster_time=None):
+        _start_init_sync(collection_name)
+        on_cluster_time()
+        assert drained.wait(timeout=5)
+        raise RuntimeError("init sync failed")
+
+    assert not _sync_collection(monkeypatch, collection_name, init_sync)
+
+    thread, stop_event = threads[0]
+    assert stop_event.is_set()
+    thread.join(timeout=5)
+    assert not thread.is_alive()
+    assert published == []
+    # the spilled change is resumed after a restart
+    assert os.path.exists(os.path.join(get_table_dir(collection_name), DELTA_SYNC_SPILL_SEGMENT_FILE_NAME))
@@ -0,0 +1,140 @@
+"""
+Optional process pool for the init sync transform stage (INIT_SYNC_TRANSFORM_PROCESSES).
+
+The per-value converters of process_dataframe are pure Python and hold the GIL, so more
+transformer threads do not add throughput on collections that need many conversions.
+A worker process gets the raw BSON of a batch through shared memory, together with a
+copy of the current table schema, decodes, processes and finalizes the batch, and
+returns the parquet file bytes with the columns it added to the schema. The parent
+merges those into schemas; a batch whose new columns were meanwhile added to the
+schema with another type is transformed again in the parent, so every file matches it.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import io
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import threading
+
+import bson
+
+import conversion_log
+import schema_utils
+import schemas
+from arrow_decoder import documents_to_dataframe
+from parquet_writer import write_parquet
+from utils import get_positive_int_env
+
+logger = logging.getLogger(__name__)
+
+__executor = None
+__executor_lock = threading.Lock()
+
+
+def get_transform_process_count() -> int:
+    """INIT_SYNC_TRANSFORM_PROCESSES, 0 (or unset) transforms in the init sync threads."""
+    if os.getenv("INIT_SYNC_TRANSFORM_PROCESSES", "").strip() == "0":
+        return 0
+    return get_positive_int_env("INIT_SYNC_TRANSFORM_PROCESSES", 0)
+
+
+def transform_raw_batch(table_name: str, raw_bson: bytes) -> tuple[bytes, int]:
+    """Parquet file bytes and row count of a batch of raw BSON documents, in a worker process."""
+    table_schema = dict(schemas.get_table_schema(table_name) or {})
+    column_renaming = dict(schemas.get_table_column_renaming(table_name) or {})
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(raw_bson)))
+    try:
+        block.buf[: len(raw_bson)] = raw_bson
+        parquet_bytes, row_count, new_columns, new_column_renaming, failures = (
+            __get_executor()
+            .submit(
+                _transform_in_worker,
+                table_name,
+                block.name,
+                len(raw_bson),
+                table_schema,
+                column_renaming,
+            )
+            .result()
+        )
+    finally:
+        block.close()
+        block.unlink()
+
+    if not schema_utils.merge_schema_columns(table_name, new_columns, new_column_renaming):
+        logger.info(
+            f"schema of {table_name} changed while a worker process transformed a batch, "
+            f"transforming it again"
+        )
+        return __documents_to_parquet(table_name, bson.decode_all(raw_bson))
+    for failure in failures:
+        conversion_log.record_failure(*failure)
+    return parquet_bytes, row_count
+
+
+def _init_worker():
+    # the parent persists the schema and uploads the conversion log
+    schemas.set_schema_persistence(False)
+    conversion_log.forward_failures()
+
+
+def _transform_in_worker(
+    table_name: str, block_name: str, size: int, table_schema: dict, column_renaming: dict
+):
+    block = shared_memory.SharedMemory(name=block_name)
+    view = block.buf[:size]
+    try:
+        documents = bson.decode_all(view)
+    finally:
+        view.release()
+        block.close()
+    # copies, the originals tell which columns this batch added
+    schemas.init_table_schema_to_mem(table_name, dict(table_schema))
+    schemas.init_column_renaming_to_mem(table_name, dict(column_renaming))
+    parquet_bytes, row_count = __documents_to_parquet(table_name, documents)
+    new_columns = {
+        column_name: column_schema
+        for column_name, column_schema in schemas.get_table_schema(table_name).items()
+        if column_name not in table_schema
+    }
+    new_column_renaming = {
+        original_column_name: new_column_name
+        for original_column_name, new_column_name in (
+            schemas.get_table_column_renaming(table_name) or {}
+        ).items()
+        if original_column_name not in column_renaming
+    }
+    return (
+        parquet_bytes,
+        row_count,
+        new_columns,
+        new_column_renaming,
+        conversion_log.take_forwarded_failures(),
+    )
+
+
+def __documents_to_parquet(table_name: str, documents: list[dict]) -> tuple[bytes, int]:
+    df = documents_to_dataframe(table_name, documents)
+    del documents
+    schema_utils.process_dataframe(table_name, df)
+    schema_utils.finalize_dataframe_for_parquet(table_name, df)
+    buffer = io.BytesIO()
+    write_parquet(df, buffer)
+    return buffer.getvalue(), len(df)
+
+
+def __get_executor() -> ProcessPoolExecutor:
+    global __executor
+    with __executor_lock:
+        if __executor is None:
+            process_count = get_transform_process_count()
+            logger.info(f"starting {process_count} transform worker processes")
+            # spawned, not forked: the parent runs listener and uploader threads
+            __executor = ProcessPoolExecutor(
+                max_workers=process_count,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return __executor
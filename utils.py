@@ -1,10 +1,35 @@
 import os
+import logging
 from constants import DATA_FILES_PATH, FILE_NAME_LENGTH
 
+logger = logging.getLogger(__name__)
+
 
 def to_string(obj) -> str:
     return str(obj)
 
+def get_positive_int_env(name: str, default: int) -> int:
+    """Integer environment variable >= 1, or default when unset or invalid."""
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return max(1, int(value))
+    except ValueError:
+        logger.warning(f"Invalid {name}={value!r}; using {default}")
+        return default
+
+def get_non_negative_int_env(name: str, default: int) -> int:
+    """Integer environment variable >= 0, or default when unset or invalid."""
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return max(0, int(value))
+    except ValueError:
+        logger.warning(f"Invalid {name}={value!r}; using {default}")
+        return default
+
 def get_table_dir(table_name: str) -> str:
     current_dir = os.path.dirname(os.path.abspath(__file__))
     table_dir = os.path.join(current_dir, DATA_FILES_PATH, table_name + os.sep)